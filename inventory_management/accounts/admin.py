@@ -1,3 +1,49 @@
 from django.contrib import admin
+from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.contrib.auth.forms import AdminUserCreationForm
 
-# Register your models here.
+from .models import TenantShard, User
+
+
+class UserCreationForm(AdminUserCreationForm):
+    """
+    Admin add form that also asks for the (required, unique) email.
+    """
+    class Meta(AdminUserCreationForm.Meta):
+        model = User
+        fields = ('username', 'email')
+
+
+@admin.register(User)
+class UserAdmin(BaseUserAdmin):
+    """
+    Admin for the custom User model.
+
+    Searched by the raw id lookups of the inventory admin.
+    """
+    add_form = UserCreationForm
+    add_fieldsets = (
+        (None, {
+            'classes': ('wide',),
+            'fields': ('username', 'email', 'usable_password', 'password1', 'password2'),
+        }),
+    )
+    list_display = ('username', 'email', 'is_active', 'is_staff', 'date_joined')
+    ordering = ('-id',)
+
+
+@admin.register(TenantShard)
+class TenantShardAdmin(admin.ModelAdmin):
+    """
+    Read-only view of the shard map; tenants are moved with `manage.py move_tenant`.
+    """
+    list_display = ('user', 'alias', 'is_moving', 'updated_at')
+    list_select_related = ('user',)
+    list_filter = ('alias', 'is_moving')
+    search_fields = ('user__username',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
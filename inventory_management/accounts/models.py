@@ -51,7 +51,7 @@ class UserManager(BaseUserManager):
         user = self.create_user(username, email, password=password)
         
         #Add admin priviledges
-        user.is_admin = True
+        user.is_superuser = True
         user.is_staff = True
         user.save(using=self._db)
         return user
@@ -86,3 +86,27 @@ class User(AbstractUser):
         """
         return self.username
     
+
+
+class TenantShard(models.Model):
+    """
+    Shard map: the database alias a user's (tenant's) inventory lives on.
+
+    Users without an entry live on 'default'. Rows are written by tenant
+    placement and by `manage.py move_tenant`, which sets is_moving while it
+    copies the tenant, so the tenant's writes are refused until the move
+    completes.
+
+    Attributes:
+        user (User): the tenant
+        alias (str): database alias from settings.SHARD_DATABASES
+        is_moving (bool): a move to another shard is in progress
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True,
+                                related_name='shard')
+    alias = models.CharField(max_length=100)
+    is_moving = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user_id} -> {self.alias}"
@@ -1,3 +1,238 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
 
-# Register your models here.
+from inventory_management.sharding import current_shard
+
+from .models import (
+    AnalyticsRun, Category, InventoryAlert, InventoryChange, InventoryChangeDaily, InventoryItem,
+    ItemAnalytics, OutboxCursor, OutboxEvent, StockCount, StockCountLine, StockLot, StockReservation,
+    Store, StoreInventory, StoreInventoryChange, Supplier, SyncChange,
+)
+from .outbox import publish
+from .pagination import EstimatedCountPaginator
+from .sync import record_changes
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Base admin for tables that grow to millions of rows.
+
+    - Counts pages with EstimatedCountPaginator and never runs the unfiltered
+      "N total" COUNT(*)
+    - Orders by primary key, so a page is an index range scan
+    - Renders foreign keys as raw id inputs instead of <select>s of every row
+
+    Subclasses set list_select_related for every FK their list_display or
+    __str__ dereferences, and only list_filter on indexed columns or small
+    tables.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ('-id',)
+    list_per_page = 50
+
+
+@admin.register(Supplier)
+class SupplierAdmin(admin.ModelAdmin):
+    list_display = ('name', 'contact_person', 'email', 'phone', 'is_active', 'created_by')
+    list_select_related = ('created_by',)
+    list_filter = ('is_active',)
+    search_fields = ('name', 'contact_person', 'email')
+    raw_id_fields = ('created_by',)
+
+
+@admin.register(Category)
+class CategoryAdmin(admin.ModelAdmin):
+    list_display = ('name', 'path', 'parent', 'item_count', 'created_at')
+    list_select_related = ('parent',)
+    search_fields = ('name',)
+    #path order lists every category right after its ancestors
+    ordering = ('path',)
+    autocomplete_fields = ('parent',)
+    readonly_fields = ('path', 'item_count')
+
+
+@admin.register(Store)
+class StoreAdmin(admin.ModelAdmin):
+    list_display = ('name', 'email', 'contact_number', 'is_active', 'created_by', 'created_at')
+    list_select_related = ('created_by',)
+    list_filter = ('is_active',)
+    search_fields = ('name', 'email')
+    raw_id_fields = ('created_by',)
+
+
+@admin.register(InventoryItem)
+class InventoryItemAdmin(LargeTableAdmin):
+    list_display = ('id', 'name', 'quantity', 'price', 'category', 'supplier', 'created_by', 'last_updated')
+    list_select_related = ('category', 'supplier', 'created_by')
+    search_fields = ('name',)
+    autocomplete_fields = ('category', 'supplier')
+    raw_id_fields = ('created_by',)
+
+
+@admin.register(InventoryChange)
+class InventoryChangeAdmin(LargeTableAdmin):
+    list_display = ('id', 'item', 'change_type', 'quantity_change', 'new_quantity', 'changed_by', 'timestamp')
+    list_select_related = ('item', 'changed_by')
+    raw_id_fields = ('item', 'changed_by')
+
+
+@admin.register(InventoryChangeDaily)
+class InventoryChangeDailyAdmin(LargeTableAdmin):
+    list_display = ('item', 'day', 'change_count', 'quantity_added', 'quantity_removed', 'closing_quantity')
+    list_select_related = ('item',)
+    raw_id_fields = ('item',)
+
+
+class StoreInventoryActionForm(ActionForm):
+    """
+    Changelist action bar with the values applied by "Set thresholds".
+
+    Blank fields are left unchanged.
+    """
+    low_stock_threshold = forms.IntegerField(required=False, min_value=0)
+    reorder_point = forms.IntegerField(required=False, min_value=0)
+    reorder_quantity = forms.IntegerField(required=False, min_value=0)
+
+
+@admin.register(StoreInventory)
+class StoreInventoryAdmin(LargeTableAdmin):
+    list_display = ('store', 'item', 'quantity', 'reserved_quantity', 'low_stock_threshold', 'reorder_point',
+                    'reorder_quantity', 'urgency')
+    list_select_related = ('store', 'item')
+    autocomplete_fields = ('store',)
+    raw_id_fields = ('item',)
+    #Stock moves through adjust_stock, counts and reservations, which write the ledger and deplete lots
+    readonly_fields = ('quantity',)
+    action_form = StoreInventoryActionForm
+    actions = ['set_thresholds']
+
+    @admin.action(description="Set thresholds on selected store inventories", permissions=['change'])
+    def set_thresholds(self, request, queryset):
+        """
+        Applies the action bar's threshold values with a single UPDATE.
+        """
+        form = self.action_form(request.POST)
+        form.fields['action'].choices = self.get_action_choices(request)
+        fields = ('low_stock_threshold', 'reorder_point', 'reorder_quantity')
+        values = {}
+        if form.is_valid():
+            values = {field: form.cleaned_data[field] for field in fields if form.cleaned_data[field] is not None}
+        if not values:
+            self.message_user(request, "Enter at least one non-negative threshold.", messages.ERROR)
+            return
+        with transaction.atomic(using=current_shard()):
+            updated = queryset.update(**values, version=F('version') + 1)
+            queryset.update(urgency=StoreInventory.urgency_expression())
+            #Queryset updates send no signals, so feed the delta-sync log and the outbox directly
+            record_changes(StoreInventory, queryset.values_list('id', 'owner_id'))
+            publish(StoreInventory, queryset.select_related(None).iterator(chunk_size=2000))
+        self.message_user(request, f"Updated thresholds on {updated} store inventories.", messages.SUCCESS)
+
+
+@admin.register(StoreInventoryChange)
+class StoreInventoryChangeAdmin(LargeTableAdmin):
+    list_display = ('id', 'store', 'item', 'change_type', 'quantity_change', 'new_quantity', 'changed_by',
+                    'timestamp')
+    list_select_related = ('store', 'item', 'changed_by')
+    raw_id_fields = ('store', 'item', 'changed_by')
+
+
+@admin.register(InventoryAlert)
+class InventoryAlertAdmin(LargeTableAdmin):
+    list_display = ('id', 'alert_type', 'store', 'item', 'is_resolved', 'created_at', 'resolved_at')
+    list_select_related = ('store', 'item')
+    #Open alerts are served by the partial unique_open_alert index
+    list_filter = ('is_resolved', 'alert_type')
+    autocomplete_fields = ('store',)
+    raw_id_fields = ('item',)
+    actions = ['resolve_alerts']
+    resolve_batch_size = 2000
+
+    @admin.action(description="Resolve selected alerts", permissions=['change'])
+    def resolve_alerts(self, request, queryset):
+        """
+        Resolves every open selected alert, one bounded batch of ids at a time.
+        """
+        resolved = 0
+        while True:
+            with transaction.atomic(using=current_shard()):
+                batch = list(queryset.filter(is_resolved=False).order_by('pk')
+                             .values_list('pk', flat=True)[:self.resolve_batch_size])
+                if not batch:
+                    break
+                rows = InventoryAlert.objects.filter(pk__in=batch)
+                resolved += rows.filter(is_resolved=False).update(is_resolved=True, resolved_at=timezone.now())
+                record_changes(InventoryAlert, rows.values_list('id', 'owner_id'))
+                publish(InventoryAlert, rows.iterator(chunk_size=2000))
+        self.message_user(request, f"Resolved {resolved} alerts.", messages.SUCCESS)
+
+
+@admin.register(StockLot)
+class StockLotAdmin(LargeTableAdmin):
+    list_display = ('lot_code', 'store', 'item', 'quantity', 'expiry_date', 'received_at')
+    list_select_related = ('store', 'item')
+    search_fields = ('=lot_code',)
+    autocomplete_fields = ('store',)
+    raw_id_fields = ('item',)
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(LargeTableAdmin):
+    list_display = ('id', 'store', 'item', 'quantity', 'status', 'reference', 'expires_at', 'created_by')
+    list_select_related = ('store', 'item', 'created_by')
+    list_filter = ('status',)
+    autocomplete_fields = ('store',)
+    raw_id_fields = ('item', 'created_by')
+
+
+class StockCountLineInline(admin.TabularInline):
+    model = StockCountLine
+    raw_id_fields = ('item',)
+    extra = 0
+
+
+@admin.register(StockCount)
+class StockCountAdmin(admin.ModelAdmin):
+    list_display = ('id', 'store', 'status', 'created_by', 'created_at', 'approved_by', 'approved_at')
+    list_select_related = ('store', 'created_by', 'approved_by')
+    list_filter = ('status',)
+    ordering = ('-id',)
+    autocomplete_fields = ('store',)
+    raw_id_fields = ('created_by', 'approved_by')
+    inlines = [StockCountLineInline]
+
+
+@admin.register(SyncChange)
+class SyncChangeAdmin(LargeTableAdmin):
+    list_display = ('seq', 'model', 'object_id', 'owner', 'is_deleted', 'changed_at')
+    list_select_related = ('owner',)
+    raw_id_fields = ('owner',)
+
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(LargeTableAdmin):
+    list_display = ('id', 'topic', 'object_id', 'created_at')
+
+
+@admin.register(OutboxCursor)
+class OutboxCursorAdmin(admin.ModelAdmin):
+    list_display = ('destination', 'last_event_id', 'lease_owner', 'leased_until', 'attempts', 'next_attempt_at')
+
+
+@admin.register(ItemAnalytics)
+class ItemAnalyticsAdmin(LargeTableAdmin):
+    list_display = ('store', 'item', 'units_sold', 'velocity', 'days_of_cover', 'abc_class', 'is_dead_stock',
+                    'computed_at')
+    list_select_related = ('store', 'item')
+    raw_id_fields = ('store', 'item')
+
+
+@admin.register(AnalyticsRun)
+class AnalyticsRunAdmin(admin.ModelAdmin):
+    list_display = ('id', 'refreshed_at', 'stores_refreshed', 'full', 'last_change_id')
+    ordering = ('-id',)
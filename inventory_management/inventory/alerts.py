@@ -52,14 +52,22 @@ class AlertManager:
                 }
             )        
 
+#Fields whose change can raise a low stock or reorder alert
+ALERT_FIELDS = {'quantity', 'low_stock_threshold', 'reorder_point', 'reorder_quantity'}
+
+
 @receiver(post_save, sender=StoreInventory)
-def handle_inventory_changes(sender, instance):
+def handle_inventory_changes(sender, instance, raw=False, update_fields=None, **kwargs):
     """
     SIgnal handler that triggers alert checks whenever inventory is updated.
 
+    Saves limited to other fields (update_fields) skip the checks.
+
     Args:
         sender: The model class that sent the signal
         instance: The StoreInventory instance that was saved
     """
+    if raw or (update_fields is not None and not ALERT_FIELDS.intersection(update_fields)):
+        return
     AlertManager.check_low_stock(instance)
-    AlertManager.check_reorder(instance)
\ No newline at end of file
+    AlertManager.check_reorder(instance)
@@ -0,0 +1,237 @@
+"""
+Demand analytics per store item, computed with NumPy.
+
+Sales are the REMOVE movements of the StoreInventoryChange ledger (the
+per-store record of stock leaving a store). For every store item:
+
+    units_sold       units removed in the trailing WINDOW_DAYS
+    velocity         units_sold / WINDOW_DAYS (units per day)
+    days_of_cover    StoreInventory.quantity / velocity (None without sales)
+    turnover         annualised units sold / quantity on hand (None when out of stock)
+    is_dead_stock    stock on hand and no removal for DEAD_STOCK_DAYS
+    abc_class        A/B/C by cumulative share of the store's consumption
+                     value (units_sold x price), split at ABC_THRESHOLDS
+
+Results are cached in ItemAnalytics. A refresh recomputes whole stores (ABC
+classes depend on every item of a store), and only the stores whose inputs
+may have changed since the last AnalyticsRun watermark. Ledger ids are taken
+before commit, so the watermark only moves past movements older than
+ANALYTICS['SETTLE_SECONDS']; younger ones are looked at again next run.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from inventory_management.sharding import current_shard
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is only needed for analytics
+    np = None
+
+from .models import AnalyticsRun, InventoryItem, ItemAnalytics, StoreInventory, StoreInventoryChange
+from .utils import chunked
+
+#Ledger rows streamed per chunk
+CHUNK_SIZE = 50000
+
+
+def analytics_settings():
+    return {'WINDOW_DAYS': 90, 'DEAD_STOCK_DAYS': 90, 'ABC_THRESHOLDS': (0.8, 0.95), 'SETTLE_SECONDS': 30,
+            **getattr(settings, 'ANALYTICS', {})}
+
+
+def _keys(store_ids, item_ids):
+    #(store, item) pairs as one structured array: sorting, searchsorted and == compare them field by
+    #field, so shard ids (SHARD_ID_STRIDE apart) never collide the way bit-packed keys would
+    store_ids = np.asarray(store_ids, dtype=np.int64)
+    keys = np.empty(len(store_ids), dtype=[('store', np.int64), ('item', np.int64)])
+    keys['store'] = store_ids
+    keys['item'] = np.asarray(item_ids, dtype=np.int64)
+    return keys
+
+
+def abc_classes(store_ids, values, thresholds):
+    """
+    Classifies items by cumulative value share within their store.
+
+    Items are ranked by value (highest first) inside each store; an item is
+    A while the share of value ranked above it is below thresholds[0], B
+    below thresholds[1], and C otherwise. Items without value are C.
+
+    Args:
+        store_ids: int64 array, one entry per item
+        values: float array of consumption values
+        thresholds: (A, B) cumulative share cut-offs
+
+    Returns:
+        array of 'A'/'B'/'C'
+    """
+    order = np.lexsort((-values, store_ids))
+    stores, ranked = store_ids[order], values[order]
+    boundary = np.r_[True, stores[1:] != stores[:-1]]
+    starts = np.flatnonzero(boundary)
+    group = np.cumsum(boundary) - 1
+    totals = np.add.reduceat(ranked, starts)
+    #Value ranked above each item within its store
+    running = np.cumsum(ranked)
+    before = running - ranked - np.r_[0.0, running[starts[1:] - 1]][group]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        share_before = np.where(totals[group] > 0, before / totals[group], 1.0)
+    ranked_classes = np.where(ranked <= 0, 'C',
+                              np.where(share_before < thresholds[0], 'A',
+                                       np.where(share_before < thresholds[1], 'B', 'C')))
+    classes = np.empty(len(values), dtype='<U1')
+    classes[order] = ranked_classes
+    return classes
+
+
+class ItemAnalyticsManager:
+    """
+    Computes and caches ItemAnalytics rows.
+    """
+    @staticmethod
+    def compute(store_ids, now=None):
+        """
+        Computes analytics for every item stocked by the given stores.
+
+        Args:
+            store_ids: list of Store ids
+            now: optional aware datetime the window ends at
+
+        Returns:
+            list: unsaved ItemAnalytics instances
+        """
+        if np is None:
+            raise ImproperlyConfigured("Item analytics require numpy to be installed.")
+        config = analytics_settings()
+        now = now or timezone.now()
+        window = config['WINDOW_DAYS']
+        window_start = now - timedelta(days=window)
+        dead_before = now - timedelta(days=config['DEAD_STOCK_DAYS'])
+
+        stock = list(StoreInventory.objects.filter(store_id__in=store_ids).order_by()
+                     .values_list('store_id', 'item_id', 'quantity', 'item__price'))
+        if not stock:
+            return []
+        stores = np.array([row[0] for row in stock], dtype=np.int64)
+        items = np.array([row[1] for row in stock], dtype=np.int64)
+        quantity = np.array([row[2] for row in stock], dtype=np.int64)
+        price = np.array([float(row[3]) for row in stock])
+        keys = _keys(stores, items)
+        order = np.argsort(keys)
+        sorted_keys = keys[order]
+
+        def positions(store_column, item_column):
+            #Maps ledger rows to stock rows; rows for items no longer stocked are dropped
+            found = _keys(store_column, item_column)
+            at = np.minimum(np.searchsorted(sorted_keys, found), len(sorted_keys) - 1)
+            matched = sorted_keys[at] == found
+            return order[at[matched]], matched
+
+        #Stream the window's sales in chunks and accumulate units per stock row
+        units = np.zeros(len(stock), dtype=np.int64)
+        sales = (StoreInventoryChange.objects
+                 .filter(store_id__in=store_ids, change_type='REMOVE', timestamp__gte=window_start)
+                 .values_list('store_id', 'item_id', 'quantity_change').iterator(chunk_size=CHUNK_SIZE))
+        for chunk in chunked(sales, CHUNK_SIZE):
+            data = np.array(chunk, dtype=np.int64)
+            rows, matched = positions(data[:, 0], data[:, 1])
+            np.add.at(units, rows, -data[matched, 2])
+
+        last_removed = np.full(len(stock), None, dtype=object)
+        latest = (StoreInventoryChange.objects.filter(store_id__in=store_ids, change_type='REMOVE')
+                  .values('store_id', 'item_id').annotate(last=Max('timestamp')).order_by()
+                  .values_list('store_id', 'item_id', 'last'))
+        for chunk in chunked(latest.iterator(chunk_size=CHUNK_SIZE), CHUNK_SIZE):
+            rows, matched = positions([row[0] for row in chunk], [row[1] for row in chunk])
+            last_removed[rows] = np.array([row[2] for row in chunk], dtype=object)[matched]
+
+        velocity = units / window
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cover = np.where(velocity > 0, quantity / velocity, np.nan)
+            turnover = np.where(quantity > 0, (units * 365.0 / window) / quantity, np.nan)
+        value = units * price
+        classes = abc_classes(stores, value, config['ABC_THRESHOLDS'])
+        stale = np.array([last is None or last < dead_before for last in last_removed])
+        dead = (quantity > 0) & stale
+
+        return [
+            ItemAnalytics(
+                store_id=int(stores[row]), item_id=int(items[row]), quantity=int(quantity[row]),
+                units_sold=int(units[row]), velocity=float(velocity[row]),
+                days_of_cover=None if np.isnan(cover[row]) else float(cover[row]),
+                turnover=None if np.isnan(turnover[row]) else float(turnover[row]),
+                consumption_value=float(value[row]), abc_class=str(classes[row]),
+                is_dead_stock=bool(dead[row]), last_removed_at=last_removed[row], computed_at=now,
+            )
+            for row in range(len(stock))
+        ]
+
+    @staticmethod
+    def dirty_stores(last_run, now):
+        """
+        Returns the ids of stores whose analytics may have changed since `last_run`.
+
+        That is stores with ledger movements after the watermark, stores
+        stocking items saved since the last run (a price change moves their
+        consumption values and ABC classes; last_updated is set before
+        commit, so it is read back to SETTLE_SECONDS before the run), stores
+        with sales that slid out of the window, and stores with rows that
+        crossed the dead-stock age since the last run.
+        """
+        config = analytics_settings()
+        window_start = now - timedelta(days=config['WINDOW_DAYS'])
+        dead_age = timedelta(days=config['DEAD_STOCK_DAYS'])
+        settle = timedelta(seconds=config['SETTLE_SECONDS'])
+        stores = set(StoreInventoryChange.objects.filter(id__gt=last_run.last_change_id)
+                     .values_list('store_id', flat=True).distinct())
+        stores.update(StoreInventory.objects.filter(
+            item_id__in=InventoryItem.objects.filter(last_updated__gte=last_run.refreshed_at - settle).values('id'),
+        ).values_list('store_id', flat=True).distinct())
+        stores.update(StoreInventoryChange.objects.filter(
+            change_type='REMOVE', timestamp__gte=last_run.window_start, timestamp__lt=window_start,
+        ).values_list('store_id', flat=True).distinct())
+        stores.update(ItemAnalytics.objects.filter(
+            is_dead_stock=False, quantity__gt=0,
+            last_removed_at__gte=last_run.refreshed_at - dead_age, last_removed_at__lt=now - dead_age,
+        ).values_list('store_id', flat=True).distinct())
+        return stores
+
+    @staticmethod
+    def refresh(full=False, store_batch=50):
+        """
+        Recomputes the cached analytics of every store that may have changed
+        (or of all stores with `full`) and records a new watermark.
+
+        Each batch of stores is replaced in its own transaction. The recorded
+        ledger watermark is the newest movement older than SETTLE_SECONDS: a
+        transaction still holding a lower id could commit after this run.
+
+        Returns:
+            AnalyticsRun: the recorded run
+        """
+        now = timezone.now()
+        settled_before = now - timedelta(seconds=analytics_settings()['SETTLE_SECONDS'])
+        high = StoreInventoryChange.objects.filter(timestamp__lte=settled_before).aggregate(high=Max('id'))['high'] or 0
+        last_run = AnalyticsRun.objects.order_by('-id').first()
+        if full or last_run is None:
+            stores = set(StoreInventory.objects.values_list('store_id', flat=True).distinct())
+            stores.update(ItemAnalytics.objects.values_list('store_id', flat=True).distinct())
+        else:
+            stores = ItemAnalyticsManager.dirty_stores(last_run, now)
+
+        for batch in chunked(sorted(stores), store_batch):
+            rows = ItemAnalyticsManager.compute(batch, now)
+            with transaction.atomic(using=current_shard()):
+                ItemAnalytics.objects.filter(store_id__in=batch).delete()
+                ItemAnalytics.objects.bulk_create(rows, batch_size=2000)
+
+        return AnalyticsRun.objects.create(
+            last_change_id=high, window_start=now - timedelta(days=analytics_settings()['WINDOW_DAYS']),
+            refreshed_at=now, stores_refreshed=len(stores), full=full or last_run is None,
+        )
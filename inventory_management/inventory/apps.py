@@ -4,3 +4,21 @@ from django.apps import AppConfig
 class InventoryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'inventory'
+
+    def ready(self):
+        #Connect the per-connection database tuning hooks
+        from inventory_management import db  # noqa: F401
+        #Connect the delta-sync change recording hooks
+        from . import sync  # noqa: F401
+        #Keep the in-process availability index current
+        from . import availability  # noqa: F401
+        #Drop cached store location trees when stores change
+        from . import spatial  # noqa: F401
+        #Keep category item counters current when items are deleted
+        from . import categories  # noqa: F401
+        #Write outbox events for single-object stock writes
+        from . import outbox  # noqa: F401
+        #Raise low stock and reorder alerts when store inventory is saved
+        from . import alerts  # noqa: F401
+        #Place new users on a shard and mirror categories onto every shard
+        from . import tenants  # noqa: F401
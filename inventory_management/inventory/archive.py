@@ -0,0 +1,234 @@
+"""
+Archive of InventoryChange rows older than the retention window.
+
+Each archived batch is written as compressed NumPy .npz files (one array
+per column, so readers only decompress the columns they touch), one per
+calendar month of the change timestamp and owner:
+
+    <DIR>/inventory_changes/<YYYY-MM>/<owner id>/part-<first id>-<last id>.npz
+
+so reading one owner's history opens only that owner's parts. Parts
+written before the per-owner directories sit directly under the month and
+are still read, filtered by owner.
+
+The rows are rolled up into InventoryChangeDaily and then deleted in the
+same bounded transaction. A batch that fails after its file is written
+leaves the rows in place, so the next run writes them again; readers
+de-duplicate on id.
+"""
+import glob
+import os
+from collections import defaultdict
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from inventory_management.sharding import current_shard
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is only needed when archiving
+    np = None
+
+from .models import InventoryChange, InventoryChangeDaily
+
+#Archived columns: (field, NumPy dtype); text columns are sized per file
+COLUMNS = (
+    ('id', 'int64'),
+    ('item_id', 'int64'),
+    ('owner_id', 'int64'),
+    ('change_type', 'str'),
+    ('quantity_change', 'int64'),
+    ('previous_quantity', 'int64'),
+    ('new_quantity', 'int64'),
+    ('changed_by_id', 'int64'),
+    ('timestamp', 'int64'),
+    ('notes', 'str'),
+)
+#Stored in place of a NULL changed_by_id
+NO_USER = -1
+
+
+def archive_settings():
+    return {'DIR': os.path.join(settings.BASE_DIR, 'archive'), 'RETENTION_DAYS': 365, 'BATCH_SIZE': 10000,
+            **getattr(settings, 'CHANGE_ARCHIVE', {})}
+
+
+def retention_cutoff():
+    """
+    Returns the (midnight-aligned) time before which changes are archived,
+    so a day is always archived and rolled up as a whole.
+    """
+    day = timezone.localdate() - timedelta(days=archive_settings()['RETENTION_DAYS'])
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _to_micros(value):
+    return int(value.timestamp() * 1_000_000)
+
+
+def _from_micros(value):
+    return datetime.fromtimestamp(value / 1_000_000, tz=dt_timezone.utc)
+
+
+class ChangeArchive:
+    """
+    Writes and reads the month-partitioned InventoryChange archive.
+    """
+    def __init__(self, root=None):
+        self.root = os.path.join(str(root or archive_settings()['DIR']), 'inventory_changes')
+
+    def _write_part(self, month, owner_id, rows):
+        directory = os.path.join(self.root, month, str(owner_id))
+        os.makedirs(directory, exist_ok=True)
+        columns = {}
+        for position, (name, dtype) in enumerate(COLUMNS):
+            values = [row[position] for row in rows]
+            columns[name] = np.array(values, dtype=str if dtype == 'str' else dtype)
+        path = os.path.join(directory, f"part-{rows[0][0]:012d}-{rows[-1][0]:012d}.npz")
+        #Write to a temporary name and rename, so readers never see a partial file
+        temporary = path + '.tmp'
+        with open(temporary, 'wb') as output:
+            np.savez_compressed(output, **columns)
+            output.flush()
+            os.fsync(output.fileno())
+        os.replace(temporary, path)
+        return path
+
+    def archive_batch(self, cutoff, batch_size):
+        """
+        Archives, rolls up and deletes the oldest `batch_size` changes before `cutoff`.
+
+        Returns:
+            int: number of changes archived (0 when nothing is left)
+        """
+        changes = list(
+            InventoryChange.objects.filter(timestamp__lt=cutoff).order_by('id')
+            .values_list('id', 'item_id', 'owner_id', 'change_type', 'quantity_change',
+                         'previous_quantity', 'new_quantity', 'changed_by_id', 'timestamp', 'notes')[:batch_size]
+        )
+        if not changes:
+            return 0
+
+        parts = defaultdict(list)
+        rollups = {}
+        for row in changes:
+            (change_id, item_id, owner_id, change_type, quantity_change,
+             previous_quantity, new_quantity, changed_by_id, stamp, notes) = row
+            parts[f"{stamp:%Y-%m}", owner_id].append((
+                change_id, item_id, owner_id, change_type, quantity_change, previous_quantity,
+                new_quantity, NO_USER if changed_by_id is None else changed_by_id, _to_micros(stamp), notes,
+            ))
+            day = timezone.localtime(stamp).date()
+            rollup = rollups.setdefault((item_id, day), InventoryChangeDaily(item_id=item_id, day=day))
+            rollup.change_count += 1
+            if quantity_change > 0:
+                rollup.quantity_added += quantity_change
+            else:
+                rollup.quantity_removed -= quantity_change
+            rollup.net_change += quantity_change
+            #Rows are read in id order, so the last one seen closes the day
+            rollup.closing_quantity = new_quantity
+
+        for (month, owner_id), rows in parts.items():
+            self._write_part(month, owner_id, rows)
+
+        with transaction.atomic(using=current_shard()):
+            #Merge with rollups of the same days written by earlier batches
+            for existing in InventoryChangeDaily.objects.select_for_update().filter(
+                item_id__in={item_id for item_id, _ in rollups}, day__in={day for _, day in rollups}
+            ):
+                rollup = rollups.get((existing.item_id, existing.day))
+                if rollup is not None:
+                    rollup.change_count += existing.change_count
+                    rollup.quantity_added += existing.quantity_added
+                    rollup.quantity_removed += existing.quantity_removed
+                    rollup.net_change += existing.net_change
+            InventoryChangeDaily.objects.bulk_create(
+                rollups.values(), batch_size=2000, update_conflicts=True, unique_fields=['item', 'day'],
+                update_fields=['change_count', 'quantity_added', 'quantity_removed', 'net_change', 'closing_quantity'],
+            )
+            #Archiving is not a stock change: delete directly, without per-row signals or outbox events
+            connection = connections[current_shard()]
+            with connection.cursor() as cursor:
+                quote = connection.ops.quote_name
+                cursor.execute(
+                    f"DELETE FROM {quote(InventoryChange._meta.db_table)} "
+                    f"WHERE {quote('id')} >= %s AND {quote('id')} <= %s AND {quote('timestamp')} < %s",
+                    [changes[0][0], changes[-1][0], connection.ops.adapt_datetimefield_value(cutoff)],
+                )
+        return len(changes)
+
+    def archive(self, cutoff=None, batch_size=None):
+        """
+        Archives every change before `cutoff` (default: the retention cutoff) in bounded batches.
+
+        Returns:
+            int: number of changes archived
+        """
+        cutoff = cutoff or retention_cutoff()
+        batch_size = batch_size or archive_settings()['BATCH_SIZE']
+        archived = 0
+        while True:
+            moved = self.archive_batch(cutoff, batch_size)
+            if not moved:
+                return archived
+            archived += moved
+
+    def read(self, owner_id, start=None, end=None, item_id=None, change_type=None):
+        """
+        Reads archived changes of one owner's items, oldest first.
+
+        Only the owner's parts of the months overlapping [start, end] are opened.
+
+        Args:
+            owner_id: id of the User whose items' changes are returned
+            start: optional aware datetime, inclusive
+            end: optional aware datetime, exclusive
+            item_id: optional InventoryItem id
+            change_type: optional ADD/REMOVE/ADJUST
+
+        Returns:
+            list: dicts with the InventoryChange field names
+        """
+        if not os.path.isdir(self.root):
+            return []
+        start_month = f"{start:%Y-%m}" if start else ''
+        end_month = f"{end:%Y-%m}" if end else '9999-99'
+        months = [month for month in sorted(os.listdir(self.root)) if start_month <= month <= end_month]
+        paths = [path for month in months
+                 for directory in (os.path.join(self.root, month, str(int(owner_id))), os.path.join(self.root, month))
+                 for path in sorted(glob.glob(os.path.join(directory, 'part-*.npz')))]
+
+        rows = {}
+        for path in paths:
+            with np.load(path) as data:
+                #Only month-level parts (the earlier layout) hold other owners' rows
+                mask = data['owner_id'] == owner_id
+                if start is not None:
+                    mask &= data['timestamp'] >= _to_micros(start)
+                if end is not None:
+                    mask &= data['timestamp'] < _to_micros(end)
+                if item_id is not None:
+                    mask &= data['item_id'] == int(item_id)
+                if change_type is not None:
+                    mask &= data['change_type'] == change_type
+                if not mask.any():
+                    continue
+                selected = {name: data[name][mask].tolist() for name, _ in COLUMNS}
+            for position, change_id in enumerate(selected['id']):
+                changed_by = selected['changed_by_id'][position]
+                rows[change_id] = {
+                    'id': change_id,
+                    'item': selected['item_id'][position],
+                    'change_type': selected['change_type'][position],
+                    'quantity_change': selected['quantity_change'][position],
+                    'previous_quantity': selected['previous_quantity'][position],
+                    'new_quantity': selected['new_quantity'][position],
+                    'changed_by': None if changed_by == NO_USER else changed_by,
+                    'timestamp': _from_micros(selected['timestamp'][position]),
+                    'notes': selected['notes'][position],
+                }
+        return [rows[change_id] for change_id in sorted(rows)]
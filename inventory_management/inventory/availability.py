@@ -0,0 +1,329 @@
+"""
+In-process availability index for instant stock checks.
+
+StoreInventory quantities are held per owner: each owner has a dense NumPy
+int32 block with one row per store of theirs and one column per item
+stocked at those stores, plus dicts mapping store and item ids to their
+offsets. Lookups are array reads and never touch the database.
+
+Memory: 4 bytes per cell of every owner's block, i.e. the sum over owners
+of (their stores x the distinct items stocked at them), plus roughly 100
+bytes per store or item id for the offset dicts. One owner with 100 stores
+x 10,000 items costs 4 MB (plus ~1 MB of id maps); 1,000 such owners cost
+4 GB per process. Blocks are dense, so an owner's sparse assortment still
+pays for every cell of their block, and ids are kept per owner (an item
+stocked by several owners is mapped in each of their blocks).
+
+The index is per process. StoreInventory and Store save/delete signals keep
+the local copy current; writes made by other processes or by bulk queries
+(which send no signals) are picked up by the periodic checksum resync.
+"""
+import logging
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import F, Sum
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from inventory_management.sharding import sharding_enabled
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is only needed when the index is enabled
+    np = None
+
+from .models import Store, StoreInventory
+from .utils import chunked
+
+logger = logging.getLogger(__name__)
+
+#Multiplier used when weighting quantities by store id in the checksum
+_STORE_WEIGHT = 1000003
+#Checksums are summed modulo this prime: every term (quantity x weight) fits in 64 bits
+_CHECKSUM_MODULUS = 2147483647
+
+
+class _OwnerBlock:
+    #One owner's stores x the items stocked at them
+    def __init__(self, store_capacity=0, item_capacity=0):
+        self.store_offsets = {}
+        self.item_offsets = {}
+        self.store_ids = np.zeros(store_capacity, dtype=np.int64)
+        self.item_ids = np.zeros(item_capacity, dtype=np.int64)
+        #Offsets of the owner's current stores; deleted stores keep a zeroed row until the next load
+        self.rows = np.empty(0, dtype=np.int64)
+        self.matrix = np.zeros((store_capacity, item_capacity), dtype=np.int32)
+
+    def grow(self, rows, columns):
+        #Doubles capacity along any exhausted axis so growth is amortised O(1)
+        old_rows, old_columns = self.matrix.shape
+        new_rows = max(old_rows * 2, 4) if rows > old_rows else old_rows
+        new_columns = max(old_columns * 2, 64) if columns > old_columns else old_columns
+        if (new_rows, new_columns) == (old_rows, old_columns):
+            return
+        matrix = np.zeros((new_rows, new_columns), dtype=np.int32)
+        matrix[:old_rows, :old_columns] = self.matrix
+        self.matrix = matrix
+        self.store_ids = np.resize(self.store_ids, new_rows)
+        self.item_ids = np.resize(self.item_ids, new_columns)
+
+    def store_offset(self, store_id):
+        row = self.store_offsets.get(store_id)
+        if row is None:
+            row = len(self.store_offsets)
+            self.grow(row + 1, self.matrix.shape[1])
+            self.store_offsets[store_id] = row
+            self.store_ids[row] = store_id
+            self.rows = np.append(self.rows, row)
+        return row
+
+    def item_offset(self, item_id):
+        column = self.item_offsets.get(item_id)
+        if column is None:
+            column = len(self.item_offsets)
+            self.grow(self.matrix.shape[0], column + 1)
+            self.item_offsets[item_id] = column
+            self.item_ids[column] = item_id
+        return column
+
+    def checksum(self):
+        stores = len(self.store_offsets)
+        items = len(self.item_offsets)
+        matrix = self.matrix[:stores, :items].astype(np.int64)
+        weights = (self.store_ids[:stores, None] * _STORE_WEIGHT + self.item_ids[None, :items]) % _CHECKSUM_MODULUS
+        return int(matrix.sum()), int(((matrix * weights) % _CHECKSUM_MODULUS).sum())
+
+
+class AvailabilityIndex:
+    """
+    Per-owner dense store x item quantity blocks with id -> offset maps.
+
+    All public methods are thread-safe.
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.loaded = False
+        self.owners = {}
+
+    @property
+    def nbytes(self):
+        """
+        Bytes held by the quantity blocks (the id maps come on top).
+        """
+        with self._lock:
+            return sum(block.matrix.nbytes for block in self.owners.values())
+
+    def load(self):
+        """
+        (Re)builds every owner's block from the database in three streaming queries.
+        """
+        stores = list(Store.objects.values_list('created_by_id', 'id').order_by('created_by_id', 'id'))
+        stocked = list(StoreInventory.objects.values_list('owner_id', 'item_id').distinct()
+                       .order_by('owner_id', 'item_id'))
+        with self._lock:
+            store_counts, item_counts = {}, {}
+            for owner_id, _ in stores:
+                store_counts[owner_id] = store_counts.get(owner_id, 0) + 1
+            for owner_id, _ in stocked:
+                item_counts[owner_id] = item_counts.get(owner_id, 0) + 1
+            self.owners = {owner_id: _OwnerBlock(store_counts.get(owner_id, 0), item_counts.get(owner_id, 0))
+                           for owner_id in store_counts.keys() | item_counts.keys()}
+            #Offsets are assigned in id order, so ids map to offsets by binary search
+            for owner_id, store_id in stores:
+                self.owners[owner_id].store_offset(store_id)
+            for owner_id, item_id in stocked:
+                self.owners[owner_id].item_offset(item_id)
+            rows = (StoreInventory.objects.values_list('owner_id', 'store_id', 'item_id', 'quantity')
+                    .iterator(chunk_size=50000))
+            for chunk in chunked(rows, 50000):
+                data = np.array(chunk, dtype=np.int64)
+                for owner_id in np.unique(data[:, 0]).tolist():
+                    block = self.owners[owner_id]
+                    part = data[data[:, 0] == owner_id]
+                    store_ids = block.store_ids[:len(block.store_offsets)]
+                    item_ids = block.item_ids[:len(block.item_offsets)]
+                    rows = np.minimum(np.searchsorted(store_ids, part[:, 1]), max(len(store_ids) - 1, 0))
+                    columns = np.searchsorted(item_ids, part[:, 2])
+                    #Rows whose owner copy disagrees with the store's creator (see check_owners) are left out
+                    matched = (store_ids[rows] == part[:, 1]) if len(store_ids) else np.zeros(len(part), dtype=bool)
+                    block.matrix[rows[matched], columns[matched]] = part[matched, 3]
+            self.loaded = True
+
+    def _block(self, owner_id):
+        block = self.owners.get(owner_id)
+        if block is None:
+            block = self.owners[owner_id] = _OwnerBlock()
+        return block
+
+    def add_store(self, store_id, owner_id):
+        """
+        Registers a store so its owner's "all stores" queries include it.
+        """
+        with self._lock:
+            self._block(owner_id).store_offset(store_id)
+
+    def set_quantity(self, store_id, owner_id, item_id, quantity):
+        """
+        Records the current quantity of an item at a store.
+        """
+        with self._lock:
+            block = self._block(owner_id)
+            row = block.store_offset(store_id)
+            column = block.item_offset(item_id)
+            block.matrix[row, column] = quantity
+
+    def remove_store(self, store_id, owner_id):
+        """
+        Zeroes a deleted store and stops reporting it to its owner.
+        """
+        with self._lock:
+            block = self.owners.get(owner_id)
+            row = block.store_offsets.get(store_id) if block is not None else None
+            if row is None:
+                return
+            block.matrix[row, :] = 0
+            block.rows = block.rows[block.rows != row]
+
+    def quantities(self, owner_id, item_ids, store_id=None):
+        """
+        Looks up quantities for a batch of items.
+
+        Args:
+            owner_id: id of the user asking; only their stores are visible
+            item_ids: list of InventoryItem ids
+            store_id: optional Store id; when omitted every store of the owner is reported
+
+        Returns:
+            dict: item id -> quantity at `store_id`, or item id -> {store id: quantity}
+            for all of the owner's stores
+        """
+        with self._lock:
+            block = self.owners.get(owner_id) or _OwnerBlock()
+            if store_id is not None:
+                row = block.store_offsets.get(store_id)
+                if row is None or row not in block.rows:
+                    return {item_id: 0 for item_id in item_ids}
+                return {
+                    item_id: int(block.matrix[row, block.item_offsets[item_id]])
+                    if item_id in block.item_offsets else 0
+                    for item_id in item_ids
+                }
+
+            store_ids = block.store_ids[block.rows].tolist()
+            result = {}
+            for item_id in item_ids:
+                column = block.item_offsets.get(item_id)
+                values = block.matrix[block.rows, column].tolist() if column is not None else [0] * len(block.rows)
+                result[item_id] = dict(zip(store_ids, values))
+            return result
+
+    def checksum(self):
+        """
+        Returns (total quantity, store/item weighted total modulo a prime)
+        for comparison with the database checksum.
+        """
+        with self._lock:
+            sums = [block.checksum() for block in self.owners.values()]
+        return sum(total for total, _ in sums), sum(weighted for _, weighted in sums) % _CHECKSUM_MODULUS
+
+
+def database_checksum():
+    """
+    Computes the same checksum as AvailabilityIndex.checksum in one aggregate query.
+    """
+    weight = (F('store_id') * _STORE_WEIGHT + F('item_id')) % _CHECKSUM_MODULUS
+    totals = StoreInventory.objects.aggregate(
+        total=Sum('quantity'),
+        weighted=Sum(F('quantity') * weight % _CHECKSUM_MODULUS),
+    )
+    return totals['total'] or 0, (totals['weighted'] or 0) % _CHECKSUM_MODULUS
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def index_settings():
+    return {'ENABLED': False, 'RESYNC_SECONDS': 60, **getattr(settings, 'AVAILABILITY_INDEX', {})}
+
+
+def get_index():
+    """
+    Returns the process-wide index, loading it and starting the resync
+    thread on first use. Returns None when the index is disabled.
+
+    The index holds one database's rows, so it is also off with tenant
+    shards; lookups then use the database path.
+    """
+    global _index
+    if not index_settings()['ENABLED'] or sharding_enabled():
+        return None
+    if np is None:
+        raise ImproperlyConfigured("AVAILABILITY_INDEX requires numpy to be installed.")
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = AvailabilityIndex()
+                index.load()
+                _index = index
+                _start_resync(index)
+    return _index
+
+
+def resync(index):
+    """
+    Reloads the index when its checksum no longer matches the database.
+
+    Returns:
+        bool: True if a reload was needed
+    """
+    if index.checksum() == database_checksum():
+        return False
+    logger.info("Availability index checksum mismatch, reloading")
+    index.load()
+    return True
+
+
+def _start_resync(index):
+    interval = index_settings()['RESYNC_SECONDS']
+    stop = threading.Event()
+
+    def run():
+        from django.db import connection
+        while not stop.wait(interval):
+            try:
+                resync(index)
+            except Exception:
+                logger.exception("Availability index resync failed")
+            finally:
+                connection.close()
+
+    threading.Thread(target=run, name='availability-resync', daemon=True).start()
+
+
+@receiver(post_save, sender=StoreInventory)
+def handle_store_inventory_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    if update_fields is not None and 'quantity' not in update_fields:
+        return
+    if _index is not None and not raw:
+        _index.set_quantity(instance.store_id, instance.owner_id, instance.item_id, instance.quantity)
+
+
+@receiver(post_delete, sender=StoreInventory)
+def handle_store_inventory_delete(sender, instance, **kwargs):
+    if _index is not None:
+        _index.set_quantity(instance.store_id, instance.owner_id, instance.item_id, 0)
+
+
+@receiver(post_save, sender=Store)
+def handle_store_save(sender, instance, raw=False, **kwargs):
+    if _index is not None and not raw:
+        _index.add_store(instance.pk, instance.created_by_id)
+
+
+@receiver(post_delete, sender=Store)
+def handle_store_delete(sender, instance, **kwargs):
+    if _index is not None:
+        _index.remove_store(instance.pk, instance.created_by_id)
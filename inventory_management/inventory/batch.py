@@ -0,0 +1,208 @@
+"""
+Several API calls in one round trip.
+
+POST api/batch/ takes a list of sub-requests
+
+    {"requests": [
+        {"method": "GET", "path": "/api/inventory/stores/"},
+        {"method": "GET", "path": "/api/inventory/alerts/?is_resolved=false"},
+        {"method": "PATCH", "path": "/api/inventory/store-inventory/7/",
+         "body": {"reorder_point": 5}, "headers": {"If-Match": "\\"3\\""}}
+    ]}
+
+and answers with one result per sub-request, in order:
+
+    {"status": 200, "headers": {"ETag": ...}, "body": {...}}
+
+The batch is authenticated once. Each sub-request is built as a WSGI
+request and passed straight to the API view its path resolves to, with the
+batch's user forced, so JWT decoding and the middleware stack run only for
+the batch itself.
+
+Consecutive GET sub-requests run concurrently on a thread pool of
+BATCH_API['WORKERS'] threads. Any other method runs on its own, in order,
+after everything before it has finished; reads after a successful write
+are served from the primary database, never the replica, so they see it.
+"""
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from django.urls import Resolver404, resolve
+
+from inventory_management.routers import PIN_COOKIE, read_from, replica_alias, wants_replica
+
+logger = logging.getLogger(__name__)
+
+#Sub-request methods run concurrently with their neighbours
+CONCURRENT_METHODS = ('GET', 'HEAD')
+
+#Response headers passed on in each result
+FORWARDED_HEADERS = ('ETag', 'Location', 'Retry-After')
+
+#Request META every sub-request inherits from the batch request
+INHERITED_META = (
+    'SERVER_NAME', 'SERVER_PORT', 'SERVER_PROTOCOL', 'SCRIPT_NAME', 'REMOTE_ADDR', 'HTTP_HOST',
+    'HTTP_USER_AGENT', 'HTTP_X_FORWARDED_FOR', 'HTTP_X_FORWARDED_PROTO', 'wsgi.url_scheme',
+)
+
+
+def batch_settings():
+    return {'MAX_REQUESTS': 20, 'WORKERS': 4, **getattr(settings, 'BATCH_API', {})}
+
+
+def build_request(parent, user, auth, method, path, body=None, headers=None):
+    """
+    Builds the HttpRequest of one sub-request.
+
+    Args:
+        parent: the batch's HttpRequest
+        user, auth: the batch's authenticated user and token
+        method: HTTP method
+        path: path with optional query string
+        body: JSON-serializable request body, or None
+        headers: optional dict of extra request headers (e.g. If-Match)
+
+    Returns:
+        WSGIRequest
+    """
+    url = urlsplit(path)
+    payload = b'' if body is None else json.dumps(body, cls=DjangoJSONEncoder).encode()
+    environ = {key: parent.META[key] for key in INHERITED_META if key in parent.META}
+    environ.update({
+        'REQUEST_METHOD': method,
+        'PATH_INFO': url.path,
+        'QUERY_STRING': url.query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(payload)),
+        'wsgi.input': BytesIO(payload),
+    })
+    for name, value in (headers or {}).items():
+        environ['HTTP_' + name.upper().replace('-', '_')] = value
+    request = WSGIRequest(environ)
+    request.user = user
+    #DRF authenticates a request carrying a forced user without running the authenticators
+    request._force_auth_user = user
+    request._force_auth_token = auth
+    return request
+
+
+def dispatch(request, replica=None):
+    """
+    Runs one sub-request through the API view its path resolves to.
+
+    Args:
+        request: HttpRequest from build_request
+        replica: replica alias list reads may use, or None
+
+    Returns:
+        dict: {"status", "headers", "body"}
+    """
+    try:
+        match = resolve(request.path_info)
+    except Resolver404:
+        match = None
+    view_class = getattr(match.func, 'cls', None) if match else None
+    if view_class is None or not getattr(view_class, 'allow_batching', True):
+        return {'status': 404, 'headers': {}, 'body': {'status': 'error', 'message': 'Not found.'}}
+
+    try:
+        with read_from(replica if replica and wants_replica(request, match.func) else None):
+            response = match.func(request, *match.args, **match.kwargs)
+    except Exception:
+        logger.exception("Batch sub-request %s %s failed", request.method, request.get_full_path())
+        return {'status': 500, 'headers': {}, 'body': {'status': 'error', 'message': 'Internal server error.'}}
+
+    body = getattr(response, 'data', None)
+    if body is None and response.content:
+        body = response.content.decode(response.charset)
+        if response.get('Content-Type', '').startswith('application/json'):
+            body = json.loads(body)
+    return {
+        'status': response.status_code,
+        'headers': {name: response[name] for name in FORWARDED_HEADERS if response.has_header(name)},
+        'body': body,
+    }
+
+
+def _dispatch_in_pool(request, replica):
+    #Pool threads keep their own connections; recycle them like the request cycle does
+    close_old_connections()
+    try:
+        return dispatch(request, replica)
+    finally:
+        close_old_connections()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Returns the process-wide sub-request pool, or None when BATCH_API['WORKERS'] is 0.
+    """
+    global _executor
+    workers = batch_settings()['WORKERS']
+    if workers < 1:
+        return None
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='batch')
+    return _executor
+
+
+def run_batch(parent, user, auth, subrequests):
+    """
+    Runs validated sub-requests and returns their results in order.
+
+    Args:
+        parent: the batch's HttpRequest
+        user, auth: the batch's authenticated user and token
+        subrequests: list of dicts with method, path and optional body and headers
+
+    Returns:
+        tuple: (results, wrote) where wrote tells whether any write succeeded
+    """
+    results = [None] * len(subrequests)
+    replica = None if parent.COOKIES.get(PIN_COOKIE) else replica_alias()
+    wrote = False
+    pending = []
+
+    def run_pending():
+        executor = get_executor()
+        if executor is None or len(pending) == 1:
+            for index, request in pending:
+                results[index] = dispatch(request, replica)
+        else:
+            #Each task gets a copy of this context: shard and replica routing follow the batch request
+            futures = [(index, executor.submit(copy_context().run, _dispatch_in_pool, request, replica))
+                       for index, request in pending]
+            for index, future in futures:
+                results[index] = future.result()
+        pending.clear()
+
+    for index, subrequest in enumerate(subrequests):
+        request = build_request(parent, user, auth, subrequest['method'], subrequest['path'],
+                                subrequest.get('body'), subrequest.get('headers'))
+        if subrequest['method'] in CONCURRENT_METHODS:
+            pending.append((index, request))
+            continue
+        if pending:
+            run_pending()
+        results[index] = dispatch(request)
+        if results[index]['status'] < 400:
+            #Later reads must see this write
+            wrote, replica = True, None
+    if pending:
+        run_pending()
+    return results, wrote
@@ -0,0 +1,75 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, CharField, Count, IntegerField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Cast, Coalesce, Concat
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from inventory_management.sharding import shard_aliases, sharding_enabled
+
+from .models import Category, InventoryItem
+from .sync import record_changes
+from .tenants import replicate_categories
+from .utils import chunked
+
+
+def bulk_create_categories(rows):
+    """
+    Inserts many categories with one INSERT, then sets their paths with one UPDATE.
+
+    Duplicate names (case-insensitive), within the batch or against existing
+    rows, fail the whole batch with IntegrityError from the
+    unique_category_name constraint. Parents must already exist.
+
+    Args:
+        rows: list of validated CategorySerializer data dicts
+
+    Returns:
+        list: the created Category objects
+    """
+    with transaction.atomic():
+        created = Category.objects.bulk_create([Category(**row) for row in rows])
+        ids = [category.pk for category in created]
+        parent_path = Category.objects.filter(pk=OuterRef('parent_id')).values('path')[:1]
+        Category.objects.filter(pk__in=ids).update(
+            path=Concat(Coalesce(Subquery(parent_path), Value('/')), Cast('id', CharField()), Value('/'))
+        )
+        #bulk_create sends no signals, so feed the delta-sync log directly
+        record_changes(Category, [(pk, None) for pk in ids])
+        if sharding_enabled():
+            transaction.on_commit(lambda: replicate_categories(ids))
+    return created
+
+
+def recount_items():
+    """
+    Recomputes every category's item counter from InventoryItem in one UPDATE.
+
+    The counters are maintained incrementally by InventoryItem.save and the
+    delete hook below; this repairs them after bulk writes that bypass both,
+    or after a shard's item write committed but its counter update did not.
+    With tenant shards the counters are totals over every shard.
+
+    Returns:
+        int: number of categories updated
+    """
+    if sharding_enabled():
+        totals = Counter()
+        for alias in shard_aliases():
+            totals.update(dict(InventoryItem.objects.using(alias).exclude(category=None).order_by()
+                               .values_list('category_id').annotate(total=Count('id'))))
+        updated = Category.objects.update(item_count=0)
+        for batch in chunked(totals.items(), 500):
+            Category.objects.filter(pk__in=[pk for pk, _ in batch]).update(
+                item_count=Case(*[When(pk=pk, then=Value(total)) for pk, total in batch]))
+        return updated
+    counts = (InventoryItem.objects.filter(category_id=OuterRef('pk'))
+              .order_by().values('category_id').annotate(total=Count('id')).values('total'))
+    return Category.objects.update(item_count=Coalesce(Subquery(counts, output_field=IntegerField()), 0))
+
+
+@receiver(post_delete, sender=InventoryItem)
+def handle_item_delete(sender, instance, **kwargs):
+    #Runs inside the deletion's transaction, so the counter drops with the row (or once it commits, on a shard)
+    Category.move_items(instance.category_id, None, using=instance._state.db)
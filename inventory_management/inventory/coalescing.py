@@ -0,0 +1,187 @@
+"""
+Group commit for adjust_stock on hot items.
+
+With WRITE_COALESCING enabled, concurrent adjustments of the same item in
+one process are queued for up to WINDOW_MS. The first request of a group
+(the leader) then applies the whole group in one transaction:
+
+    - one locked read of the item quantity
+    - the adjustments checked one by one in arrival order, each against the
+      running quantity, so a removal that would go negative is rejected
+      exactly as it would be if the requests had run one after another
+    - one conditional UPDATE of the quantity (retried if the row changed
+      underneath, e.g. by another process)
+    - one bulk_create of the accepted InventoryChange rows
+
+Every waiting request is then answered with its own before and after
+quantities. Requests already inside a transaction bypass the queue, since
+the group commits in the leader's transaction, not theirs.
+"""
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from inventory_management.sharding import current_shard
+
+from .models import InventoryChange, InventoryItem
+from .outbox import publish
+from .sync import record_changes
+
+
+class InsufficientStock(Exception):
+    """
+    Raised for an adjustment that would take the item's quantity below zero.
+    """
+
+
+def coalescing_settings():
+    return {'ENABLED': False, 'WINDOW_MS': 2, 'MAX_BATCH': 500, **getattr(settings, 'WRITE_COALESCING', {})}
+
+
+class _Adjustment:
+    #One queued request; `done` is set once the group it joined is applied
+    def __init__(self, quantity_change, user, notes):
+        self.quantity_change = quantity_change
+        self.user = user
+        self.notes = notes
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Group:
+    def __init__(self):
+        self.adjustments = []
+        self.full = threading.Event()
+
+
+class StockWriteCoalescer:
+    """
+    Per-process queue of pending adjustments, grouped by item.
+    """
+    def __init__(self, window_ms=2, max_batch=500):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self._groups = {}
+
+    def adjust(self, item_id, quantity_change, user, notes=''):
+        """
+        Applies one adjustment as part of the item's next group.
+
+        Returns:
+            tuple: (previous_quantity, new_quantity, InventoryChange)
+
+        Raises:
+            InsufficientStock: if the adjustment would make the quantity negative
+            InventoryItem.DoesNotExist: if the item was deleted
+        """
+        alias = current_shard()
+        if transaction.get_connection(alias).in_atomic_block:
+            return apply_adjustments(item_id, [_Adjustment(quantity_change, user, notes)], direct=True)
+
+        adjustment = _Adjustment(quantity_change, user, notes)
+        #Item ids are only unique per tenant shard
+        key = (alias, item_id)
+        with self._lock:
+            group = self._groups.get(key)
+            leader = group is None
+            if leader:
+                group = self._groups[key] = _Group()
+            group.adjustments.append(adjustment)
+            if len(group.adjustments) >= self.max_batch:
+                group.full.set()
+
+        if leader:
+            group.full.wait(self.window)
+            with self._lock:
+                #Later arrivals start the next group
+                del self._groups[key]
+            apply_adjustments(item_id, group.adjustments)
+
+        adjustment.done.wait()
+        if adjustment.error is not None:
+            raise adjustment.error
+        return adjustment.result
+
+
+def apply_adjustments(item_id, adjustments, direct=False):
+    """
+    Applies a group of adjustments of one item in one transaction.
+
+    Sets `result` or `error` on every adjustment and then its `done` event.
+    With `direct` (a single adjustment applied without queueing) the result
+    is returned, or the error raised, instead.
+    """
+    try:
+        while True:
+            now = timezone.now()
+            with transaction.atomic(using=current_shard()):
+                item = InventoryItem.objects.select_for_update().values('quantity', 'created_by_id').get(pk=item_id)
+                running = item['quantity']
+                accepted = []
+                for adjustment in adjustments:
+                    adjustment.result = adjustment.error = None
+                    if running + adjustment.quantity_change < 0:
+                        adjustment.error = InsufficientStock("Insufficient stock")
+                        continue
+                    adjustment.result = (running, running + adjustment.quantity_change)
+                    running += adjustment.quantity_change
+                    accepted.append(adjustment)
+                if not accepted:
+                    break
+                #Conditional on the quantity read above; zero rows means another writer got in first
+                if not InventoryItem.objects.filter(pk=item_id, quantity=item['quantity']).update(
+                        quantity=running, last_updated=now, version=F('version') + 1):
+                    continue
+                changes = InventoryChange.objects.bulk_create([
+                    InventoryChange(
+                        item_id=item_id,
+                        change_type='ADD' if adjustment.quantity_change > 0 else 'REMOVE',
+                        quantity_change=adjustment.quantity_change,
+                        previous_quantity=adjustment.result[0],
+                        new_quantity=adjustment.result[1],
+                        changed_by=adjustment.user,
+                        owner_id=item['created_by_id'],
+                        notes=adjustment.notes,
+                    )
+                    for adjustment in accepted
+                ])
+                #bulk_create and update() send no signals: feed the outbox and the delta-sync log directly
+                publish(InventoryChange, changes)
+                record_changes(InventoryItem, [(item_id, item['created_by_id'])])
+                for adjustment, change in zip(accepted, changes):
+                    adjustment.result += (change,)
+                break
+    except Exception as exc:
+        for adjustment in adjustments:
+            adjustment.result, adjustment.error = None, exc
+    for adjustment in adjustments:
+        adjustment.done.set()
+
+    if direct:
+        if adjustments[0].error is not None:
+            raise adjustments[0].error
+        return adjustments[0].result
+
+
+_coalescer = None
+_coalescer_lock = threading.Lock()
+
+
+def get_coalescer():
+    """
+    Returns the process-wide coalescer, or None when WRITE_COALESCING is disabled.
+    """
+    global _coalescer
+    config = coalescing_settings()
+    if not config['ENABLED']:
+        return None
+    if _coalescer is None:
+        with _coalescer_lock:
+            if _coalescer is None:
+                _coalescer = StockWriteCoalescer(config['WINDOW_MS'], config['MAX_BATCH'])
+    return _coalescer
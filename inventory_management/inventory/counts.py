@@ -0,0 +1,212 @@
+from django.db import models, transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Count, Q
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from inventory_management.sharding import current_shard
+
+from .models import InventoryItem, InventoryChange, StoreInventory, StockCount, StockCountLine
+from .sync import record_changes
+from .outbox import publish
+from .ledger import store_change, record_store_changes
+from .lots import LotManager
+from .utils import chunked
+
+
+class StockCountManager:
+    """
+    Handles cycle-count sessions: loading counted lines, computing variance
+    against system stock and applying approved counts in bulk.
+
+    All variance work is set-based: system quantities are read with a single
+    correlated subquery and approval applies every difference with one
+    bulk_create of InventoryChange rows and one UPDATE per stock table.
+    """
+    @staticmethod
+    def system_quantity(count):
+        """
+        Returns a subquery expression yielding the current system quantity for
+        a StockCountLine's item: the StoreInventory quantity at the count's
+        store, or the InventoryItem quantity for store-less counts.
+        """
+        if count.store_id:
+            source = StoreInventory.objects.filter(store_id=count.store_id, item_id=OuterRef('item_id'))
+        else:
+            source = InventoryItem.objects.filter(pk=OuterRef('item_id'))
+        return Subquery(source.values('quantity')[:1])
+
+    @staticmethod
+    def record_lines(count, lines):
+        """
+        Inserts or replaces counted quantities for a count.
+
+        Args:
+            count: StockCount instance (must be OPEN)
+            lines: dict mapping item id to counted quantity. Item ownership
+                must already have been checked by the caller.
+
+        Returns:
+            int: number of lines written
+        """
+        StockCountLine.objects.bulk_create(
+            [StockCountLine(count=count, item_id=item_id, counted_quantity=quantity)
+             for item_id, quantity in lines.items()],
+            batch_size=2000,
+            update_conflicts=True,
+            unique_fields=['count', 'item'],
+            update_fields=['counted_quantity'],
+        )
+        return len(lines)
+
+    @staticmethod
+    def variance_queryset(count):
+        """
+        Returns the count's lines annotated with `current_quantity` and
+        `current_variance` (counted minus system, missing rows count as 0).
+        Open counts compare against live stock, approved counts report the
+        snapshot taken at approval.
+        """
+        if count.status == 'APPROVED':
+            return count.lines.annotate(current_quantity=F('system_quantity'), current_variance=F('variance'))
+        return count.lines.annotate(
+            current_quantity=StockCountManager.system_quantity(count),
+            current_variance=F('counted_quantity') - Coalesce(F('current_quantity'), 0),
+        )
+
+    @staticmethod
+    def variance_summary(queryset):
+        """
+        Aggregates an annotated variance queryset into a single summary row.
+
+        Returns:
+            dict: lines, lines_with_variance, units_over, units_short and
+            variance_value (net variance valued at item price)
+        """
+        summary = queryset.aggregate(
+            lines=Count('id'),
+            lines_with_variance=Count('id', filter=~Q(current_variance=0)),
+            units_over=Coalesce(Sum('current_variance', filter=Q(current_variance__gt=0)), 0),
+            units_short=Coalesce(Sum('current_variance', filter=Q(current_variance__lt=0)), 0),
+            variance_value=Coalesce(
+                Sum(F('current_variance') * F('item__price'), output_field=models.DecimalField()),
+                0, output_field=models.DecimalField(),
+            ),
+        )
+        summary['units_short'] = -summary['units_short']
+        return summary
+
+    @staticmethod
+    def approve(count, user):
+        """
+        Applies every non-zero variance of an open count as ADJUST changes.
+
+        Runs in one transaction: snapshots system quantities onto the lines
+        with a single UPDATE, writes InventoryChange rows with one
+        bulk_create, then moves stock with one UPDATE on InventoryItem (and
+        for store counts one UPDATE on StoreInventory, a bulk_create for items
+        the store did not stock yet, one bulk_create of ledger rows and the
+        FEFO depletion of lots for counted shortfalls).
+
+        Item totals never go below zero: when a store count removes more
+        than the item's total holds (the total has drifted from its stores,
+        see reconcile_stock), the item stops at zero and its ADJUST records
+        the change actually applied.
+
+        Args:
+            count: StockCount instance in OPEN status
+            user: User approving the count
+
+        Returns:
+            int: number of items adjusted, or None if the count was no longer open
+        """
+        now = timezone.now()
+        with transaction.atomic(using=current_shard()):
+            #Claim the count first so concurrent approvals cannot apply it twice
+            claimed = StockCount.objects.filter(pk=count.pk, status='OPEN').update(
+                status='APPROVED', approved_by=user, approved_at=now,
+            )
+            if not claimed:
+                return None
+            count.status, count.approved_by, count.approved_at = 'APPROVED', user, now
+
+            lines = count.lines.all()
+
+            #Lock the affected stock rows for the rest of the transaction
+            list(InventoryItem.objects.select_for_update().filter(id__in=lines.values('item_id')).values_list('id'))
+            if count.store_id:
+                list(StoreInventory.objects.select_for_update()
+                     .filter(store_id=count.store_id, item_id__in=lines.values('item_id')).values_list('id'))
+
+            #Snapshot system quantity and variance in one set-based statement
+            system = StockCountManager.system_quantity(count)
+            lines.update(
+                system_quantity=system,
+                variance=F('counted_quantity') - Coalesce(system, 0),
+            )
+
+            differences = list(
+                lines.exclude(variance=0)
+                .values_list('item_id', 'variance', 'item__quantity', 'system_quantity', 'counted_quantity')
+            )
+            changes = InventoryChange.objects.bulk_create([
+                InventoryChange(
+                    item_id=item_id,
+                    change_type='ADJUST',
+                    quantity_change=max(item_quantity + variance, 0) - item_quantity,
+                    previous_quantity=item_quantity,
+                    new_quantity=max(item_quantity + variance, 0),
+                    changed_by=user,
+                    owner_id=count.created_by_id,
+                    notes=f"Stock count #{count.pk}",
+                )
+                for item_id, variance, item_quantity, _, _ in differences
+                if max(item_quantity + variance, 0) != item_quantity
+            ], batch_size=2000)
+            publish(InventoryChange, changes)
+
+            adjusted = lines.exclude(variance=0)
+            line_for_item = StockCountLine.objects.filter(count=count, item_id=OuterRef('pk'))
+            InventoryItem.objects.filter(id__in=adjusted.values('item_id')).update(
+                quantity=Greatest(F('quantity') + Subquery(line_for_item.values('variance')[:1]), 0),
+                last_updated=now,
+                version=F('version') + 1,
+            )
+
+            if count.store_id:
+                line_for_row = StockCountLine.objects.filter(count=count, item_id=OuterRef('item_id'))
+                store_rows = StoreInventory.objects.filter(
+                    store_id=count.store_id, item_id__in=adjusted.values('item_id')
+                )
+                store_rows.update(quantity=Subquery(line_for_row.values('counted_quantity')[:1]), version=F('version') + 1)
+                StoreInventory.objects.bulk_create([
+                    StoreInventory(store_id=count.store_id, item_id=item_id, quantity=counted,
+                                   owner_id=count.store.created_by_id)
+                    for item_id, _, _, system_quantity, counted in differences if system_quantity is None
+                ], batch_size=2000)
+                store_rows.update(urgency=StoreInventory.urgency_expression())
+                #Counted shortfalls leave the lots first-expired-first-out
+                LotManager.deplete_many(count.store_id, {
+                    item_id: system_quantity - counted
+                    for item_id, _, _, system_quantity, counted in differences
+                    if system_quantity is not None and counted < system_quantity
+                })
+                record_store_changes(
+                    store_change(count.store_id, item_id, system_quantity or 0, counted, user,
+                                 notes=f"Stock count #{count.pk}", change_type='ADJUST')
+                    for item_id, _, _, system_quantity, counted in differences
+                )
+                record_changes(StoreInventory, store_rows.values_list('id', 'owner_id'))
+                publish(StoreInventory, store_rows)
+
+            record_changes(InventoryItem, ((item_id, count.created_by_id) for item_id, *_ in differences))
+        return len(differences)
+
+
+def owned_item_ids(user, item_ids):
+    """
+    Returns the subset of `item_ids` that belong to `user`, checked in chunks.
+    """
+    owned = set()
+    for batch in chunked(item_ids, 5000):
+        owned.update(InventoryItem.objects.filter(created_by=user, id__in=batch).values_list('id', flat=True))
+    return owned
@@ -0,0 +1,45 @@
+from .models import StoreInventoryChange
+
+
+def store_change(store_id, item_id, previous_quantity, new_quantity, user, notes='', change_type=None):
+    """
+    Builds an unsaved StoreInventoryChange for one store item.
+
+    Args:
+        store_id: id of the Store
+        item_id: id of the InventoryItem
+        previous_quantity: int - StoreInventory quantity before the write
+        new_quantity: int - StoreInventory quantity after the write
+        user: User making the change (or None)
+        notes: optional free text
+        change_type: ADD/REMOVE/ADJUST, derived from the sign of the change when omitted
+
+    Returns:
+        StoreInventoryChange, or None when the quantity did not change
+    """
+    quantity_change = new_quantity - previous_quantity
+    if quantity_change == 0:
+        return None
+    if change_type is None:
+        change_type = 'ADD' if quantity_change > 0 else 'REMOVE'
+    return StoreInventoryChange(
+        store_id=store_id,
+        item_id=item_id,
+        change_type=change_type,
+        quantity_change=quantity_change,
+        previous_quantity=previous_quantity,
+        new_quantity=new_quantity,
+        changed_by=user,
+        notes=notes,
+    )
+
+
+def record_store_changes(changes, batch_size=2000):
+    """
+    Writes StoreInventoryChange rows with bulk_create, skipping None entries.
+
+    Every StoreInventory write path funnels its ledger rows through here.
+    """
+    return StoreInventoryChange.objects.bulk_create(
+        [change for change in changes if change is not None], batch_size=batch_size
+    )
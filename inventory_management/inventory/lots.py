@@ -0,0 +1,122 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Min, Sum
+from django.utils import timezone
+
+from inventory_management.sharding import current_shard
+
+from .models import InventoryAlert, StockLot
+from .sync import record_changes
+from .outbox import publish
+from .utils import chunked
+
+
+class LotManager:
+    """
+    Manages stock lots: first-expired-first-out depletion and the expiry
+    sweep that raises EXPIRY alerts.
+    """
+    @staticmethod
+    def deplete(store_id, item_id, quantity):
+        """
+        Removes `quantity` units from an item's lots at a store, earliest expiry first.
+
+        Args:
+            store_id: id of the Store the stock left
+            item_id: id of the InventoryItem that was removed
+            quantity: int - number of units removed
+
+        Returns:
+            int: units that could not be matched to a lot (0 when fully covered)
+        """
+        return LotManager.deplete_many(store_id, {item_id: quantity})[item_id]
+
+    @staticmethod
+    def deplete_many(store_id, removals, batch_size=2000):
+        """
+        Removes units of several items from their lots at a store, earliest expiry first.
+
+        Every path that lowers StoreInventory.quantity calls this in the same
+        transaction. The lots of a batch of items are locked and read with one
+        query over the FEFO index and written back with one bulk_update.
+
+        Args:
+            store_id: id of the Store the stock left
+            removals: dict of item id -> int units removed
+            batch_size: int - items whose lots are read per query
+
+        Returns:
+            dict: item id -> units that could not be matched to a lot
+        """
+        remaining = {item_id: quantity for item_id, quantity in removals.items() if quantity > 0}
+        unmatched = dict.fromkeys(removals, 0)
+        with transaction.atomic(using=current_shard()):
+            for items in chunked(list(remaining), batch_size):
+                changed = []
+                lots = (StockLot.objects.select_for_update()
+                        .filter(store_id=store_id, item_id__in=items, quantity__gt=0)
+                        .order_by('item_id', 'expiry_date', 'id'))
+                for lot in lots:
+                    if remaining[lot.item_id] <= 0:
+                        continue
+                    taken = min(lot.quantity, remaining[lot.item_id])
+                    lot.quantity -= taken
+                    remaining[lot.item_id] -= taken
+                    changed.append(lot)
+                StockLot.objects.bulk_update(changed, ['quantity'], batch_size=batch_size)
+        unmatched.update(remaining)
+        return unmatched
+
+    @staticmethod
+    def sweep_expiring(days, batch_size=2000):
+        """
+        Raises an EXPIRY alert for every store and item with stock in lots
+        expiring within `days` days (including already expired lots).
+
+        The expiring lots are read with one grouped range scan over the
+        partial expiry index. Alerts are bulk-created with ignore_conflicts,
+        so the unique_open_alert constraint keeps re-runs and concurrent
+        sweeps from creating duplicates. Alerts are written in one transaction
+        together with their outbox events.
+
+        Args:
+            days: int - look-ahead window in days
+            batch_size: int - alerts inserted per statement
+
+        Returns:
+            int: number of store/item pairs with expiring stock
+        """
+        started = timezone.now()
+        cutoff = started.date() + timedelta(days=days)
+        expiring = (StockLot.objects.filter(expiry_date__lte=cutoff, quantity__gt=0)
+                    .values('store_id', 'item_id', 'store__name', 'item__name', 'store__created_by_id')
+                    .annotate(earliest=Min('expiry_date'), expiring_quantity=Sum('quantity'))
+                    .order_by())
+
+        pairs = 0
+        created = []
+        #Alerts and their outbox events commit together
+        with transaction.atomic(using=current_shard()):
+            for rows in chunked(expiring.iterator(chunk_size=batch_size), batch_size):
+                pairs += len(rows)
+                alerts = [
+                    InventoryAlert(
+                        store_id=row['store_id'],
+                        item_id=row['item_id'],
+                        alert_type='EXPIRY',
+                        owner_id=row['store__created_by_id'],
+                        message=f"Expiry alert for {row['item__name']} in {row['store__name']}. "
+                                f"{row['expiring_quantity']} units expire by {row['earliest']:%Y-%m-%d}",
+                    )
+                    for row in rows
+                ]
+                InventoryAlert.objects.bulk_create(alerts, batch_size=batch_size, ignore_conflicts=True)
+                created.extend(alerts)
+
+            if created:
+                #ignore_conflicts leaves primary keys unset, so look the new alerts up
+                new_alerts = InventoryAlert.objects.filter(alert_type='EXPIRY', is_resolved=False, created_at__gte=started)
+                record_changes(InventoryAlert, new_alerts.values_list('id', 'owner_id'))
+                publish(InventoryAlert, new_alerts)
+        return pairs
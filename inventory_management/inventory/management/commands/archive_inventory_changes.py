@@ -0,0 +1,31 @@
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from inventory.archive import ChangeArchive, archive_settings
+
+
+class Command(BaseCommand):
+    """
+    Rolls InventoryChange rows older than the retention window up into
+    InventoryChangeDaily, writes them to the month-partitioned archive and
+    deletes them, one bounded batch per transaction.
+
+    Usage:
+        python manage.py archive_inventory_changes
+        python manage.py archive_inventory_changes --retention-days 180 --batch-size 5000
+    """
+    help = 'Archive and roll up InventoryChange rows older than the retention window'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int, help='Override settings.CHANGE_ARCHIVE["RETENTION_DAYS"]')
+        parser.add_argument('--batch-size', type=int, help='Changes archived per transaction')
+
+    def handle(self, *args, **options):
+        days = options['retention_days']
+        if days is None:
+            days = archive_settings()['RETENTION_DAYS']
+        cutoff = timezone.make_aware(datetime.combine(timezone.localdate() - timedelta(days=days), time.min))
+        archived = ChangeArchive().archive(cutoff=cutoff, batch_size=options['batch_size'])
+        self.stdout.write(f"{archived} changes before {cutoff:%Y-%m-%d} archived.")
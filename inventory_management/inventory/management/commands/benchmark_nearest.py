@@ -0,0 +1,78 @@
+import random
+import statistics
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from inventory.models import InventoryItem, Store, StoreInventory
+from inventory.views import StoreViewSet
+
+
+class Command(BaseCommand):
+    """
+    Measures stores/nearest/ latency over a synthetic store network.
+
+    Creates the stores, one item and its stock inside a transaction that is
+    rolled back at the end, so the database is left unchanged.
+
+    Usage:
+        python manage.py benchmark_nearest --stores 10000 --queries 500
+    """
+    help = 'Benchmark nearest-store-with-stock lookups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stores', type=int, default=10000, help='Number of synthetic stores')
+        parser.add_argument('--queries', type=int, default=500, help='Number of timed lookups')
+        parser.add_argument('--stocked', type=float, default=0.3, help='Fraction of stores holding the item')
+        parser.add_argument('--k', type=int, default=5, help='Stores returned per lookup')
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        with transaction.atomic():
+            suffix = uuid.uuid4().hex[:8]
+            user = get_user_model().objects.create_user(f'bench-{suffix}', f'bench-{suffix}@example.com', None)
+            item = InventoryItem.objects.create(name=f'bench-{suffix}', quantity=0, price=1, created_by=user)
+            stores = Store.objects.bulk_create([
+                Store(name=f'store {n}', address='-', contact_number='-', email='bench@example.com',
+                      created_by=user, latitude=round(rng.uniform(-60, 70), 6),
+                      longitude=round(rng.uniform(-180, 180), 6))
+                for n in range(options['stores'])
+            ], batch_size=1000)
+            StoreInventory.objects.bulk_create([
+                StoreInventory(store=store, item=item, quantity=rng.randint(1, 20), owner=user)
+                for store in stores if rng.random() < options['stocked']
+            ], batch_size=1000)
+
+            view = StoreViewSet.as_view({'get': 'nearest'})
+            factory = APIRequestFactory()
+
+            def lookup():
+                request = factory.get('/api/inventory/stores/nearest/', {
+                    'item': item.pk, 'lat': rng.uniform(-60, 70), 'lon': rng.uniform(-180, 180),
+                    'min_qty': 5, 'k': options['k'],
+                })
+                force_authenticate(request, user=user)
+                return view(request)
+
+            started = time.perf_counter()
+            lookup()
+            build = time.perf_counter() - started
+
+            timings = []
+            for _ in range(options['queries']):
+                started = time.perf_counter()
+                response = lookup()
+                timings.append((time.perf_counter() - started) * 1000)
+                assert response.status_code == 200, response.data
+            timings.sort()
+
+            self.stdout.write(
+                f"stores={options['stores']} queries={options['queries']} first_call(tree build)={build * 1000:.1f}ms "
+                f"p50={statistics.median(timings):.2f}ms p95={timings[int(len(timings) * 0.95) - 1]:.2f}ms "
+                f"max={timings[-1]:.2f}ms"
+            )
+            transaction.set_rollback(True)
@@ -0,0 +1,114 @@
+import random
+import statistics
+import time
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from inventory.models import InventoryAlert, InventoryChange, InventoryItem, Store, StoreInventory
+from inventory.pagination import bounded_count
+
+
+class Command(BaseCommand):
+    """
+    Compares the per-user list queries filtered through a join on the
+    store's or item's creator with the same queries filtered on the
+    denormalized owner column.
+
+    Builds a synthetic multi-user dataset inside a transaction that is
+    rolled back at the end, so the database is left unchanged. Each query is
+    timed the way the list endpoints run it: a bounded count plus the first
+    page, reported separately.
+
+    Usage:
+        python manage.py benchmark_owner_filter --users 20 --items 500 --stores 10
+        python manage.py benchmark_owner_filter --explain
+    """
+    help = 'Benchmark ownership filters: join vs denormalized owner column'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20, help='Synthetic users')
+        parser.add_argument('--stores', type=int, default=10, help='Stores per user')
+        parser.add_argument('--items', type=int, default=500, help='Items per user, stocked in every store')
+        parser.add_argument('--changes', type=int, default=5, help='Inventory changes per item')
+        parser.add_argument('--repeat', type=int, default=50, help='Timed runs per query')
+        parser.add_argument('--explain', action='store_true', help='Print the query plans')
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        with transaction.atomic():
+            users = self.build(options, rng)
+            if connection.vendor in ('sqlite', 'postgresql'):
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+
+            user = users[len(users) // 2]
+            queries = {
+                'store_inventory': (StoreInventory.objects.filter(store__created_by=user).order_by('pk'),
+                                    StoreInventory.objects.filter(owner=user).order_by('pk')),
+                'alerts': (InventoryAlert.objects.filter(store__created_by=user),
+                           InventoryAlert.objects.filter(owner=user)),
+                'inventory_changes': (InventoryChange.objects.filter(item__created_by=user).order_by('pk'),
+                                      InventoryChange.objects.filter(owner=user).order_by('pk')),
+            }
+            for name, (joined, denormalized) in queries.items():
+                for label, queryset in (('join', joined), ('owner', denormalized)):
+                    counts, pages = self.time(queryset, options['repeat'])
+                    self.stdout.write(
+                        f"{name:<18} {label:<5} count p50={statistics.median(counts):.2f}ms "
+                        f"p95={counts[int(len(counts) * 0.95) - 1]:.2f}ms  "
+                        f"page p50={statistics.median(pages):.2f}ms p95={pages[int(len(pages) * 0.95) - 1]:.2f}ms"
+                    )
+                    if options['explain']:
+                        self.stdout.write(queryset[:50].explain())
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def time(queryset, repeat):
+        #Returns sorted (count, first page) timings in milliseconds
+        counts, pages = [], []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            bounded_count(queryset)
+            counted = time.perf_counter()
+            list(queryset[:50])
+            counts.append((counted - started) * 1000)
+            pages.append((time.perf_counter() - counted) * 1000)
+        return sorted(counts), sorted(pages)
+
+    def build(self, options, rng):
+        suffix = uuid.uuid4().hex[:8]
+        users = [get_user_model().objects.create_user(f'bench-{suffix}-{n}', f'bench-{suffix}-{n}@example.com', None)
+                 for n in range(options['users'])]
+        #Rows of all users are interleaved, as they are in a shared table
+        stores = Store.objects.bulk_create([
+            Store(name=f'store {n}', address='-', contact_number='-', email='bench@example.com', created_by=user)
+            for n in range(options['stores']) for user in users
+        ], batch_size=1000)
+        items = InventoryItem.objects.bulk_create([
+            InventoryItem(name=f'bench-{suffix}-{n}', quantity=100, price=1, created_by=user)
+            for n in range(options['items']) for user in users
+        ], batch_size=1000)
+        items_of = {user.pk: [item for item in items if item.created_by_id == user.pk] for user in users}
+
+        rows = StoreInventory.objects.bulk_create([
+            StoreInventory(store=store, item=item, quantity=rng.randint(0, 40), owner_id=store.created_by_id)
+            for store in stores for item in items_of[store.created_by_id]
+        ], batch_size=2000)
+        InventoryAlert.objects.bulk_create([
+            InventoryAlert(store_id=row.store_id, item_id=row.item_id, alert_type='LOW_STOCK',
+                           owner_id=row.owner_id)
+            for row in rows if row.quantity <= 10
+        ], batch_size=2000)
+        now = timezone.now()
+        InventoryChange.objects.bulk_create([
+            InventoryChange(item=item, change_type='ADD', quantity_change=1, previous_quantity=n,
+                            new_quantity=n + 1, owner_id=item.created_by_id, notes='',
+                            timestamp=now - timedelta(minutes=n))
+            for n in range(options['changes']) for item in items
+        ], batch_size=2000)
+        return users
@@ -0,0 +1,99 @@
+import threading
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from inventory.models import InventoryItem
+from inventory.views import InventoryItemViewSet
+
+
+class Command(BaseCommand):
+    """
+    Measures adjust_stock write throughput against the configured database profile.
+
+    Runs concurrent threads that each post adjustments to the real
+    adjust_stock endpoint for one shared item, so every request contends on
+    the same row. With --coalesce the run uses WRITE_COALESCING (group
+    commit) with the given window. The temporary user and item are deleted
+    afterwards.
+
+    Usage:
+        python manage.py benchmark_writes --threads 8 --requests 200
+        python manage.py benchmark_writes --threads 32 --coalesce --window-ms 2
+        DATABASE_PROFILE=postgres DATABASE_URL=... python manage.py benchmark_writes
+    """
+    help = 'Benchmark concurrent adjust_stock write throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent writer threads')
+        parser.add_argument('--requests', type=int, default=200, help='Adjustments per thread')
+        parser.add_argument('--coalesce', action='store_true', help='Enable write coalescing for the run')
+        parser.add_argument('--window-ms', type=float, default=2, help='Coalescing window in milliseconds')
+
+    def handle(self, *args, **options):
+        if not options['coalesce']:
+            return self.run(options, coalesce=False)
+        from inventory import coalescing
+        coalescing._coalescer = None
+        try:
+            with override_settings(WRITE_COALESCING={'ENABLED': True, 'WINDOW_MS': options['window_ms'],
+                                                     'MAX_BATCH': 500}):
+                return self.run(options, coalesce=True)
+        finally:
+            coalescing._coalescer = None
+
+    def run(self, options, coalesce):
+        threads = options['threads']
+        per_thread = options['requests']
+
+        User = get_user_model()
+        suffix = uuid.uuid4().hex[:8]
+        user = User.objects.create_user(f'bench-{suffix}', f'bench-{suffix}@example.com', None)
+        item = InventoryItem.objects.create(name=f'bench-{suffix}', quantity=0, price=1, created_by=user)
+
+        view = InventoryItemViewSet.as_view({'post': 'adjust_stock'})
+        factory = APIRequestFactory()
+        results = {'ok': 0, 'failed': 0}
+        lock = threading.Lock()
+
+        def writer():
+            ok = failed = 0
+            try:
+                for _ in range(per_thread):
+                    request = factory.post(f'/api/inventory/inventory-item/{item.pk}/adjust_stock/',
+                                           {'quantity_change': 1}, format='json')
+                    force_authenticate(request, user=user)
+                    try:
+                        response = view(request, pk=item.pk)
+                        if response.status_code == 200:
+                            ok += 1
+                        else:
+                            failed += 1
+                    except Exception:
+                        failed += 1
+            finally:
+                connections.close_all()
+            with lock:
+                results['ok'] += ok
+                results['failed'] += failed
+
+        workers = [threading.Thread(target=writer) for _ in range(threads)]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+
+        item.refresh_from_db()
+        self.stdout.write(
+            f"vendor={connection.vendor} coalesce={coalesce} threads={threads} requests={threads * per_thread} "
+            f"ok={results['ok']} failed={results['failed']} final_quantity={item.quantity} "
+            f"elapsed={elapsed:.2f}s throughput={results['ok'] / elapsed:.1f} writes/s"
+        )
+        user.delete()
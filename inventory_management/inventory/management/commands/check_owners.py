@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.owners import check_owners
+
+
+class Command(BaseCommand):
+    """
+    Checks that the denormalized owner of every store inventory, alert and
+    inventory change matches the creator of its store or item.
+
+    Exits with status 1 when mismatches are found and --fix is not given,
+    so it can run as a scheduled consistency check.
+
+    Usage:
+        python manage.py check_owners
+        python manage.py check_owners --fix --batch-size 20000
+    """
+    help = 'Check (and optionally repair) denormalized owner columns'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Rewrite mismatched owners')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Rows scanned per id range')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        started = time.perf_counter()
+        mismatched = check_owners(fix=options['fix'], batch_size=options['batch_size'])
+        for model, found in mismatched.items():
+            self.stdout.write(f"{model}: {found} mismatched{' (fixed)' if options['fix'] and found else ''}")
+        self.stderr.write(f"Checked owners in {time.perf_counter() - started:.1f}s.")
+        if any(mismatched.values()) and not options['fix']:
+            raise CommandError('Owner mismatches found; rerun with --fix to repair them.', returncode=1)
@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from inventory.outbox import OutboxDispatcher
+
+
+class Command(BaseCommand):
+    """
+    Delivers outbox events to the destinations in settings.OUTBOX.
+
+    Runs until interrupted, polling when there is nothing to send, or makes a
+    single pass with --once (e.g. from cron). Several dispatchers may run at
+    once; destination leases keep each destination's events in order.
+
+    Usage:
+        python manage.py dispatch_outbox
+        python manage.py dispatch_outbox --once --destination erp
+    """
+    help = 'Deliver transactional outbox events to webhook and file sinks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain what is pending, then exit')
+        parser.add_argument('--destination', action='append', help='Only serve this destination (repeatable)')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to sleep when idle')
+
+    def handle(self, *args, **options):
+        dispatcher = OutboxDispatcher(options['destination'])
+        if not dispatcher.sinks:
+            raise CommandError('No outbox destinations configured (settings.OUTBOX["DESTINATIONS"]).')
+
+        delivered = removed = 0
+        try:
+            while True:
+                sent = sum(dispatcher.deliver(name) for name in dispatcher.sinks)
+                delivered += sent
+                if sent:
+                    continue
+                #Idle: trim acknowledged events before waiting for new ones
+                removed += dispatcher.purge()
+                if options['once']:
+                    break
+                connection.close()
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f"{delivered} events delivered, {removed} acknowledged events removed.")
@@ -0,0 +1,57 @@
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from accounts.models import TenantShard
+from inventory.models import Category
+from inventory.tenants import mirror_user, replicate_categories, seed_id_ranges
+from inventory_management.sharding import shard_aliases
+
+
+class Command(BaseCommand):
+    """
+    Migrates every tenant shard, then prepares the shards for routing.
+
+    For each alias of SHARD_DATABASES ('default' first): runs `migrate`,
+    starts the inventory primary keys at the shard's id range, and copies
+    the directory's categories and the shard's tenants onto it. Safe to run
+    again; new shards are picked up from DATABASE_SHARDS.
+
+    Usage:
+        python manage.py migrate_shards
+        python manage.py migrate_shards inventory 0019 --shard shard_2
+    """
+    help = 'Run migrate on every tenant shard and seed their id ranges'
+
+    def add_arguments(self, parser):
+        parser.add_argument('app_label', nargs='?', help='App label to migrate')
+        parser.add_argument('migration_name', nargs='?', help='Migration to migrate to')
+        parser.add_argument('--shard', action='append', dest='shards', help='Only this alias (repeatable)')
+
+    def handle(self, *args, **options):
+        aliases = shard_aliases()
+        shards = options['shards'] or aliases
+        unknown = set(shards) - set(aliases)
+        if unknown:
+            raise CommandError(f"Unknown shards: {', '.join(sorted(unknown))}. Shards: {', '.join(aliases)}.")
+        positional = [name for name in (options['app_label'], options['migration_name']) if name]
+
+        for alias in [alias for alias in aliases if alias in shards]:
+            self.stdout.write(f"Migrating {alias}")
+            call_command('migrate', *positional, database=alias, interactive=False,
+                         verbosity=options['verbosity'], stdout=self.stdout, stderr=self.stderr)
+            seeded = seed_id_ranges(alias)
+            if alias == DEFAULT_DB_ALIAS:
+                continue
+            tenants = list(TenantShard.objects.using(DEFAULT_DB_ALIAS).filter(alias=alias)
+                           .values_list('user_id', flat=True))
+            for user in get_user_model().objects.using(DEFAULT_DB_ALIAS).filter(pk__in=tenants):
+                mirror_user(user, alias)
+            self.stdout.write(f"  seeded {seeded} id sequences, mirrored {len(tenants)} tenants")
+
+        if len(aliases) > 1:
+            #Also re-records categories in every shard's delta-sync log
+            categories = list(Category.objects.using(DEFAULT_DB_ALIAS).filter(parent=None).values_list('id', flat=True))
+            replicate_categories(categories)
+            self.stdout.write(f"Copied {Category.objects.using(DEFAULT_DB_ALIAS).count()} categories to the shards")
@@ -0,0 +1,105 @@
+import csv
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from inventory.models import InventoryItem
+from inventory.reconcile import reconcile_range
+
+
+def _init_worker():
+    #Needed when workers are spawned rather than forked; a no-op otherwise
+    import django
+    django.setup()
+
+
+def _reconcile(args):
+    start_id, end_id, fix, fixed_by_id = args
+    try:
+        return start_id, reconcile_range(start_id, end_id, fix=fix, fixed_by_id=fixed_by_id)
+    finally:
+        connections.close_all()
+
+
+def id_ranges(size):
+    """
+    Splits the existing item ids into [start, end) ranges of `size` ids each.
+
+    Boundaries are found by keyset pagination on id, so gaps in the id space
+    (such as the SHARD_ID_STRIDE between shards) produce no empty ranges.
+    """
+    ids = InventoryItem.objects.order_by('id').values_list('id', flat=True)
+    start = ids.first()
+    ranges = []
+    while start is not None:
+        following = ids.filter(id__gte=start)[size:size + 1].first()
+        ranges.append((start, following if following is not None else ids.last() + 1))
+        start = following
+    return ranges
+
+
+class Command(BaseCommand):
+    """
+    Checks that InventoryItem.quantity, the sum of its StoreInventory
+    quantities and the latest InventoryChange.new_quantity agree.
+
+    Existing item ids are split into ranges of --chunk-size ids that a
+    process pool reconciles in parallel, each with set-based queries. Discrepancies are written as CSV.
+
+    Usage:
+        python manage.py reconcile_stock --workers 8 --chunk-size 10000 --output report.csv
+        python manage.py reconcile_stock --fix
+    """
+    help = 'Reconcile item, store and ledger quantities'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(),
+                            help='Worker processes (1 runs inline)')
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Item ids per range')
+        parser.add_argument('--output', help='Write the discrepancy report to this CSV file instead of stdout')
+        parser.add_argument('--fix', action='store_true',
+                            help='Correct item quantities from store totals and write ADJUST changes')
+        parser.add_argument('--user', type=int, help='User id recorded on corrective changes')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1 or options['workers'] < 1:
+            raise CommandError('--workers and --chunk-size must be positive')
+
+        ranges = [(start, end, options['fix'], options['user']) for start, end in id_ranges(options['chunk_size'])]
+        if not ranges:
+            self.stdout.write('No inventory items to reconcile.')
+            return
+
+        started = time.perf_counter()
+        if options['workers'] == 1:
+            results = map(_reconcile, ranges)
+            executor = None
+        else:
+            connections.close_all()
+            executor = ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker)
+            results = executor.map(_reconcile, ranges)
+
+        output = open(options['output'], 'w', newline='') if options['output'] else sys.stdout
+        try:
+            writer = csv.writer(output)
+            writer.writerow(['item', 'item_quantity', 'store_total', 'ledger_quantity', 'issues', 'fixed_quantity'])
+            found = 0
+            for _, discrepancies in sorted(results):
+                found += len(discrepancies)
+                for row in discrepancies:
+                    writer.writerow([row['item'], row['item_quantity'], row['store_total'], row['ledger_quantity'],
+                                     ';'.join(row['issues']), row.get('fixed_quantity', '')])
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            if output is not sys.stdout:
+                output.close()
+
+        self.stderr.write(
+            f"Reconciled {len(ranges)} id ranges in {time.perf_counter() - started:.1f}s: "
+            f"{found} discrepancies{' fixed' if options['fix'] else ''}."
+        )
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from inventory.analytics import ItemAnalyticsManager
+
+
+class Command(BaseCommand):
+    """
+    Refreshes the cached demand analytics (ItemAnalytics).
+
+    Only stores with new movements since the last run, or whose window or
+    dead-stock state moved on, are recomputed unless --full is given (e.g.
+    after price changes). Meant to run periodically, e.g. hourly from cron:
+        python manage.py refresh_item_analytics
+    """
+    help = 'Recompute velocity, days of cover, turnover, dead stock and ABC classes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recompute every store')
+        parser.add_argument('--store-batch', type=int, default=50, help='Stores recomputed per transaction')
+
+    def handle(self, *args, **options):
+        run = ItemAnalyticsManager.refresh(full=options['full'], store_batch=options['store_batch'])
+        self.stdout.write(f"Analytics refreshed for {run.stores_refreshed} stores"
+                          f"{' (full)' if run.full else ''}.")
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from inventory.reservations import ReservationManager
+
+
+class Command(BaseCommand):
+    """
+    Expires stock reservations whose TTL has passed and returns their units.
+
+    Meant to run frequently, e.g. every minute from cron:
+        python manage.py release_expired_reservations
+    """
+    help = 'Release stock held by expired reservations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Reservations expired per transaction')
+
+    def handle(self, *args, **options):
+        expired = ReservationManager.release_expired(batch_size=options['batch_size'])
+        self.stdout.write(f"{expired} reservations expired.")
@@ -0,0 +1,49 @@
+import argparse
+import os
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory_management.sharding import shard_aliases
+
+
+class Command(BaseCommand):
+    """
+    Runs a management command once per tenant shard.
+
+    Commands without a request user work on the shard named by
+    DATABASE_SHARD; this runs `command` in a subprocess per alias with
+    DATABASE_SHARD set, one after another, and exits non-zero if any run
+    failed. Use it for the scheduled commands (dispatch_outbox excepted,
+    which runs continuously: start one per shard instead).
+
+    Usage:
+        python manage.py run_on_shards release_expired_reservations
+        python manage.py run_on_shards refresh_item_analytics --full
+    """
+    help = 'Run a management command on every tenant shard'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shard', action='append', dest='shards', help='Only this alias (repeatable)')
+        parser.add_argument('command', help='Management command to run')
+        parser.add_argument('arguments', nargs=argparse.REMAINDER, help='Arguments passed to the command')
+
+    def handle(self, *args, **options):
+        aliases = shard_aliases()
+        shards = options['shards'] or aliases
+        unknown = set(shards) - set(aliases)
+        if unknown:
+            raise CommandError(f"Unknown shards: {', '.join(sorted(unknown))}. Shards: {', '.join(aliases)}.")
+
+        failed = []
+        for alias in [alias for alias in aliases if alias in shards]:
+            self.stderr.write(f"== {alias}: {options['command']}")
+            returncode = subprocess.call(
+                [sys.executable, sys.argv[0], options['command'], *options['arguments']],
+                env={**os.environ, 'DATABASE_SHARD': alias},
+            )
+            if returncode:
+                failed.append(alias)
+        if failed:
+            raise CommandError(f"{options['command']} failed on {', '.join(failed)}.", returncode=1)
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.singleflight import COUNTERS, get_single_flight
+
+
+class Command(BaseCommand):
+    """
+    Prints how many requests single-flight coalescing served, summed over
+    every worker process sharing SINGLE_FLIGHT['CACHE'].
+
+        leader            requests that computed their result
+        coalesced_local   requests that shared a result computed in their process
+        coalesced_remote  requests that shared a result computed in another process
+        timeout           requests that stopped waiting and computed themselves
+
+    Usage:
+        python manage.py single_flight_stats
+        python manage.py single_flight_stats --reset
+    """
+    help = 'Show single-flight request coalescing counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Zero the counters after printing them')
+
+    def handle(self, *args, **options):
+        flight = get_single_flight()
+        if flight is None:
+            raise CommandError('Single-flight coalescing is disabled (SINGLE_FLIGHT_ENABLED=1 enables it).')
+        totals = flight.totals()
+        for name in COUNTERS:
+            self.stdout.write(f"{name:<17} {totals[name]}")
+        served = sum(totals.values())
+        coalesced = totals['coalesced_local'] + totals['coalesced_remote']
+        self.stdout.write(f"coalesced {coalesced} of {served} requests")
+        if options['reset']:
+            flight.reset_totals()
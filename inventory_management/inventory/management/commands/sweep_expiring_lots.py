@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from inventory.lots import LotManager
+
+
+class Command(BaseCommand):
+    """
+    Raises EXPIRY alerts for stock lots expiring within the given number of days.
+
+    Meant to run nightly, e.g. from cron:
+        python manage.py sweep_expiring_lots --days 7
+    """
+    help = 'Create EXPIRY alerts for stock lots that expire within N days'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help='Look-ahead window in days')
+
+    def handle(self, *args, **options):
+        pairs = LotManager.sweep_expiring(options['days'])
+        self.stdout.write(f"{pairs} store items have stock expiring within {options['days']} days.")
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.4 on 2026-10-19 17:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_sync_changes(apps, schema_editor):
+    """
+    Gives every existing synced row a sequence number so a client's first
+    full sync (since=0) sees the whole catalog.
+    """
+    SyncChange = apps.get_model('inventory', 'SyncChange')
+    sources = (
+        ('category', apps.get_model('inventory', 'Category').objects.annotate(owner=models.Value(None, models.BigIntegerField()))),
+        ('inventoryitem', apps.get_model('inventory', 'InventoryItem').objects.annotate(owner=models.F('created_by_id'))),
+        ('storeinventory', apps.get_model('inventory', 'StoreInventory').objects.annotate(owner=models.F('store__created_by_id'))),
+        ('inventoryalert', apps.get_model('inventory', 'InventoryAlert').objects.annotate(owner=models.F('store__created_by_id'))),
+    )
+    for label, queryset in sources:
+        batch = []
+        for object_id, owner_id in queryset.values_list('id', 'owner').iterator(chunk_size=2000):
+            batch.append(SyncChange(model=label, object_id=object_id, owner_id=owner_id))
+            if len(batch) >= 2000:
+                SyncChange.objects.bulk_create(batch)
+                batch = []
+        SyncChange.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0003_alter_inventoryalert_options_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(choices=[('category', 'Category'), ('inventoryitem', 'Inventory Item'), ('storeinventory', 'Store Inventory'), ('inventoryalert', 'Inventory Alert')], max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('is_deleted', models.BooleanField(default=False)),
+                ('owner', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner', 'id'], name='syncchange_owner_seq_idx')],
+                'unique_together': {('model', 'object_id')},
+            },
+        ),
+        migrations.RunPython(backfill_sync_changes, migrations.RunPython.noop),
+    ]
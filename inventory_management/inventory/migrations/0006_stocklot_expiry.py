@@ -0,0 +1,82 @@
+# Generated by Django 5.1.4 on 2026-10-19 17:46
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.utils import timezone
+
+
+def resolve_duplicate_open_alerts(apps, schema_editor):
+    """
+    Leaves at most one open alert per store, item and type before the constraint is added.
+
+    The newest open alert of each group stays open; the older ones are
+    marked resolved now, and the count is reported.
+    """
+    InventoryAlert = apps.get_model('inventory', 'InventoryAlert')
+    groups = (InventoryAlert.objects.filter(is_resolved=False).values('store_id', 'item_id', 'alert_type')
+              .annotate(total=Count('id')).filter(total__gt=1).order_by())
+    now = timezone.now()
+    resolved = 0
+    for group in list(groups):
+        open_alerts = InventoryAlert.objects.filter(
+            is_resolved=False, store_id=group['store_id'], item_id=group['item_id'], alert_type=group['alert_type'],
+        ).order_by('-created_at', '-id').values_list('id', flat=True)
+        duplicates = list(open_alerts[1:])
+        resolved += InventoryAlert.objects.filter(id__in=duplicates).update(is_resolved=True, resolved_at=now)
+    if resolved:
+        print(f"\n  Resolved {resolved} duplicate open alerts (the newest of each store, item and type stays open)",
+              end='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_stockcount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockLot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lot_code', models.CharField(max_length=100)),
+                ('quantity', models.IntegerField(validators=[django.core.validators.MinValueValidator(0)])),
+                ('expiry_date', models.DateField()),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='inventoryalert',
+            name='message',
+            field=models.TextField(blank=True),
+        ),
+        migrations.RunPython(resolve_duplicate_open_alerts, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='inventoryalert',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_resolved', False)), fields=('store', 'item', 'alert_type'), name='unique_open_alert'),
+        ),
+        migrations.AddField(
+            model_name='stocklot',
+            name='item',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lots', to='inventory.inventoryitem'),
+        ),
+        migrations.AddField(
+            model_name='stocklot',
+            name='store',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lots', to='inventory.store'),
+        ),
+        migrations.AddIndex(
+            model_name='stocklot',
+            index=models.Index(condition=models.Q(('quantity__gt', 0)), fields=['expiry_date'], name='stocklot_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stocklot',
+            index=models.Index(fields=['store', 'item', 'expiry_date'], name='stocklot_fefo_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='stocklot',
+            unique_together={('store', 'item', 'lot_code')},
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.4 on 2026-10-19 17:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0009_storeinventorychange'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inventorychange',
+            index=models.Index(fields=['item', 'id'], name='change_item_latest_idx'),
+        ),
+    ]
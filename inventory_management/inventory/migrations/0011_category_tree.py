@@ -0,0 +1,46 @@
+# Generated by Django 5.1.4 on 2026-10-19 17:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.functions import Cast, Coalesce, Concat
+
+
+def backfill_category_tree(apps, schema_editor):
+    """
+    Existing categories are all roots: give each its "/<id>/" path and its
+    current direct item count.
+    """
+    Category = apps.get_model('inventory', 'Category')
+    InventoryItem = apps.get_model('inventory', 'InventoryItem')
+    counts = (InventoryItem.objects.filter(category_id=models.OuterRef('pk'))
+              .order_by().values('category_id').annotate(total=models.Count('id')).values('total'))
+    Category.objects.update(
+        path=Concat(models.Value('/'), Cast('id', models.CharField()), models.Value('/')),
+        item_count=Coalesce(models.Subquery(counts, output_field=models.IntegerField()), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0010_inventorychange_item_latest_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='children', to='inventory.category'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(backfill_category_tree, migrations.RunPython.noop),
+    ]
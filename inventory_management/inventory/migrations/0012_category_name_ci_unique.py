@@ -0,0 +1,56 @@
+# Generated by Django 5.1.4 on 2026-10-19 17:59
+
+import django.db.models.functions.text
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import Lower
+
+
+def rename_case_duplicates(apps, schema_editor):
+    """
+    Makes names that differ only in case unique before the constraint is added.
+
+    The oldest category of each clash keeps its name; the others get a
+    " (2)", " (3)", ... suffix, keeping their items and children. Every
+    rename is reported, so they can be merged or renamed by hand afterwards.
+    """
+    Category = apps.get_model('inventory', 'Category')
+    max_length = Category._meta.get_field('name').max_length
+    clashes = (Category.objects.annotate(key=Lower('name')).values('key')
+               .annotate(total=Count('id')).filter(total__gt=1).values_list('key', flat=True))
+    taken = None
+    for key in list(clashes):
+        if taken is None:
+            taken = {name.lower() for name in Category.objects.values_list('name', flat=True)}
+        keeper, *duplicates = Category.objects.annotate(key=Lower('name')).filter(key=key).order_by('id')
+        for category in duplicates:
+            suffix = 2
+            while True:
+                name = f"{category.name[:max_length - len(str(suffix)) - 3]} ({suffix})"
+                if name.lower() not in taken:
+                    break
+                suffix += 1
+            taken.add(name.lower())
+            print(f"\n  Category {category.pk} {category.name!r} differs from category {keeper.pk} "
+                  f"{keeper.name!r} only in case; renamed to {name!r}", end='')
+            Category.objects.filter(pk=category.pk).update(name=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0011_category_tree'),
+    ]
+
+    operations = [
+        migrations.RunPython(rename_case_duplicates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='category',
+            name='name',
+            field=models.CharField(max_length=100),
+        ),
+        migrations.AddConstraint(
+            model_name='category',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('name'), name='unique_category_name'),
+        ),
+    ]
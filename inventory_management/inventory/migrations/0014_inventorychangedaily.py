@@ -0,0 +1,30 @@
+# Generated by Django 5.1.4 on 2026-10-19 18:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0013_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryChangeDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('change_count', models.PositiveIntegerField(default=0)),
+                ('quantity_added', models.IntegerField(default=0)),
+                ('quantity_removed', models.IntegerField(default=0)),
+                ('net_change', models.IntegerField(default=0)),
+                ('closing_quantity', models.IntegerField()),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_changes', to='inventory.inventoryitem')),
+            ],
+            options={
+                'unique_together': {('item', 'day')},
+            },
+        ),
+    ]
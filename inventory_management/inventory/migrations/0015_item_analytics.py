@@ -0,0 +1,65 @@
+# Generated by Django 5.1.4 on 2026-10-19 18:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0014_inventorychangedaily'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_change_id', models.BigIntegerField()),
+                ('window_start', models.DateTimeField()),
+                ('refreshed_at', models.DateTimeField()),
+                ('stores_refreshed', models.PositiveIntegerField(default=0)),
+                ('full', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ItemAnalytics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField()),
+                ('units_sold', models.IntegerField()),
+                ('velocity', models.FloatField()),
+                ('days_of_cover', models.FloatField(null=True)),
+                ('turnover', models.FloatField(null=True)),
+                ('consumption_value', models.FloatField()),
+                ('abc_class', models.CharField(choices=[('A', 'A - top value share'), ('B', 'B - middle value share'), ('C', 'C - tail value share')], max_length=1)),
+                ('is_dead_stock', models.BooleanField(default=False)),
+                ('last_removed_at', models.DateTimeField(null=True)),
+                ('computed_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='storeinventorychange',
+            index=models.Index(fields=['timestamp'], name='storechange_time_idx'),
+        ),
+        migrations.AddField(
+            model_name='itemanalytics',
+            name='item',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='analytics', to='inventory.inventoryitem'),
+        ),
+        migrations.AddField(
+            model_name='itemanalytics',
+            name='store',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='item_analytics', to='inventory.store'),
+        ),
+        migrations.AddIndex(
+            model_name='itemanalytics',
+            index=models.Index(fields=['last_removed_at'], name='analytics_last_removed_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='itemanalytics',
+            unique_together={('store', 'item')},
+        ),
+    ]
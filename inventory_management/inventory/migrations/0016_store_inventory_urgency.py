@@ -0,0 +1,43 @@
+# Generated by Django 5.1.4 on 2026-10-19 18:15
+
+from django.db import migrations, models
+from django.db.models import Case, F, FloatField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Cast, Greatest
+
+
+def backfill_urgency(apps, schema_editor):
+    """
+    Scores existing rows with the expression of StoreInventory.urgency_expression.
+    """
+    InventoryItem = apps.get_model('inventory', 'InventoryItem')
+    StoreInventory = apps.get_model('inventory', 'StoreInventory')
+    shortfall = (Cast(Greatest(F('reorder_point') - F('quantity'), 0), FloatField())
+                 / Cast(Greatest(F('reorder_point'), 1), FloatField()))
+    low = Case(When(quantity__lte=F('low_stock_threshold'), then=Value(1.0)), default=Value(0.0),
+               output_field=FloatField())
+    price = Subquery(InventoryItem.objects.filter(pk=OuterRef('item_id')).values('price')[:1])
+    StoreInventory.objects.update(urgency=(shortfall + low) * Cast(price, FloatField()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0015_item_analytics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storeinventory',
+            name='urgency',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_urgency, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='storeinventory',
+            index=models.Index(condition=models.Q(('urgency__gt', 0)), fields=['store', '-urgency'], name='storeinv_store_urgency_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='storeinventory',
+            index=models.Index(condition=models.Q(('urgency__gt', 0)), fields=['-urgency'], name='storeinv_urgency_idx'),
+        ),
+    ]
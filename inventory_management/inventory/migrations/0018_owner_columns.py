@@ -0,0 +1,61 @@
+# Generated by Django 5.1.4 on 2026-10-19 18:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models, transaction
+from django.db.models import Max, OuterRef, Subquery
+
+#Rows updated per statement; each batch commits on its own
+BATCH_SIZE = 10000
+
+#Model and the lookup that yields its owner
+OWNER_SOURCES = (
+    ('InventoryChange', 'InventoryItem', 'item_id'),
+    ('StoreInventory', 'Store', 'store_id'),
+    ('InventoryAlert', 'Store', 'store_id'),
+)
+
+
+def backfill_owners(apps, schema_editor):
+    """
+    Copies the owning user onto existing rows in primary key ranges, so no
+    single statement holds locks on a whole table.
+    """
+    for model_name, source_name, column in OWNER_SOURCES:
+        model = apps.get_model('inventory', model_name)
+        source = apps.get_model('inventory', source_name)
+        owner = Subquery(source.objects.filter(pk=OuterRef(column)).values('created_by_id')[:1])
+        high = model.objects.aggregate(high=Max('id'))['high'] or 0
+        for start in range(0, high + 1, BATCH_SIZE):
+            with transaction.atomic():
+                model.objects.filter(id__gte=start, id__lt=start + BATCH_SIZE,
+                                     owner__isnull=True).update(owner=owner)
+
+
+class Migration(migrations.Migration):
+    #The backfill commits batch by batch
+    atomic = False
+
+    dependencies = [
+        ('inventory', '0017_versioned_models'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventorychange',
+            name='owner',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='storeinventory',
+            name='owner',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='inventoryalert',
+            name='owner',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_owners, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.1.4 on 2026-10-19 18:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0018_owner_columns'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='inventorychange',
+            name='owner',
+            field=models.ForeignKey(db_index=False, editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='storeinventory',
+            name='owner',
+            field=models.ForeignKey(db_index=False, editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='inventoryalert',
+            name='owner',
+            field=models.ForeignKey(db_index=False, editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='inventorychange',
+            index=models.Index(fields=['owner', 'id'], name='change_owner_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='storeinventory',
+            index=models.Index(fields=['owner', 'id'], name='storeinv_owner_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='storeinventory',
+            name='storeinv_urgency_idx',
+        ),
+        migrations.AddIndex(
+            model_name='storeinventory',
+            index=models.Index(condition=models.Q(('urgency__gt', 0)), fields=['owner', '-urgency'], name='storeinv_owner_urgency_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventoryalert',
+            index=models.Index(fields=['owner', '-created_at'], name='alert_owner_created_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.4 on 2026-10-19 19:07
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_seq(apps, schema_editor):
+    """
+    Keeps existing clients' cursors valid: the old sequence was the row id.
+    """
+    SyncChange = apps.get_model('inventory', 'SyncChange')
+    SyncChange.objects.using(schema_editor.connection.alias).update(seq=F('id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0019_owner_not_null'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='syncchange',
+            name='syncchange_owner_seq_idx',
+        ),
+        migrations.AddField(
+            model_name='syncchange',
+            name='changed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='syncchange',
+            name='seq',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_seq, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='syncchange',
+            index=models.Index(fields=['owner', 'seq'], name='syncchange_owner_seq_idx'),
+        ),
+    ]
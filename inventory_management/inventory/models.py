@@ -1,18 +1,59 @@
-from django.db import models
+from django.db import models, router, transaction
+from django.db.models import Case, F, FloatField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Cast, Concat, Greatest, Lower, Substr
 from django.contrib.auth import get_user_model
-from django.core.validators import MinValueValidator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
+
+from inventory_management.sharding import current_shard
 
 #Get the active User model as specified in settings.py
 User = get_user_model()
 
 
-class Supplier(models.Model):
+class VersionConflict(Exception):
+    """
+    Raised when a save finds the row changed since the instance was read.
+    """
+
+
+class VersionedModel(models.Model):
+    """
+    Abstract base adding optimistic concurrency control.
+
+    Every UPDATE issued by save() carries `WHERE version = <version read>`
+    and increments the version, so a concurrent change makes the save raise
+    VersionConflict instead of being silently overwritten. Queryset updates
+    that change such rows bump the version with F('version') + 1.
+    """
+    version = models.PositiveIntegerField(default=1, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        version_field = self._meta.get_field('version')
+        values = [value for value in values if value[0] is not version_field]
+        values.append((version_field, None, F('version') + 1))
+        updated = super()._do_update(base_qs.filter(version=self.version), using, pk_val, values,
+                                     update_fields, forced_update)
+        if updated:
+            self.version += 1
+        elif base_qs.filter(pk=pk_val).exists():
+            raise VersionConflict(f"{self._meta.object_name} {pk_val} was changed by another request.")
+        return updated
+
+
+class Supplier(VersionedModel):
     """
     Represents product suppliers with contact details and status tracking.
 
     Relationships:
     - Created by a User (ForeignKey)
     - Has many InventoryItems
+
+    Versioned (see VersionedModel).
     """
     name = models.CharField(max_length=200)
     contact_person = models.CharField(max_length=100)
@@ -32,23 +73,98 @@ class Category(models.Model):
     """
     Product categories for organizing inventory item
 
+    Categories nest through `parent`. Each row stores its materialized
+    path of ancestor ids ("/1/4/9/"), so a whole subtree is one range scan
+    on the path index, and a denormalized count of the items filed
+    directly under it.
+
     Relationship:
     - Has many inventoryItems
+    - Optionally belongs to a parent Category (ForeignKey)
 
     Meta:
     - Sets plural name to "Categories" for admin interface
+    - Names are unique case-insensitively (a unique index on LOWER(name))
     """
-    name = models.CharField(max_length=100, unique=True)
+    name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
+    parent = models.ForeignKey('self', on_delete=models.PROTECT, null=True, blank=True, related_name='children')
+    path = models.CharField(max_length=255, db_index=True, editable=False, default='')
+    item_count = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         verbose_name_plural = "Categories"
+        constraints = [
+            models.UniqueConstraint(Lower('name'), name='unique_category_name'),
+        ]
 
     def __str__(self):
         return self.name
-    
-class InventoryItem(models.Model):
+
+    @staticmethod
+    def path_range(path):
+        #Every descendant path extends `path`; ids are digits, which sort after '/'
+        return {'path__gte': path, 'path__lt': path[:-1] + '0'}
+
+    def subtree(self):
+        """
+        Returns this category and all of its descendants.
+        """
+        return Category.objects.filter(**Category.path_range(self.path))
+
+    def save(self, *args, **kwargs):
+        #Keep this row's path, and its descendants' paths on a move, in step with `parent`
+        with transaction.atomic():
+            old_path = '' if self._state.adding else (
+                Category.objects.select_for_update().filter(pk=self.pk).values_list('path', flat=True).first() or ''
+            )
+            super().save(*args, **kwargs)
+            parent_path = (Category.objects.filter(pk=self.parent_id).values_list('path', flat=True).first()
+                           if self.parent_id else '/')
+            path = f"{parent_path}{self.pk}/"
+            if path != old_path:
+                if old_path:
+                    Category.objects.filter(**Category.path_range(old_path)).update(
+                        path=Concat(Value(path), Substr('path', len(old_path) + 1))
+                    )
+                else:
+                    Category.objects.filter(pk=self.pk).update(path=path)
+                self.path = path
+
+    @staticmethod
+    def move_items(from_id, to_id, count=1, using=None):
+        """
+        Moves `count` items between two categories' item counters.
+
+        The counters live on the database categories are written to. When
+        the items were written on another one (a tenant shard) the counters
+        move once that database's transaction commits, so a rolled back item
+        write leaves them untouched; `manage.py recount_category_items`
+        repairs them if the process dies in between.
+
+        Args:
+            from_id: id of the Category losing the items, or None
+            to_id: id of the Category gaining the items, or None
+            count: int - number of items moved
+            using: alias the items were written on, or None for the categories' own
+        """
+        if from_id == to_id:
+            return
+
+        def move():
+            if from_id is not None:
+                Category.objects.filter(pk=from_id).update(item_count=F('item_count') - count)
+            if to_id is not None:
+                Category.objects.filter(pk=to_id).update(item_count=F('item_count') + count)
+
+        if using is not None and using != router.db_for_write(Category):
+            transaction.on_commit(move, using=using)
+        else:
+            move()
+
+
+class InventoryItem(VersionedModel):
     """
     Core inventory item representing products in stock.
 
@@ -58,6 +174,8 @@ class InventoryItem(models.Model):
     - Supplied by a Supplier (ForeignKey)
     - Has many InventoryChanges
     - Associated with multiple stores through StoreInventory
+
+    Versioned (see VersionedModel).
     """
     name = models.CharField(max_length=200)
     description = models.TextField(blank=True)
@@ -74,6 +192,22 @@ class InventoryItem(models.Model):
     def __str__(self):
         return f"{self.name} - Qty: {self.quantity}"
 
+    def save(self, *args, **kwargs):
+        #Move the item between category counters, and re-score its store rows after
+        #a price change, in the same transaction as the write
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and not {'category', 'category_id', 'price'}.intersection(update_fields):
+            return super().save(*args, **kwargs)
+        with transaction.atomic(using=current_shard()):
+            previous_category, previous_price = (None, None) if self._state.adding else (
+                InventoryItem.objects.select_for_update().filter(pk=self.pk)
+                .values_list('category_id', 'price').first() or (None, None)
+            )
+            super().save(*args, **kwargs)
+            Category.move_items(previous_category, self.category_id, using=self._state.db)
+            if previous_price is not None and previous_price != self.price:
+                StoreInventory.objects.filter(item_id=self.pk).update(urgency=StoreInventory.urgency_expression())
+
 class InventoryChange(models.Model):
     """
     Tracks all changes to inventory item quantities
@@ -81,6 +215,12 @@ class InventoryChange(models.Model):
     Relationship:
     - Belongs to an InventoryItem (ForeignKey)
     - Changed by a User (ForeignKey)
+    - Owned by the item's creator (owner, denormalized so listings filter
+      without joining inventory items)
+
+    Meta:
+    - Indexed on (item, id) so an item's latest change is a single index probe
+    - Indexed on (owner, id) for the per-user change history
     """
     TYPES = (
         ('ADD', 'Stock Added'),
@@ -94,17 +234,60 @@ class InventoryChange(models.Model):
     previous_quantity = models.IntegerField()
     new_quantity = models.IntegerField()
     changed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', editable=False, db_index=False)
     timestamp = models.DateTimeField(auto_now_add=True)
     notes = models.TextField(blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['item', 'id'], name='change_item_latest_idx'),
+            models.Index(fields=['owner', 'id'], name='change_owner_idx'),
+        ]
+
     def __str__(self):
         return f"{self.item.name} - {self.change_type}: {self.quantity_change}"
+
+    def save(self, *args, **kwargs):
+        #Bulk paths set owner_id themselves
+        if self.owner_id is None:
+            self.owner_id = self.item.created_by_id
+        super().save(*args, **kwargs)
+    
+
     
+class InventoryChangeDaily(models.Model):
+    """
+    Per-item, per-day rollup of InventoryChange rows that were archived.
+
+    Written by the archive_inventory_changes command before the raw rows are
+    moved to the archive files, so reports over old periods read one row per
+    item and day instead of every change.
+
+    Relationship:
+    - Belongs to an InventoryItem (ForeignKey)
+
+    Meta:
+    - One row per (item, day)
+    """
+    item = models.ForeignKey(InventoryItem, on_delete=models.CASCADE, related_name='daily_changes')
+    day = models.DateField()
+    change_count = models.PositiveIntegerField(default=0)
+    quantity_added = models.IntegerField(default=0)
+    quantity_removed = models.IntegerField(default=0)
+    net_change = models.IntegerField(default=0)
+    closing_quantity = models.IntegerField()
+
+    class Meta:
+        unique_together = ['item', 'day']
+
+    def __str__(self):
+        return f"{self.item_id} {self.day}: {self.net_change:+d}"
 
     
 class Store(models.Model):
     """
-    Represents physical store locations
+    Represents physical store locations.
+    Latitude/longitude feed the in-memory spatial index used by stores/nearest/
 
     Relationship:
     - Created by a User (ForeginKey)
@@ -115,6 +298,10 @@ class Store(models.Model):
     address = models.TextField()
     contact_number = models.CharField(max_length=20)
     email = models.EmailField()
+    latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True,
+                                   validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True,
+                                    validators=[MinValueValidator(-180), MaxValueValidator(180)])
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -125,7 +312,7 @@ class Store(models.Model):
     
         
     
-class StoreInventory(models.Model):
+class StoreInventory(VersionedModel):
     """
     Manages inventory levels for items at specific stores.
     Includes stock monitoring and reordering Logic
@@ -133,29 +320,94 @@ class StoreInventory(models.Model):
     Relationship:
     - Belongs to a store (ForeignKey)
     - References a InventoryItem (ForeignKey)
+    - Owned by the store's creator (owner, denormalized so listings filter
+      without joining stores)
 
     Properties:
     - is_low_stock: Returnsn True if quantity less than or equal to low_stock_threshold
     - needs_reorder: Returns Ture if quantity less than or equal to reorder_point
+    - available_quantity: quantity on hand minus reserved_quantity (active StockReservations)
+
+    Versioned (see VersionedModel).
+
+    urgency is a stored restock priority (see urgency_score), kept current by
+    save() and by every bulk path that changes quantity, thresholds or the
+    item price, so the most urgent rows are read straight off an index.
 
     Meta:
     - Ensures unique conbination of store and item
     - Sets plural name for admin interface
+    - Indexed on (owner, id) for the per-user listing
+    - Indexes rows with a positive urgency, per store and per owner
 
     """
     store = models.ForeignKey(Store, on_delete=models.CASCADE)
     item = models.ForeignKey(InventoryItem, on_delete=models.CASCADE)
     quantity = models.IntegerField(default=0)
+    reserved_quantity = models.IntegerField(default=0)
     low_stock_threshold = models.IntegerField(default=10)
     reorder_point = models.IntegerField(default=20)
     reorder_quantity = models.IntegerField(default=50)
+    urgency = models.FloatField(default=0, editable=False)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', editable=False, db_index=False)
 
     class Meta:
         unique_together = ['store', 'item']
         verbose_name_plural = 'Store Inventories'
+        indexes = [
+            models.Index(fields=['owner', 'id'], name='storeinv_owner_idx'),
+            #Only rows that need restocking are indexed, most urgent first
+            models.Index(fields=['store', '-urgency'], condition=models.Q(urgency__gt=0),
+                         name='storeinv_store_urgency_idx'),
+            models.Index(fields=['owner', '-urgency'], condition=models.Q(urgency__gt=0),
+                         name='storeinv_owner_urgency_idx'),
+        ]
 
     def __str__(self):
             return f"{self.store.name} - {self.item.name}"
+
+    def save(self, *args, **kwargs):
+        self.urgency = self.urgency_score(self.quantity, self.low_stock_threshold, self.reorder_point,
+                                          self.item.price)
+        #The row may have moved to another store
+        self.owner_id = self.store.created_by_id
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'urgency', 'owner'}
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def urgency_score(quantity, low_stock_threshold, reorder_point, price):
+        """
+        Restock priority of one store item; 0 when it needs no restock.
+
+        The share of the reorder point that is missing, plus 1 once the row
+        is at or below its low stock threshold, weighted by the item price.
+
+        Returns:
+            float: urgency, higher is more urgent
+        """
+        shortfall = max(reorder_point - quantity, 0) / max(reorder_point, 1)
+        low = 1.0 if quantity <= low_stock_threshold else 0.0
+        return (shortfall + low) * float(price)
+
+    @staticmethod
+    def urgency_expression():
+        """
+        urgency_score as a database expression, for queryset.update(urgency=...).
+
+        Must run as its own UPDATE after quantities or thresholds change:
+        expressions in the same UPDATE see the old values.
+        """
+        shortfall = (Cast(Greatest(F('reorder_point') - F('quantity'), 0), FloatField())
+                     / Cast(Greatest(F('reorder_point'), 1), FloatField()))
+        low = Case(When(quantity__lte=F('low_stock_threshold'), then=Value(1.0)), default=Value(0.0),
+                   output_field=FloatField())
+        price = Subquery(InventoryItem.objects.filter(pk=OuterRef('item_id')).values('price')[:1])
+        return (shortfall + low) * Cast(price, FloatField())
+    @property
+    def available_quantity(self):
+        return self.quantity - self.reserved_quantity
     @property
     def is_low_stock(self):
         return self.quantity <= self.low_stock_threshold
@@ -171,9 +423,13 @@ class InventoryAlert(models.Model):
     Relationship:
     - Belongs to a store (ForeginKey)
     - References an InventoryItem (ForeignKey)
+    - Owned by the store's creator (owner, denormalized so listings filter
+      without joining stores)
 
     Meta: 
     - Orders alerts by created_at in desending order
+    - Allows only one unresolved alert per store, item and alert type
+    - Indexed on (owner, -created_at) for the per-user listing
     """
     ALERT_TYPES = (
         ('LOW_STOCK', 'Low Stock Alert'),
@@ -185,17 +441,355 @@ class InventoryAlert(models.Model):
     store = models.ForeignKey(Store, on_delete=models.CASCADE)
     item = models.ForeignKey(InventoryItem, on_delete=models.CASCADE)
     alert_type = models.CharField(max_length=20, choices=ALERT_TYPES)
-    message = models.BooleanField(default=False)
+    message = models.TextField(blank=True)
     is_resolved = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     resolved_at = models.DateTimeField(null=True, blank=True)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', editable=False, db_index=False)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['owner', '-created_at'], name='alert_owner_created_idx'),
+        ]
+        constraints = [
+            #At most one open alert of each type per store and item
+            models.UniqueConstraint(
+                fields=['store', 'item', 'alert_type'],
+                condition=models.Q(is_resolved=False),
+                name='unique_open_alert',
+            ),
+        ]
 
 
     def __str__(self):
         return f"{self.alert_type} - {self.item.name} at {self.store.name}"
+
+    def save(self, *args, **kwargs):
+        #Bulk paths set owner_id themselves
+        if self.owner_id is None:
+            self.owner_id = self.store.created_by_id
+        super().save(*args, **kwargs)
     
 
 
+
+
+class StoreInventoryChange(models.Model):
+    """
+    Ledger of quantity changes to StoreInventory rows (per-store movements).
+
+    Complements InventoryChange, which tracks item-wide totals.
+
+    Relationship:
+    - Belongs to a Store (ForeignKey)
+    - References an InventoryItem (ForeignKey)
+    - Changed by a User (ForeignKey)
+
+    Meta:
+    - Indexed on (store, item, timestamp) so one store item's history never scans other stores' rows
+    - Indexed on timestamp for time-window scans across stores (demand analytics)
+    """
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name='inventory_changes')
+    item = models.ForeignKey(InventoryItem, on_delete=models.CASCADE, related_name='store_changes')
+    change_type = models.CharField(max_length=6, choices=InventoryChange.TYPES)
+    quantity_change = models.IntegerField()
+    previous_quantity = models.IntegerField()
+    new_quantity = models.IntegerField()
+    changed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    timestamp = models.DateTimeField(auto_now_add=True)
+    notes = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['store', 'item', 'timestamp'], name='storechange_history_idx'),
+            models.Index(fields=['timestamp'], name='storechange_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"Store {self.store_id} item {self.item_id} - {self.change_type}: {self.quantity_change}"
+
+
+class StockLot(models.Model):
+    """
+    A received lot of an item at a store, with its expiry date.
+
+    Stock leaves lots first-expired-first-out (see lots.LotManager.deplete).
+
+    Relationship:
+    - Belongs to a Store (ForeignKey)
+    - References an InventoryItem (ForeignKey)
+
+    Meta:
+    - Ensures unique lot codes per store and item
+    - Partial index on expiry_date over lots with stock left, used by the expiry sweeper
+    - Index on (store, item, expiry_date) for FEFO depletion
+    """
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name='lots')
+    item = models.ForeignKey(InventoryItem, on_delete=models.CASCADE, related_name='lots')
+    lot_code = models.CharField(max_length=100)
+    quantity = models.IntegerField(validators=[MinValueValidator(0)])
+    expiry_date = models.DateField()
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['store', 'item', 'lot_code']
+        indexes = [
+            models.Index(fields=['expiry_date'], condition=models.Q(quantity__gt=0), name='stocklot_expiry_idx'),
+            models.Index(fields=['store', 'item', 'expiry_date'], name='stocklot_fefo_idx'),
+        ]
+
+    def __str__(self):
+        return f"Lot {self.lot_code} - item {self.item_id} at store {self.store_id}: {self.quantity} (exp. {self.expiry_date})"
+
+
+class StockReservation(models.Model):
+    """
+    A temporary hold on store stock, e.g. for an online order awaiting payment.
+
+    Reserving raises StoreInventory.reserved_quantity without touching the
+    quantity on hand; committing turns the hold into a real stock removal,
+    releasing or expiring it gives the units back.
+
+    Relationship:
+    - Belongs to a Store (ForeignKey)
+    - References an InventoryItem (ForeignKey)
+    - Created by a User (ForeignKey)
+
+    Meta:
+    - Partial index on expires_at over active holds, used by the expiry sweeper
+    """
+    STATUSES = (
+        ('ACTIVE', 'Active'),
+        ('COMMITTED', 'Committed'),
+        ('RELEASED', 'Released'),
+        ('EXPIRED', 'Expired'),
+    )
+
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name='reservations')
+    item = models.ForeignKey(InventoryItem, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.IntegerField(validators=[MinValueValidator(1)])
+    status = models.CharField(max_length=10, choices=STATUSES, default='ACTIVE')
+    reference = models.CharField(max_length=100, blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reservations')
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+    closed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['expires_at'], condition=models.Q(status='ACTIVE'), name='reservation_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"Reservation #{self.pk}: {self.quantity} x item {self.item_id} at store {self.store_id} ({self.status})"
+
+
+class StockCount(models.Model):
+    """
+    A cycle-count (stocktake) session.
+
+    Counters upload absolute counted quantities as StockCountLines. A count
+    with a store compares against StoreInventory quantities at that store,
+    a count without one compares against InventoryItem quantities.
+
+    Relationship:
+    - Optionally belongs to a Store (ForeignKey)
+    - Created by a User (ForeignKey)
+    - Approved by a User (ForeignKey)
+    - Has many StockCountLines
+    """
+    STATUSES = (
+        ('OPEN', 'Open'),
+        ('APPROVED', 'Approved'),
+        ('CANCELLED', 'Cancelled'),
+    )
+
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, null=True, blank=True, related_name='stock_counts')
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='stock_counts')
+    status = models.CharField(max_length=10, choices=STATUSES, default='OPEN')
+    notes = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    approved_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    approved_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Stock count #{self.pk} ({self.status})"
+
+
+class StockCountLine(models.Model):
+    """
+    One counted item within a StockCount.
+
+    system_quantity and variance are snapshotted when the count is approved;
+    a null system_quantity on a store count means the store had no
+    StoreInventory row for the item.
+
+    Relationship:
+    - Belongs to a StockCount (ForeignKey)
+    - References an InventoryItem (ForeignKey)
+
+    Meta:
+    - Ensures one line per item per count
+    """
+    count = models.ForeignKey(StockCount, on_delete=models.CASCADE, related_name='lines')
+    item = models.ForeignKey(InventoryItem, on_delete=models.CASCADE)
+    counted_quantity = models.IntegerField(validators=[MinValueValidator(0)])
+    system_quantity = models.IntegerField(null=True, blank=True)
+    variance = models.IntegerField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ['count', 'item']
+
+    def __str__(self):
+        return f"Count #{self.count_id} - item {self.item_id}: {self.counted_quantity}"
+
+
+class SyncChange(models.Model):
+    """
+    Change log used by the delta-sync endpoint for offline clients.
+
+    Holds one row per synced object. Every save or delete upserts that row
+    with a new `seq` from an increasing change sequence (see
+    inventory.sync.allocate_sequence), so a client that last synced at
+    sequence N only reads rows with seq > N. Deleted objects keep a
+    tombstone row (is_deleted=True). `changed_at` tells when the sequence
+    number was taken; the sync cursor only moves past settled rows.
+
+    Relationship:
+    - Visible to an owner User (ForeignKey), null for shared rows such as Categories
+
+    Meta:
+    - One row per (model, object_id)
+    - Indexed on (owner, seq) for per-user range scans
+    """
+    MODELS = (
+        ('category', 'Category'),
+        ('inventoryitem', 'Inventory Item'),
+        ('storeinventory', 'Store Inventory'),
+        ('inventoryalert', 'Inventory Alert'),
+    )
+
+    model = models.CharField(max_length=20, choices=MODELS)
+    object_id = models.BigIntegerField()
+    #No database constraint: tombstones are written while an owner's rows are being cascade-deleted
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, null=True, db_constraint=False, related_name='+')
+    is_deleted = models.BooleanField(default=False)
+    seq = models.BigIntegerField(default=0)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ['model', 'object_id']
+        indexes = [
+            models.Index(fields=['owner', 'seq'], name='syncchange_owner_seq_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.seq}: {self.model} {self.object_id}{' (deleted)' if self.is_deleted else ''}"
+
+
+class OutboxEvent(models.Model):
+    """
+    Transactional outbox of stock events for downstream systems.
+
+    Rows are written in the same transaction as the InventoryChange,
+    StoreInventory or InventoryAlert write they describe, so an event exists
+    if and only if its change committed. The auto-incrementing id orders
+    events; the dispatch_outbox command delivers them in that order and
+    removes them once every destination has acknowledged them.
+    """
+    topic = models.CharField(max_length=50)
+    object_id = models.BigIntegerField()
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.id}: {self.topic} {self.object_id}"
+
+
+class OutboxCursor(models.Model):
+    """
+    Delivery position and lease of one outbox destination.
+
+    A dispatcher takes the lease with a conditional UPDATE before sending a
+    batch, so each destination is served by one dispatcher at a time and
+    receives events strictly in id order. Failed batches push
+    next_attempt_at back with exponential backoff.
+    """
+    destination = models.CharField(max_length=100, unique=True)
+    last_event_id = models.BigIntegerField(default=0)
+    lease_owner = models.CharField(max_length=100, blank=True)
+    leased_until = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"{self.destination} @ {self.last_event_id}"
+
+
+class ItemAnalytics(models.Model):
+    """
+    Cached demand analytics for one store item.
+
+    Computed from REMOVE movements in the StoreInventoryChange ledger over
+    the trailing analytics window and refreshed incrementally by the
+    refresh_item_analytics command (see inventory.analytics).
+
+    Relationship:
+    - Belongs to a Store (ForeignKey)
+    - References an InventoryItem (ForeignKey)
+
+    Meta:
+    - One row per (store, item)
+    - Indexed on last_removed_at to find rows turning into dead stock
+    """
+    ABC_CLASSES = (
+        ('A', 'A - top value share'),
+        ('B', 'B - middle value share'),
+        ('C', 'C - tail value share'),
+    )
+
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name='item_analytics')
+    item = models.ForeignKey(InventoryItem, on_delete=models.CASCADE, related_name='analytics')
+    quantity = models.IntegerField()
+    units_sold = models.IntegerField()
+    velocity = models.FloatField()
+    days_of_cover = models.FloatField(null=True)
+    turnover = models.FloatField(null=True)
+    consumption_value = models.FloatField()
+    abc_class = models.CharField(max_length=1, choices=ABC_CLASSES)
+    is_dead_stock = models.BooleanField(default=False)
+    last_removed_at = models.DateTimeField(null=True)
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ['store', 'item']
+        indexes = [
+            models.Index(fields=['last_removed_at'], name='analytics_last_removed_idx'),
+        ]
+
+    def __str__(self):
+        return f"Store {self.store_id} item {self.item_id}: {self.abc_class}, {self.velocity:.2f}/day"
+
+
+class AnalyticsRun(models.Model):
+    """
+    One refresh of ItemAnalytics; the latest row is the incremental watermark.
+
+    Stores the highest StoreInventoryChange id and the window start the run
+    covered, so the next run only recomputes stores with newer movements or
+    with movements that have since slid out of the window.
+    """
+    last_change_id = models.BigIntegerField()
+    window_start = models.DateTimeField()
+    refreshed_at = models.DateTimeField()
+    stores_refreshed = models.PositiveIntegerField(default=0)
+    full = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f"Analytics run {self.refreshed_at:%Y-%m-%d %H:%M} @ {self.last_change_id}"
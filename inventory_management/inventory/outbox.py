@@ -0,0 +1,246 @@
+"""
+Transactional outbox for downstream inventory events.
+
+Writers call `publish` inside the transaction that changes stock, so an
+event is durable exactly when its change commits. Single-object saves and
+deletes are published by the receivers below; bulk paths (bulk_create,
+queryset updates) call `publish` themselves.
+
+`OutboxDispatcher` (run by the dispatch_outbox command) delivers events to
+the destinations in settings.OUTBOX at least once and in id order per
+destination. Consumers should de-duplicate on the event id.
+"""
+import json
+import logging
+import os
+import random
+import socket
+import uuid
+from datetime import timedelta
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Min, Q
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import InventoryAlert, InventoryChange, OutboxCursor, OutboxEvent, StoreInventory
+
+logger = logging.getLogger(__name__)
+
+#Topic prefix of each published model; events are "<prefix>.saved" or "<prefix>.deleted"
+TOPICS = {
+    InventoryChange: 'inventory_change',
+    StoreInventory: 'store_inventory',
+    InventoryAlert: 'inventory_alert',
+}
+
+
+def event_payload(instance):
+    """
+    Returns the concrete field values of `instance` keyed by attribute name.
+    """
+    return {field.attname: field.value_from_object(instance) for field in instance._meta.concrete_fields}
+
+
+def event_message(event):
+    """
+    Returns the JSON-ready form of an OutboxEvent that sinks deliver.
+    """
+    return {'id': event.id, 'topic': event.topic, 'object_id': event.object_id,
+            'payload': event.payload, 'created_at': event.created_at}
+
+
+def publish(model, objects, action='saved'):
+    """
+    Writes one outbox event per object with a single bulk INSERT.
+
+    Call inside the transaction that made the change.
+
+    Args:
+        model: One of the models in TOPICS
+        objects: Iterable of saved instances (a queryset is read once)
+        action: 'saved' or 'deleted'
+    """
+    topic = f"{TOPICS[model]}.{action}"
+    OutboxEvent.objects.bulk_create(
+        [OutboxEvent(topic=topic, object_id=obj.pk, payload=event_payload(obj)) for obj in objects],
+        batch_size=2000,
+    )
+
+
+@receiver(post_save, sender=InventoryChange)
+@receiver(post_save, sender=StoreInventory)
+@receiver(post_save, sender=InventoryAlert)
+def handle_published_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        publish(sender, [instance])
+
+
+@receiver(post_delete, sender=InventoryChange)
+@receiver(post_delete, sender=StoreInventory)
+@receiver(post_delete, sender=InventoryAlert)
+def handle_published_delete(sender, instance, **kwargs):
+    publish(sender, [instance], action='deleted')
+
+
+class HttpSink:
+    """
+    POSTs each batch as {"destination": ..., "events": [...]} JSON to a webhook.
+
+    Any non-2xx response or network error fails the whole batch.
+    """
+    def __init__(self, name, url, headers=None, timeout=10):
+        self.name = name
+        self.url = url
+        self.headers = {'Content-Type': 'application/json', **(headers or {})}
+        self.timeout = timeout
+
+    def send(self, events):
+        body = json.dumps({'destination': self.name, 'events': events}, cls=DjangoJSONEncoder).encode()
+        with urlopen(Request(self.url, data=body, headers=self.headers, method='POST'), timeout=self.timeout) as response:
+            if not 200 <= response.status < 300:
+                raise OSError(f"{self.url} answered {response.status}")
+
+
+class FileSink:
+    """
+    Appends each event as one JSON line to a local file and fsyncs it.
+    """
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+
+    def send(self, events):
+        with open(self.path, 'a', encoding='utf-8') as output:
+            for event in events:
+                output.write(json.dumps(event, cls=DjangoJSONEncoder) + '\n')
+            output.flush()
+            os.fsync(output.fileno())
+
+
+def build_sink(name, config):
+    """
+    Creates the sink for one settings.OUTBOX['DESTINATIONS'] entry.
+    """
+    if config.get('URL'):
+        return HttpSink(name, config['URL'], config.get('HEADERS'), config.get('TIMEOUT', 10))
+    if config.get('PATH'):
+        return FileSink(name, config['PATH'])
+    raise ImproperlyConfigured(f"Outbox destination {name!r} needs a URL or a PATH.")
+
+
+def outbox_settings():
+    return {'DESTINATIONS': {}, 'BATCH_SIZE': 100, 'LEASE_SECONDS': 60, 'MAX_BACKOFF_SECONDS': 300,
+            'SETTLE_SECONDS': 30, 'ARCHIVE_DIR': None, **getattr(settings, 'OUTBOX', {})}
+
+
+class OutboxDispatcher:
+    """
+    Delivers outbox events to every configured destination.
+
+    Each destination has an OutboxCursor. A dispatcher leases the cursor with
+    a conditional UPDATE, sends the next batch after it, and advances it only
+    while still holding the lease, so several dispatcher processes can run
+    side by side without reordering or double-advancing a destination. A
+    failing batch blocks its destination (preserving order) and is retried
+    with exponential backoff; other destinations are unaffected.
+    """
+    def __init__(self, destinations=None):
+        config = outbox_settings()
+        self.batch_size = config['BATCH_SIZE']
+        self.lease = timedelta(seconds=config['LEASE_SECONDS'])
+        self.max_backoff = config['MAX_BACKOFF_SECONDS']
+        self.settle = timedelta(seconds=config['SETTLE_SECONDS'])
+        self.archive_dir = config['ARCHIVE_DIR']
+        self.sinks = {name: build_sink(name, options) for name, options in config['DESTINATIONS'].items()
+                      if destinations is None or name in destinations}
+        self.topics = {name: tuple(options.get('TOPICS') or ()) for name, options in config['DESTINATIONS'].items()}
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def _claim(self, name):
+        #Take the destination's lease if it is free and not backing off
+        OutboxCursor.objects.get_or_create(destination=name)
+        now = timezone.now()
+        claimed = OutboxCursor.objects.filter(
+            Q(leased_until__isnull=True) | Q(leased_until__lt=now),
+            Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now),
+            destination=name,
+        ).update(lease_owner=self.owner, leased_until=now + self.lease)
+        return OutboxCursor.objects.get(destination=name) if claimed else None
+
+    def _release(self, name, **fields):
+        #Only the current lease holder may move the cursor
+        return OutboxCursor.objects.filter(destination=name, lease_owner=self.owner).update(
+            lease_owner='', leased_until=None, **fields
+        )
+
+    def _settled(self, last_event_id, events):
+        #Ids are allocated before commit, so a hole may be a transaction that has
+        #not committed yet. Stop at a hole until it is SETTLE_SECONDS old; after
+        #that it is taken to be a rollback and skipped.
+        settled_before = timezone.now() - self.settle
+        batch = []
+        expected = last_event_id + 1
+        for event in events:
+            if event.id != expected and event.created_at > settled_before:
+                break
+            batch.append(event)
+            expected = event.id + 1
+        return batch
+
+    def deliver(self, name):
+        """
+        Sends the next batch of events to one destination.
+
+        Returns:
+            int: events the cursor moved past, delivered or filtered out (0 if nothing moved)
+        """
+        cursor = self._claim(name)
+        if cursor is None:
+            return 0
+        batch = self._settled(cursor.last_event_id,
+                              OutboxEvent.objects.filter(id__gt=cursor.last_event_id).order_by('id')[:self.batch_size])
+        if not batch:
+            self._release(name)
+            return 0
+
+        prefixes = self.topics.get(name)
+        events = [event_message(event) for event in batch if not prefixes or event.topic.startswith(prefixes)]
+        try:
+            if events:
+                self.sinks[name].send(events)
+        except Exception as exc:
+            attempts = cursor.attempts + 1
+            delay = min(self.max_backoff, 2 ** attempts) * random.uniform(0.5, 1.0)
+            logger.warning("Outbox delivery to %s failed (attempt %d): %s", name, attempts, exc)
+            self._release(name, attempts=attempts, last_error=str(exc)[:2000],
+                          next_attempt_at=timezone.now() + timedelta(seconds=delay))
+            return 0
+
+        self._release(name, last_event_id=batch[-1].id, attempts=0, next_attempt_at=None, last_error='')
+        return len(batch)
+
+    def purge(self, batch_size=5000):
+        """
+        Deletes (or archives, then deletes) events every destination has acknowledged.
+
+        Returns:
+            int: number of events removed
+        """
+        acknowledged = OutboxCursor.objects.filter(destination__in=self.topics).aggregate(low=Min('last_event_id'))['low']
+        if acknowledged is None or OutboxCursor.objects.filter(destination__in=self.topics).count() < len(self.topics):
+            #A destination that has never run still needs every retained event
+            return 0
+        removed = 0
+        while True:
+            batch = list(OutboxEvent.objects.filter(id__lte=acknowledged).order_by('id')[:batch_size])
+            if not batch:
+                return removed
+            if self.archive_dir:
+                path = os.path.join(self.archive_dir, f"outbox-{timezone.now():%Y%m%d}.jsonl")
+                FileSink('archive', path).send([event_message(event) for event in batch])
+            removed += OutboxEvent.objects.filter(id__gte=batch[0].id, id__lte=batch[-1].id).delete()[0]
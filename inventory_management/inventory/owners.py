@@ -0,0 +1,68 @@
+"""
+Consistency of the denormalized `owner` columns.
+
+StoreInventory, InventoryAlert and InventoryChange copy their owning user
+onto the row so per-user listings filter on (owner, ...) indexes instead of
+joining stores or items. The owner is set by save() and explicitly by every
+bulk write path; `check_owners` finds rows whose copy disagrees with its
+source and, with `fix`, rewrites them.
+"""
+from django.db import transaction
+from django.db.models import F, Max, OuterRef, Subquery
+
+from inventory_management.sharding import current_shard
+
+from .models import InventoryAlert, InventoryChange, InventoryItem, Store, StoreInventory
+from .sync import SYNCED_MODELS, record_changes
+
+#Model -> (model holding the owner, column pointing at it)
+OWNER_SOURCES = {
+    StoreInventory: (Store, 'store_id'),
+    InventoryAlert: (Store, 'store_id'),
+    InventoryChange: (InventoryItem, 'item_id'),
+}
+
+
+def owner_expression(model):
+    """
+    The owner a row of `model` should have, as a subquery for filter() and update().
+    """
+    source, column = OWNER_SOURCES[model]
+    return Subquery(source.objects.filter(pk=OuterRef(column)).values('created_by_id')[:1])
+
+
+def check_owners(fix=False, batch_size=10000):
+    """
+    Compares every row's owner with its store's or item's creator.
+
+    Rows are scanned in primary key ranges of `batch_size`; with `fix`, each
+    range's mismatches are corrected in its own transaction.
+
+    Returns:
+        dict: model name -> number of mismatched rows
+    """
+    mismatched = {}
+    for model in OWNER_SOURCES:
+        found = 0
+        high = model.objects.aggregate(high=Max('id'))['high'] or 0
+        for start in range(0, high + 1, batch_size):
+            with transaction.atomic(using=current_shard()):
+                rows = (model.objects.filter(id__gte=start, id__lt=start + batch_size)
+                        .annotate(expected_owner=owner_expression(model)).exclude(owner_id=F('expected_owner')))
+                ids = list(rows.values_list('id', flat=True))
+                found += len(ids)
+                if fix and ids:
+                    _fix(model, ids)
+        mismatched[model.__name__] = found
+    return mismatched
+
+
+def _fix(model, ids):
+    values = {'owner_id': owner_expression(model)}
+    if model is StoreInventory:
+        values['version'] = F('version') + 1
+    fixed = model.objects.filter(id__in=ids)
+    fixed.update(**values)
+    #A new owner changes who the rows are synced to
+    if model in SYNCED_MODELS:
+        record_changes(model, fixed.values_list('id', 'owner_id'))
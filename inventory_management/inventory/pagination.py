@@ -0,0 +1,273 @@
+"""
+Row counts that stay cheap on very large tables.
+
+An exact COUNT(*) reads every matching row. `bounded_count` first counts at
+most ESTIMATED_COUNT_THRESHOLD + 1 rows; only when there are more than that
+does it fall back to the planner's estimate:
+
+    PostgreSQL  pg_class.reltuples for a whole table, the EXPLAIN row
+                estimate for a filtered queryset
+    SQLite      the row count ANALYZE stored in sqlite_stat1 for a whole
+                table; for equality filters (owner=..., item=...), the
+                average rows per key of the index they lead
+
+Without an estimate (other SQLite filters, tables never analyzed) the exact
+count is used straight away, without the probe, so results are never
+wrong, only slower.
+
+API lists page with EstimatedCountPagination, which reports
+`count_is_estimate` and honours `?count=exact`. ConcatenatedRows pages a
+list of rows read from elsewhere (e.g. the change archive) and a queryset
+as one sequence, so counts and page links cover both.
+"""
+import json
+
+from django.conf import settings
+from django.core.paginator import EmptyPage, Paginator
+from django.db import DatabaseError, connections
+from django.db.models.expressions import Col
+from django.db.models.sql.where import AND, WhereNode
+from django.utils.functional import cached_property
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+
+
+def count_threshold():
+    return getattr(settings, 'ESTIMATED_COUNT_THRESHOLD', 10000)
+
+
+def estimated_count(queryset):
+    """
+    Returns the database's row estimate for `queryset`, or None if it has none.
+    """
+    connection = connections[queryset.db]
+    filtered = bool(queryset.query.where) or queryset.query.distinct
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                if not filtered:
+                    cursor.execute("SELECT reltuples FROM pg_class WHERE oid = to_regclass(%s)",
+                                   [connection.ops.quote_name(queryset.model._meta.db_table)])
+                    row = cursor.fetchone()
+                    #reltuples is -1 until the table is first vacuumed or analyzed
+                    return int(row[0]) if row and row[0] >= 0 else None
+                sql, params = queryset.order_by().query.sql_with_params()
+                cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                return int(plan[0]['Plan']['Plan Rows'])
+            if connection.vendor == 'sqlite' and not queryset.query.distinct:
+                return _sqlite_estimate(connection, cursor, queryset, filtered)
+    except DatabaseError:
+        #sqlite_stat1 does not exist until the first ANALYZE
+        return None
+    return None
+
+
+def _equality_columns(queryset):
+    #Columns of the queryset's own table that its AND-ed filters compare with a plain value
+    columns = set()
+    nodes = [queryset.query.where]
+    while nodes:
+        node = nodes.pop()
+        if node.connector != AND or node.negated:
+            continue
+        for child in node.children:
+            if isinstance(child, WhereNode):
+                nodes.append(child)
+            elif (getattr(child, 'lookup_name', None) == 'exact' and isinstance(child.lhs, Col)
+                    and child.lhs.alias == queryset.query.base_table
+                    and not hasattr(child.rhs, 'resolve_expression')):
+                columns.add(child.lhs.target.column)
+    return columns
+
+
+def _sqlite_estimate(connection, cursor, queryset, filtered):
+    """
+    Estimates from sqlite_stat1. Each entry reads "<rows> <rows per key of
+    the first column> <... of the first two columns> ...", so a filter on
+    the leading columns of an index matches about that many rows (more when
+    it has further conditions).
+    """
+    table = queryset.model._meta.db_table
+    cursor.execute("SELECT idx, stat FROM sqlite_stat1 WHERE tbl = %s", [table])
+    entries = [(index, [int(number) for number in stat.split() if number.isdigit()])
+               for index, stat in cursor.fetchall()]
+    if not entries:
+        return None
+    if not filtered:
+        #The first number of every entry is the table's (or index's) row count
+        return max(numbers[0] for _, numbers in entries)
+    columns = _equality_columns(queryset)
+    if not columns:
+        return None
+    estimates = []
+    for index, numbers in entries:
+        if not index or index == table:
+            continue
+        cursor.execute(f"PRAGMA index_info({connection.ops.quote_name(index)})")
+        leading = 0
+        for _, _, name in sorted(cursor.fetchall()):
+            if name not in columns:
+                break
+            leading += 1
+        if 0 < leading < len(numbers):
+            estimates.append(numbers[leading])
+    return min(estimates) if estimates else None
+
+
+def bounded_count(queryset, threshold=None, exact=False):
+    """
+    Counts `queryset`, estimating when it holds more than `threshold` rows.
+
+    Args:
+        queryset: QuerySet to count
+        threshold: rows counted exactly (default ESTIMATED_COUNT_THRESHOLD)
+        exact: always run the full COUNT(*)
+
+    Returns:
+        tuple: (count, is_estimate)
+    """
+    if exact:
+        return queryset.count(), False
+    #Without an estimate to fall back on, probing first would only add a scan to the full count
+    estimate = estimated_count(queryset)
+    if estimate is None:
+        return queryset.count(), False
+    threshold = count_threshold() if threshold is None else threshold
+    #COUNT over a LIMITed subquery stops reading after threshold + 1 rows
+    probe = queryset.order_by()[:threshold + 1].count()
+    if probe <= threshold:
+        return probe, False
+    #Statistics may be stale; never report fewer rows than were just seen
+    return max(estimate, probe), True
+
+
+class ConcatenatedRows:
+    """
+    A list of rows and a queryset paged as one sequence.
+
+    The list comes first, or last with `rows_first=False`. Slices only read
+    the queryset rows they cover, and the queryset is counted with
+    `bounded_count`.
+    """
+    def __init__(self, rows, queryset, rows_first=True):
+        self.rows = rows
+        self.queryset = queryset
+        self.rows_first = rows_first
+
+    def bounded_count(self, exact=False):
+        count, is_estimate = bounded_count(self.queryset, exact=exact)
+        return len(self.rows) + count, is_estimate
+
+    def count(self):
+        return self.bounded_count(exact=True)[0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start = index.start or 0
+        stop = self.count() if index.stop is None else index.stop
+        if stop <= start:
+            return []
+        if self.rows_first:
+            head = self.rows[start:stop]
+            if stop <= len(self.rows):
+                return head
+            return head + list(self.queryset[max(start - len(self.rows), 0):stop - len(self.rows)])
+        selected = list(self.queryset[start:stop])
+        if len(selected) == stop - start:
+            return selected
+        #The queryset ends in this slice; its length is only counted when the slice starts past it
+        live = start + len(selected) if selected else self.queryset.count()
+        return selected + self.rows[max(start - live, 0):stop - live]
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator whose count comes from `bounded_count`.
+
+    Used by the admin changelists of the large inventory tables and by
+    EstimatedCountPagination; `count_is_estimate` tells whether the total is
+    approximate.
+    """
+    count_is_estimate = False
+
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True, exact=False):
+        super().__init__(object_list, per_page, orphans, allow_empty_first_page)
+        self.exact = exact
+
+    @cached_property
+    def count(self):
+        if isinstance(self.object_list, ConcatenatedRows):
+            count, self.count_is_estimate = self.object_list.bounded_count(exact=self.exact)
+            return count
+        if not hasattr(self.object_list, 'query'):
+            return super().count
+        count, self.count_is_estimate = bounded_count(self.object_list, exact=self.exact)
+        return count
+
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            #An estimated total may be low; pages past it are checked when read
+            if self.count_is_estimate and int(number) > 1:
+                return int(number)
+            raise
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.count_is_estimate:
+            return super().page(number)
+        #Read one row past the page instead of trusting the estimate for has_next()
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage(self.error_messages['no_results'])
+        page = self._get_page(rows[:self.per_page], number, self)
+        page.has_next = lambda: len(rows) > self.per_page
+        return page
+
+
+class EstimatedCountPagination(PageNumberPagination):
+    """
+    Page number pagination with estimated totals on large results.
+
+    Responses carry `count_is_estimate`; `?count=exact` forces a full count.
+    Unordered querysets are paged in primary key order so pages are stable.
+    """
+    count_query_param = 'count'
+    exact_count = False
+
+    def django_paginator_class(self, object_list, per_page):
+        return EstimatedCountPaginator(object_list, per_page, exact=self.exact_count)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.exact_count = request.query_params.get(self.count_query_param) == 'exact'
+        if hasattr(queryset, 'ordered') and not queryset.ordered:
+            queryset = queryset.order_by('pk')
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_count_data(self):
+        """
+        Returns the count, estimate flag and page links for a custom response envelope.
+        """
+        return {
+            'count': self.page.paginator.count,
+            'count_is_estimate': self.page.paginator.count_is_estimate,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+        }
+
+    def get_paginated_response(self, data):
+        return Response({**self.get_count_data(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['count_is_estimate'] = {'type': 'boolean', 'example': False}
+        return response_schema
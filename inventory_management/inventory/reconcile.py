@@ -0,0 +1,101 @@
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+
+from inventory_management.sharding import current_shard
+
+from .models import InventoryChange, InventoryItem, StoreInventory
+from .sync import record_changes
+from .outbox import publish
+
+
+#Discrepancy codes reported per item
+STORE_MISMATCH = 'item_vs_stores'
+LEDGER_MISMATCH = 'item_vs_ledger'
+
+
+def reconcile_range(start_id, end_id, fix=False, fixed_by_id=None):
+    """
+    Compares the three quantity sources for items with start_id <= id < end_id.
+
+    Uses two set-based queries per range: the items with their latest ledger
+    new_quantity (an index probe per item on (item, id)), and the store
+    quantity totals grouped by item.
+
+    With `fix`, items whose quantity disagrees with their store total are set
+    to that total (store rows are the physical truth), and every corrected or
+    ledger-mismatched item gets an ADJUST InventoryChange re-anchoring its
+    ledger, written with one bulk_create.
+
+    Args:
+        start_id: int - first item id of the range
+        end_id: int - item id just past the range
+        fix: bool - write corrections
+        fixed_by_id: optional User id recorded on corrective changes
+
+    Returns:
+        list: dicts with item, item_quantity, store_total, ledger_quantity,
+        issues and, with `fix`, fixed_quantity
+    """
+    with transaction.atomic(using=current_shard()):
+        latest = InventoryChange.objects.filter(item=OuterRef('pk')).order_by('-id').values('new_quantity')[:1]
+        items = InventoryItem.objects.filter(id__gte=start_id, id__lt=end_id)
+        if fix:
+            items = items.select_for_update()
+        rows = items.annotate(ledger_quantity=Subquery(latest)).values_list('id', 'quantity', 'ledger_quantity')
+
+        store_totals = {
+            row['item_id']: row['total'] for row in
+            StoreInventory.objects.filter(item_id__gte=start_id, item_id__lt=end_id)
+            .values('item_id').annotate(total=Sum('quantity')).order_by()
+        }
+
+        discrepancies = []
+        for item_id, quantity, ledger_quantity in rows:
+            store_total = store_totals.get(item_id)
+            issues = []
+            if store_total is not None and store_total != quantity:
+                issues.append(STORE_MISMATCH)
+            if ledger_quantity is not None and ledger_quantity != quantity:
+                issues.append(LEDGER_MISMATCH)
+            if issues:
+                discrepancies.append({
+                    'item': item_id,
+                    'item_quantity': quantity,
+                    'store_total': store_total,
+                    'ledger_quantity': ledger_quantity,
+                    'issues': issues,
+                })
+
+        if fix and discrepancies:
+            _apply_fixes(discrepancies, fixed_by_id)
+    return discrepancies
+
+
+def _apply_fixes(discrepancies, fixed_by_id):
+    owners = dict(InventoryItem.objects.filter(id__in=[row['item'] for row in discrepancies])
+                  .values_list('id', 'created_by_id'))
+    corrections = []
+    for row in discrepancies:
+        target = row['store_total'] if STORE_MISMATCH in row['issues'] else row['item_quantity']
+        #Re-anchor the ledger from its last recorded quantity (or the item's, if there is none)
+        previous = row['ledger_quantity'] if row['ledger_quantity'] is not None else row['item_quantity']
+        row['fixed_quantity'] = target
+        corrections.append(InventoryChange(
+            item_id=row['item'],
+            change_type='ADJUST',
+            quantity_change=target - previous,
+            previous_quantity=previous,
+            new_quantity=target,
+            changed_by_id=fixed_by_id,
+            owner_id=owners[row['item']],
+            notes='reconcile_stock correction',
+        ))
+    publish(InventoryChange, InventoryChange.objects.bulk_create(corrections, batch_size=2000))
+
+    store_fixed = [row['item'] for row in discrepancies if STORE_MISMATCH in row['issues']]
+    if store_fixed:
+        total = (StoreInventory.objects.filter(item_id=OuterRef('pk'))
+                 .order_by().values('item_id').annotate(total=Sum('quantity')).values('total'))
+        fixed_items = InventoryItem.objects.filter(id__in=store_fixed)
+        fixed_items.update(quantity=Subquery(total), version=F('version') + 1)
+        record_changes(InventoryItem, fixed_items.values_list('id', 'created_by_id'))
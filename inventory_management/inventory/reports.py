@@ -56,7 +56,7 @@ class InventoryReport:
         """
 
         #filter inventory items by user's stores
-        queryset = StoreInventory.objects.filter(store__created_by=self.user)
+        queryset = StoreInventory.objects.filter(owner=self.user)
 
         #Apply store filter if specified
         if self.store:
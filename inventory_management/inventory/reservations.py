@@ -0,0 +1,178 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from inventory_management.sharding import current_shard
+
+from .models import InventoryChange, InventoryItem, StockReservation, StoreInventory
+from .sync import record_changes
+from .outbox import publish
+from .ledger import store_change, record_store_changes
+from .lots import LotManager
+
+
+class ReservationError(Exception):
+    """
+    Raised when a reservation cannot be placed, committed or released.
+    """
+
+
+class ReservationManager:
+    """
+    Places and settles stock holds using conditional UPDATEs instead of locks.
+
+    Every transition is a single UPDATE whose WHERE clause re-checks the
+    precondition (enough available stock, hold still active), so concurrent
+    callers can never oversell or settle a hold twice; the loser simply
+    updates zero rows.
+    """
+    @staticmethod
+    def reserve(user, store_id, item_id, quantity, ttl_seconds=None, reference=''):
+        """
+        Holds `quantity` units of an item at one of the user's stores.
+
+        Returns:
+            StockReservation: the new ACTIVE reservation
+
+        Raises:
+            ReservationError: if the store does not stock enough available units
+        """
+        ttl = ttl_seconds or getattr(settings, 'RESERVATION_TTL_SECONDS', 900)
+        with transaction.atomic(using=current_shard()):
+            held = StoreInventory.objects.filter(
+                store_id=store_id, item_id=item_id, owner=user,
+                quantity__gte=F('reserved_quantity') + quantity,
+            ).update(reserved_quantity=F('reserved_quantity') + quantity, version=F('version') + 1)
+            if not held:
+                raise ReservationError("Insufficient available stock")
+            return StockReservation.objects.create(
+                store_id=store_id, item_id=item_id, quantity=quantity, reference=reference,
+                created_by=user, expires_at=timezone.now() + timedelta(seconds=ttl),
+            )
+
+    @staticmethod
+    def _close(reservation, status):
+        #Moves an active, unexpired hold to `status`; False if another caller got there first
+        now = timezone.now()
+        closed = StockReservation.objects.filter(
+            pk=reservation.pk, status='ACTIVE', expires_at__gt=now,
+        ).update(status=status, closed_at=now)
+        if closed:
+            reservation.status, reservation.closed_at = status, now
+        return bool(closed)
+
+    @staticmethod
+    def commit(reservation, user):
+        """
+        Turns an active hold into a stock removal.
+
+        Decrements on-hand and reserved quantity at the store and the item's
+        total quantity, takes the units from the store's lots first-expired-
+        first-out, and records a REMOVE InventoryChange.
+
+        Raises:
+            ReservationError: if the hold is no longer active, the store row was
+                deleted, or the store's or item's quantity was lowered below it
+                since it was placed
+        """
+        with transaction.atomic(using=current_shard()):
+            if not ReservationManager._close(reservation, 'COMMITTED'):
+                raise ReservationError("Reservation is no longer active")
+            row = StoreInventory.objects.select_for_update().filter(
+                store_id=reservation.store_id, item_id=reservation.item_id
+            ).first()
+            item = InventoryItem.objects.select_for_update().get(pk=reservation.item_id)
+            if row is None or row.quantity < reservation.quantity or item.quantity < reservation.quantity:
+                #Leaving the transaction rolls the hold back to ACTIVE
+                reservation.status, reservation.closed_at = 'ACTIVE', None
+                raise ReservationError("The store no longer stocks this item" if row is None
+                                       else "Insufficient stock on hand to commit the reservation")
+            LotManager.deplete(row.store_id, row.item_id, reservation.quantity)
+            StoreInventory.objects.filter(pk=row.pk).update(
+                quantity=F('quantity') - reservation.quantity,
+                reserved_quantity=F('reserved_quantity') - reservation.quantity,
+                version=F('version') + 1,
+            )
+            StoreInventory.objects.filter(pk=row.pk).update(urgency=StoreInventory.urgency_expression())
+            record_store_changes([store_change(
+                row.store_id, row.item_id, row.quantity, row.quantity - reservation.quantity, user,
+                notes=f"Reservation #{reservation.pk}",
+            )])
+            InventoryChange.objects.create(
+                item=item,
+                change_type='REMOVE',
+                quantity_change=-reservation.quantity,
+                previous_quantity=item.quantity,
+                new_quantity=item.quantity - reservation.quantity,
+                changed_by=user,
+                notes=f"Reservation #{reservation.pk} committed {reservation.reference}".strip(),
+            )
+            item.quantity -= reservation.quantity
+            item.save(update_fields=['quantity', 'last_updated'])
+            ReservationManager._record_store_rows([reservation.store_id], [reservation.item_id])
+        return reservation
+
+    @staticmethod
+    def release(reservation):
+        """
+        Cancels an active hold, making its units available again.
+
+        Raises:
+            ReservationError: if the hold is no longer active
+        """
+        with transaction.atomic(using=current_shard()):
+            if not ReservationManager._close(reservation, 'RELEASED'):
+                raise ReservationError("Reservation is no longer active")
+            StoreInventory.objects.filter(store_id=reservation.store_id, item_id=reservation.item_id).update(
+                reserved_quantity=F('reserved_quantity') - reservation.quantity,
+                version=F('version') + 1,
+            )
+            ReservationManager._record_store_rows([reservation.store_id], [reservation.item_id])
+        return reservation
+
+    @staticmethod
+    def release_expired(batch_size=5000):
+        """
+        Expires lapsed holds in bounded batches.
+
+        Each batch reads and locks ids off the partial expires_at index, flips
+        them to EXPIRED with one UPDATE, then returns their units with one
+        UPDATE that sums the batch (by id) per StoreInventory row.
+
+        Returns:
+            int: number of reservations expired
+        """
+        expired = 0
+        while True:
+            with transaction.atomic(using=current_shard()):
+                now = timezone.now()
+                batch = list(
+                    StockReservation.objects.select_for_update()
+                    .filter(status='ACTIVE', expires_at__lte=now)
+                    .order_by('expires_at').values_list('id', flat=True)[:batch_size]
+                )
+                if not batch:
+                    return expired
+                StockReservation.objects.filter(id__in=batch, status='ACTIVE').update(status='EXPIRED', closed_at=now)
+
+                swept = StockReservation.objects.filter(id__in=batch)
+                held = (swept.filter(store_id=OuterRef('store_id'), item_id=OuterRef('item_id'))
+                        .order_by().values('store_id', 'item_id').annotate(total=Sum('quantity')).values('total'))
+                rows = StoreInventory.objects.filter(
+                    Exists(swept.filter(store_id=OuterRef('store_id'), item_id=OuterRef('item_id')))
+                )
+                rows.update(reserved_quantity=F('reserved_quantity') - Coalesce(Subquery(held), 0), version=F('version') + 1)
+                record_changes(StoreInventory, rows.values_list('id', 'owner_id'))
+                publish(StoreInventory, rows)
+                expired += len(batch)
+
+    @staticmethod
+    def _record_store_rows(store_ids, item_ids):
+        #Queryset updates send no signals, so feed the delta-sync log and the outbox directly
+        rows = StoreInventory.objects.filter(store_id__in=store_ids, item_id__in=item_ids)
+        record_changes(StoreInventory, rows.values_list('id', 'owner_id'))
+        publish(StoreInventory, rows)
@@ -1,15 +1,47 @@
 from rest_framework import serializers
-from .models import Category, InventoryChange, InventoryItem, Supplier, Store, InventoryAlert, StoreInventory
+from .batch import batch_settings
+from .models import Category, InventoryChange, InventoryItem, Supplier, Store, InventoryAlert, StoreInventory, StockCount, StockCountLine, StockLot, StockReservation, StoreInventoryChange, ItemAnalytics
+
+
+#Mixin for serializers of versioned models: writes only the fields that changed
+class ChangedFieldsSerializerMixin:
+    def update(self, instance, validated_data):
+        """
+        Saves with update_fields set to the fields whose value changed (plus
+        auto_now timestamps), so the UPDATE only touches those columns and
+        post_save receivers can skip unrelated work. Nothing is written when
+        no value changed.
+        """
+        changed = []
+        for name, value in validated_data.items():
+            field = instance._meta.get_field(name)
+            new = value.pk if field.is_relation and value is not None else value
+            if getattr(instance, field.attname) != new:
+                setattr(instance, name, value)
+                changed.append(name)
+        if changed:
+            changed += [field.name for field in instance._meta.concrete_fields if getattr(field, 'auto_now', False)]
+            instance.save(update_fields=changed)
+        return instance
 
 
 #Serializer for categories model - handles basic category information
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category    #Specifies which model to serialize
-        fields = ['id', 'name', 'description', 'created_at']        #only these fields will be included in API responses
+        fields = ['id', 'name', 'description', 'parent', 'item_count', 'created_at']        #only these fields will be included in API responses
+        read_only_fields = ['item_count']
+
+    def validate_parent(self, parent):
+        #A category cannot be moved under itself or one of its descendants
+        if parent is not None and self.instance is not None and self.instance.subtree().filter(pk=parent.pk).exists():
+            raise serializers.ValidationError("A category cannot be nested under itself or its descendants.")
+        if parent is not None and len(parent.path) > Category._meta.get_field('path').max_length - 21:
+            raise serializers.ValidationError("Categories are nested too deeply.")
+        return parent
 
 #Serializer for InventoryItem model - handles inventory item details
-class InventoryItemSerializer(serializers.ModelSerializer):
+class InventoryItemSerializer(ChangedFieldsSerializerMixin, serializers.ModelSerializer):
 
     #adds extra fields that aren't directly in the model
     category_name = serializers.CharField(source='category.name', read_only=True)       #Gets category name from related category model
@@ -29,24 +61,33 @@ class InventoryChangeSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = InventoryChange
-        fields = "__all__"
+        exclude = ['owner']     #Denormalized for filtering; always the requesting user
         read_only_fields = ['changed_by', 'timestamp']
 
+#Serializer for StoreInventoryChange model - per-store movement ledger
+class StoreInventoryChangeSerializer(serializers.ModelSerializer):
+    changed_by_username = serializers.CharField(source='changed_by.username', read_only=True)
+
+    class Meta:
+        model = StoreInventoryChange
+        fields = ['id', 'store', 'item', 'change_type', 'quantity_change', 'previous_quantity',
+                  'new_quantity', 'changed_by', 'changed_by_username', 'timestamp', 'notes']
+
 #Serializer for supplier model - manages supplier information        
-class SupplierSerializer(serializers.ModelSerializer):
+class SupplierSerializer(ChangedFieldsSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Supplier
-        fields = ['id', 'name', 'contact_person', 'email', 'phone', 'address', 'is_active', 'created_at', 'updated_at']
+        fields = ['id', 'name', 'contact_person', 'email', 'phone', 'address', 'is_active', 'created_at', 'updated_at', 'version']
         read_only_fields = ['created_by']
 #Serializer for Store model - handles store location data
 class StoreSerializer(serializers.ModelSerializer):
     class Meta:
         model = Store
-        fields = ['id', 'name', 'address', 'contact_number', 'email', 'is_active', 'created_at', 'updated_at']
+        fields = ['id', 'name', 'address', 'contact_number', 'email', 'latitude', 'longitude', 'is_active', 'created_at', 'updated_at']
         read_only_fields = ['created_by']
 
 #Serializer for StoreInventory model - manages inventory at specific stores
-class StoreInventorySerializer(serializers.ModelSerializer):
+class StoreInventorySerializer(ChangedFieldsSerializerMixin, serializers.ModelSerializer):
 
     #Add readable names for store and item
     store_name = serializers.CharField(read_only=True)
@@ -55,7 +96,9 @@ class StoreInventorySerializer(serializers.ModelSerializer):
     class Meta:
         model = StoreInventory
         fields = ['id', 'store', 'store_name', 'item', 'item_name',
-                  'quantity', 'low_stock_threshold', 'reorder_point', 'reorder_quantity', 'needs_reorder']
+                  'quantity', 'reserved_quantity', 'available_quantity',
+                  'low_stock_threshold', 'reorder_point', 'reorder_quantity', 'needs_reorder', 'urgency', 'version']
+        read_only_fields = ['reserved_quantity', 'urgency']
         
     # Custom method to add store and item names to the output   
     def to_representation(self, instance):
@@ -68,14 +111,94 @@ class StoreInventorySerializer(serializers.ModelSerializer):
 class InventoryAlertSerializer(serializers.ModelSerializer):
     class Meta:
         model = InventoryAlert
-        fields = '__all__'      #Include all fields fromm the model
+        exclude = ['owner']     #All other fields fromm the model; owner is always the requesting user
 
 
+#Serializer for StockCount model - cycle-count sessions
+class StockCountSerializer(serializers.ModelSerializer):
+    line_count = serializers.IntegerField(read_only=True)      #Number of counted lines, annotated by the viewset
 
+    class Meta:
+        model = StockCount
+        fields = ['id', 'store', 'status', 'notes', 'line_count', 'created_by', 'created_at', 'approved_by', 'approved_at']
+        read_only_fields = ['status', 'created_by', 'created_at', 'approved_by', 'approved_at']
+
+    def validate_store(self, value):
+        #Counts can only be taken at the requesting user's own stores
+        if value and value.created_by != self.context['request'].user:
+            raise serializers.ValidationError("Store not found.")
+        return value
+
+#Serializers validating an upload of counted lines
+class StockCountLineInputSerializer(serializers.Serializer):
+    item = serializers.IntegerField()
+    counted_quantity = serializers.IntegerField(min_value=0)
+
+class StockCountLinesSerializer(serializers.Serializer):
+    lines = serializers.ListField(child=StockCountLineInputSerializer())
+
+#Serializer for StockCountLine rows in a variance report
+class StockCountVarianceSerializer(serializers.ModelSerializer):
+    item_name = serializers.CharField(source='item.name', read_only=True)
+    system_quantity = serializers.IntegerField(source='current_quantity', read_only=True)
+    variance = serializers.IntegerField(source='current_variance', read_only=True)
 
+    class Meta:
+        model = StockCountLine
+        fields = ['item', 'item_name', 'counted_quantity', 'system_quantity', 'variance']
 
+#Serializer for StockLot model - lot quantities and expiry dates
+class StockLotSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = StockLot
+        fields = ['id', 'store', 'item', 'lot_code', 'quantity', 'expiry_date', 'received_at']
+        read_only_fields = ['received_at']
 
+    def validate_store(self, value):
+        #Lots can only be registered at the requesting user's own stores
+        if value.created_by != self.context['request'].user:
+            raise serializers.ValidationError("Store not found.")
+        return value
 
+#Serializer for StockReservation model - stock holds awaiting commit or release
+class StockReservationSerializer(serializers.ModelSerializer):
+    ttl_seconds = serializers.IntegerField(write_only=True, required=False, min_value=1, max_value=86400)
 
+    class Meta:
+        model = StockReservation
+        fields = ['id', 'store', 'item', 'quantity', 'reference', 'ttl_seconds', 'status',
+                  'created_at', 'expires_at', 'closed_at']
+        read_only_fields = ['status', 'created_at', 'expires_at', 'closed_at']
 
+#Serializer for ItemAnalytics model - cached demand analytics per store item
+class ItemAnalyticsSerializer(serializers.ModelSerializer):
+    store_name = serializers.CharField(source='store.name', read_only=True)
+    item_name = serializers.CharField(source='item.name', read_only=True)
 
+    class Meta:
+        model = ItemAnalytics
+        fields = ['id', 'store', 'store_name', 'item', 'item_name', 'quantity', 'units_sold', 'velocity',
+                  'days_of_cover', 'turnover', 'consumption_value', 'abc_class', 'is_dead_stock',
+                  'last_removed_at', 'computed_at']
+
+#Serializer for one sub-request of a batch
+class BatchSubRequestSerializer(serializers.Serializer):
+    method = serializers.ChoiceField(choices=['GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE'])
+    path = serializers.CharField(max_length=2000)
+    body = serializers.JSONField(required=False)
+    headers = serializers.DictField(child=serializers.CharField(), required=False)
+
+    def validate_path(self, value):
+        if not value.startswith('/api/'):
+            raise serializers.ValidationError("Sub-request paths must start with /api/.")
+        return value
+
+#Serializer for a batch of sub-requests
+class BatchSerializer(serializers.Serializer):
+    requests = BatchSubRequestSerializer(many=True, allow_empty=False)
+
+    def validate_requests(self, value):
+        limit = batch_settings()['MAX_REQUESTS']
+        if len(value) > limit:
+            raise serializers.ValidationError(f"A batch holds at most {limit} requests.")
+        return value
@@ -0,0 +1,199 @@
+"""
+Single-flight coalescing of expensive, identical concurrent requests.
+
+With SINGLE_FLIGHT enabled, requests of the same user for the same path
+and query (in any parameter order) that arrive while an identical one is
+being computed wait for that computation and share its result instead of
+running it again:
+
+    - within a process, followers wait on the leader's thread
+    - across worker processes, the leader holds a lock in the shared cache
+      (SINGLE_FLIGHT['CACHE']) for at most LOCK_TIMEOUT seconds and stores
+      its result there under the lock's token; followers in other
+      processes poll for it every POLL_MS
+
+A follower whose leader fails, or exceeds LOCK_TIMEOUT, computes the
+result itself. Results are only shared with requests that overlapped the
+computation, never with later ones.
+
+Counters of leaders, followers served in-process and from other
+processes, and timeouts are kept per process and, in the shared cache,
+for all workers together (`manage.py single_flight_stats`). Across
+processes this needs a cache they share (CACHE_URL); the default
+in-memory cache only coalesces within each process.
+"""
+import hashlib
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+
+#Counter names, in reporting order
+COUNTERS = ('leader', 'coalesced_local', 'coalesced_remote', 'timeout')
+
+_MISSING = object()
+
+
+def single_flight_settings():
+    return {'ENABLED': False, 'CACHE': 'default', 'LOCK_TIMEOUT': 30, 'POLL_MS': 20,
+            **getattr(settings, 'SINGLE_FLIGHT', {})}
+
+
+class _Flight:
+    #One in-process computation; `done` is set once it succeeded or failed
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.failed = False
+
+
+class SingleFlight:
+    """
+    Per-process registry of computations in flight, keyed by request.
+    """
+    def __init__(self, cache_alias='default', lock_timeout=30, poll_ms=20):
+        self.cache_alias = cache_alias
+        self.lock_timeout = lock_timeout
+        self.poll = poll_ms / 1000
+        self.counters = Counter()
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+        key = f'singleflight:count:{name}'
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            #First count since the cache was cleared; a racing first count may be lost
+            self.cache.add(key, 1, timeout=None)
+
+    def totals(self):
+        """
+        Returns the counters summed over every process sharing the cache.
+        """
+        found = self.cache.get_many([f'singleflight:count:{name}' for name in COUNTERS])
+        return {name: found.get(f'singleflight:count:{name}', 0) for name in COUNTERS}
+
+    def reset_totals(self):
+        self.cache.delete_many([f'singleflight:count:{name}' for name in COUNTERS])
+
+    def do(self, key, compute):
+        """
+        Returns compute()'s result, computed once for concurrent callers of `key`.
+
+        Args:
+            key: hashable description of the request
+            compute: callable producing a picklable result
+
+        Returns:
+            tuple: (result, shared) where shared tells whether another caller computed it
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            if not flight.done.wait(self.lock_timeout):
+                self._count('timeout')
+                return compute(), False
+            if flight.failed:
+                #The leader's error belongs to its own request: compute (and fail) independently
+                return compute(), False
+            self._count('coalesced_local')
+            return flight.result, True
+
+        try:
+            flight.result, shared = self._across_processes(key, compute)
+            return flight.result, shared
+        except Exception:
+            flight.failed = True
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def _across_processes(self, key, compute):
+        cache = self.cache
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        lock_key = f'singleflight:lock:{digest}'
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_timeout
+        while True:
+            if cache.add(lock_key, token, timeout=self.lock_timeout):
+                self._count('leader')
+                try:
+                    result = compute()
+                    #Stored before the lock is released, so waiters find it once it is gone
+                    cache.set(f'singleflight:result:{token}', result, timeout=self.lock_timeout)
+                    return result, False
+                finally:
+                    if cache.get(lock_key) == token:
+                        cache.delete(lock_key)
+
+            owner = cache.get(lock_key)
+            while owner is not None:
+                result = cache.get(f'singleflight:result:{owner}', _MISSING)
+                if result is not _MISSING:
+                    self._count('coalesced_remote')
+                    return result, True
+                if time.monotonic() >= deadline:
+                    self._count('timeout')
+                    return compute(), False
+                time.sleep(self.poll)
+                current = cache.get(lock_key)
+                if current != owner:
+                    #The leader finished (or failed): take its result if it left one
+                    result = cache.get(f'singleflight:result:{owner}', _MISSING)
+                    if result is not _MISSING:
+                        self._count('coalesced_remote')
+                        return result, True
+                    owner = current
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight():
+    """
+    Returns the process-wide SingleFlight, or None when SINGLE_FLIGHT is disabled.
+    """
+    global _single_flight
+    config = single_flight_settings()
+    if not config['ENABLED']:
+        return None
+    if _single_flight is None:
+        with _single_flight_lock:
+            if _single_flight is None:
+                _single_flight = SingleFlight(config['CACHE'], config['LOCK_TIMEOUT'], config['POLL_MS'])
+    return _single_flight
+
+
+def request_key(request):
+    """
+    Identifies identical requests: same user, path and query, in any parameter order.
+    """
+    query = tuple(sorted((name, tuple(values)) for name, values in request.query_params.lists()))
+    return (request.user.pk, request.path, query)
+
+
+def coalesce_request(request, compute):
+    """
+    Returns compute()'s result for `request`, shared with identical concurrent requests.
+    """
+    flight = get_single_flight()
+    if flight is None:
+        return compute()
+    return flight.do(request_key(request), compute)[0]
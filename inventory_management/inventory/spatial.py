@@ -0,0 +1,137 @@
+"""
+In-memory spatial index over store locations.
+
+Stores are placed on the unit sphere as 3D points, where straight-line
+(chord) distance grows monotonically with great-circle distance. A k-d tree
+over those points answers k-nearest queries correctly across the
+antimeridian and near the poles.
+"""
+import heapq
+import math
+import threading
+import time
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Store
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def to_unit_vector(latitude, longitude):
+    """
+    Converts degrees latitude/longitude to a point on the unit sphere.
+    """
+    lat = math.radians(latitude)
+    lon = math.radians(longitude)
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+
+
+def chord_to_km(chord):
+    """
+    Converts a unit-sphere chord length to great-circle distance in km.
+    """
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+class KDTree:
+    """
+    Static 3-dimensional k-d tree.
+
+    Args:
+        points: list of (key, (x, y, z)) tuples
+    """
+    def __init__(self, points):
+        self.size = len(points)
+        self.root = self._build(list(points), 0)
+
+    def _build(self, points, depth):
+        if not points:
+            return None
+        axis = depth % 3
+        points.sort(key=lambda point: point[1][axis])
+        middle = len(points) // 2
+        key, coords = points[middle]
+        return (key, coords, axis,
+                self._build(points[:middle], depth + 1),
+                self._build(points[middle + 1:], depth + 1))
+
+    def nearest(self, target, k):
+        """
+        Returns the k points closest to `target`.
+
+        Returns:
+            list: (distance, key) tuples ordered by increasing chord distance
+        """
+        best = []       # max-heap of (-squared distance, key)
+        stack = [(self.root, 0.0)]
+        while stack:
+            node, plane_distance = stack.pop()
+            #Skip subtrees whose splitting plane is farther than the current k-th best
+            if node is None or (len(best) == k and plane_distance >= -best[0][0]):
+                continue
+            key, coords, axis, left, right = node
+            squared = sum((a - b) ** 2 for a, b in zip(coords, target))
+            if len(best) < k:
+                heapq.heappush(best, (-squared, key))
+            elif squared < -best[0][0]:
+                heapq.heapreplace(best, (-squared, key))
+
+            offset = target[axis] - coords[axis]
+            near, far = (left, right) if offset < 0 else (right, left)
+            stack.append((far, offset * offset))
+            stack.append((near, 0.0))
+        return sorted((math.sqrt(-squared), key) for squared, key in best)
+
+
+class StoreLocator:
+    """
+    Holds one k-d tree of located, active stores per owner.
+
+    Trees are built lazily on first query, dropped whenever one of the
+    owner's stores is saved or deleted in this process, and rebuilt after
+    `max_age` seconds to pick up stores changed by other processes.
+    """
+    def __init__(self, max_age=300):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._trees = {}
+        self._generations = {}
+
+    def tree_for(self, owner_id):
+        with self._lock:
+            tree, built_at = self._trees.get(owner_id, (None, 0))
+            generation = self._generations.get(owner_id, 0)
+        if tree is None or time.monotonic() - built_at > self.max_age:
+            stores = (Store.objects.filter(created_by_id=owner_id, is_active=True,
+                                           latitude__isnull=False, longitude__isnull=False)
+                      .values_list('id', 'latitude', 'longitude'))
+            tree = KDTree([(store_id, to_unit_vector(float(lat), float(lon))) for store_id, lat, lon in stores])
+            with self._lock:
+                #Don't cache a tree that a concurrent store change already made stale
+                if self._generations.get(owner_id, 0) == generation:
+                    self._trees[owner_id] = (tree, time.monotonic())
+        return tree
+
+    def invalidate(self, owner_id):
+        with self._lock:
+            self._trees.pop(owner_id, None)
+            self._generations[owner_id] = self._generations.get(owner_id, 0) + 1
+
+    def nearest(self, owner_id, latitude, longitude, count):
+        """
+        Returns up to `count` (distance_km, store_id) pairs nearest to a point.
+        """
+        tree = self.tree_for(owner_id)
+        return [(chord_to_km(chord), store_id)
+                for chord, store_id in tree.nearest(to_unit_vector(latitude, longitude), count)]
+
+
+locator = StoreLocator()
+
+
+@receiver(post_save, sender=Store)
+@receiver(post_delete, sender=Store)
+def handle_store_change(sender, instance, **kwargs):
+    locator.invalidate(instance.created_by_id)
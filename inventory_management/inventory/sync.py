@@ -0,0 +1,166 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from inventory_management.sharding import current_shard, use_shard
+
+from .models import Category, InventoryItem, StoreInventory, InventoryAlert, SyncChange
+from .utils import chunked
+
+
+#Maps each synced model to its SyncChange label, response key and the field
+#holding the owning user's id
+SYNCED_MODELS = {
+    Category: ('category', 'categories', None),
+    InventoryItem: ('inventoryitem', 'inventory_items', 'created_by_id'),
+    StoreInventory: ('storeinventory', 'store_inventory', 'owner_id'),
+    InventoryAlert: ('inventoryalert', 'alerts', 'owner_id'),
+}
+
+
+def _owner_id(instance):
+    """
+    Returns the id of the user that owns `instance`, or None for shared rows.
+    """
+    lookup = SYNCED_MODELS[type(instance)][2]
+    if lookup is None:
+        return None
+    return getattr(instance, lookup)
+
+
+def sync_settings():
+    return {'SETTLE_SECONDS': 30, **getattr(settings, 'SYNC', {})}
+
+
+def allocate_sequence(count, using):
+    """
+    Takes `count` change sequence numbers on database `using`.
+
+    The numbers come from SyncChange's primary key counter (the id sequence
+    on PostgreSQL, the table's sqlite_sequence row on SQLite), so they never
+    repeat and a tenant move only has to raise that counter. Call inside a
+    transaction: on SQLite the counter row stays locked until it commits.
+
+    Returns:
+        list: the sequence numbers, increasing
+    """
+    connection = connections[using]
+    table = SyncChange._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                           [table, count])
+            return sorted(row[0] for row in cursor.fetchall())
+        cursor.execute("UPDATE sqlite_sequence SET seq = seq + %s WHERE name = %s", [count, table])
+        if not cursor.rowcount:
+            cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)", [table, count])
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = %s", [table])
+        last = cursor.fetchone()[0]
+    return list(range(last - count + 1, last + 1))
+
+
+def record_changes(model, rows, is_deleted=False):
+    """
+    Moves the given objects to the head of the change sequence.
+
+    Intended for bulk write paths (bulk_create, queryset.update) that bypass
+    model signals. Each object's row is upserted, so concurrent writers of
+    the same object do not collide on the (model, object_id) constraint.
+
+    Args:
+        model: One of the models in SYNCED_MODELS
+        rows: Iterable of (object_id, owner_id) tuples
+        is_deleted: True to record tombstones
+    """
+    label = SYNCED_MODELS[model][0]
+    using = current_shard()
+    with transaction.atomic(using=using):
+        for batch in chunked(rows, 5000):
+            #An upsert may not touch one row twice
+            owners = dict(batch)
+            changed_at = timezone.now()
+            SyncChange.objects.bulk_create(
+                [SyncChange(model=label, object_id=object_id, owner_id=owner_id, is_deleted=is_deleted,
+                            seq=seq, changed_at=changed_at)
+                 for (object_id, owner_id), seq in zip(owners.items(), allocate_sequence(len(owners), using))],
+                update_conflicts=True,
+                unique_fields=['model', 'object_id'],
+                update_fields=['owner', 'is_deleted', 'seq', 'changed_at'],
+            )
+
+
+def record_change(instance, is_deleted=False):
+    """
+    Records a single saved or deleted object in the change sequence.
+    """
+    record_changes(type(instance), [(instance.pk, _owner_id(instance))], is_deleted=is_deleted)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=InventoryItem)
+@receiver(post_save, sender=StoreInventory)
+@receiver(post_save, sender=InventoryAlert)
+def handle_synced_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        record_change(instance)
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=InventoryItem)
+@receiver(post_delete, sender=StoreInventory)
+@receiver(post_delete, sender=InventoryAlert)
+def handle_synced_delete(sender, instance, **kwargs):
+    record_change(instance, is_deleted=True)
+
+
+@receiver(pre_delete, sender=Category)
+def handle_category_delete(sender, instance, **kwargs):
+    #Items are detached with a bulk SET NULL that sends no signals,
+    #so record them here before the category goes away. The SET NULL runs on
+    #the database the category is deleted from; other shards are handled by
+    #inventory.tenants.replicate_categories
+    with use_shard(instance._state.db):
+        record_changes(InventoryItem, instance.items.values_list('id', 'created_by_id'))
+
+
+def changes_since(user, since, limit):
+    """
+    Returns one batch of changes visible to `user` after sequence `since`.
+
+    Sequence numbers are taken before commit, so on PostgreSQL a change can
+    become visible after one with a higher number that a client has already
+    read past. The returned cursor therefore only moves past rows older than
+    SYNC['SETTLE_SECONDS'], by when any transaction holding a lower number
+    has committed or rolled back; younger rows are returned as well and sent
+    again on the next poll.
+
+    Args:
+        user: User requesting the sync
+        since: int - last sequence the client has applied (0 for a full sync)
+        limit: int - maximum number of changes in the batch
+
+    Returns:
+        tuple: (entries, next, has_more) where entries is the ordered list of
+        SyncChange rows in the batch and next the sequence to resume from
+    """
+    entries = list(
+        SyncChange.objects.filter(Q(owner=user) | Q(owner__isnull=True), seq__gt=since)
+        .order_by('seq')[:limit + 1]
+    )
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    settled_before = timezone.now() - timedelta(seconds=sync_settings()['SETTLE_SECONDS'])
+    cursor = since
+    for entry in entries:
+        if entry.changed_at > settled_before:
+            #Later rows may still be joined by lower sequence numbers: poll again later
+            has_more = False
+            break
+        cursor = entry.seq
+    return entries, cursor, has_more
@@ -0,0 +1,377 @@
+"""
+Tenant placement, category mirroring and tenant moves between shards.
+
+See inventory_management.sharding for routing. This module keeps the
+shards consistent with the directory ('default'):
+
+    - new users are placed on a shard per SHARD_NEW_TENANTS, and every user
+      whose inventory lives on a shard is mirrored there, since inventory
+      rows hold foreign keys to accounts.User
+    - categories are written to the directory and copied to every shard once
+      the directory transaction commits
+    - `move_tenant` copies one tenant's rows to another shard in bulk while
+      the tenant's writes are refused, then switches the shard map
+"""
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Count, Max, Sum
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from accounts.models import TenantShard
+from inventory_management.sharding import (
+    DIRECTORY_MODELS, current_shard, shard_aliases, shard_of, sharding_enabled, use_shard,
+)
+
+from .models import (
+    Category, InventoryAlert, InventoryChange, InventoryChangeDaily, InventoryItem, ItemAnalytics, StockCount,
+    StockCountLine, StockLot, StockReservation, Store, StoreInventory, StoreInventoryChange, Supplier, SyncChange,
+)
+from .sync import SYNCED_MODELS, record_changes
+from .utils import chunked
+
+User = get_user_model()
+
+#Every model holding tenant rows, parents before children, with the lookup of the owning user
+TENANT_MODELS = (
+    (Supplier, 'created_by'),
+    (InventoryItem, 'created_by'),
+    (Store, 'created_by'),
+    (StoreInventory, 'owner'),
+    (InventoryChange, 'owner'),
+    (InventoryChangeDaily, 'item__created_by'),
+    (StoreInventoryChange, 'store__created_by'),
+    (InventoryAlert, 'owner'),
+    (StockLot, 'store__created_by'),
+    (StockReservation, 'created_by'),
+    (StockCount, 'created_by'),
+    (StockCountLine, 'count__created_by'),
+    (ItemAnalytics, 'store__created_by'),
+)
+
+OWNER_LOOKUPS = dict(TENANT_MODELS)
+
+#Category fields copied to the shards; item_count is only maintained on the directory
+CATEGORY_FIELDS = ['name', 'description', 'parent', 'path']
+
+
+class TenantMoveError(Exception):
+    """
+    Raised when a tenant cannot be moved; no rows have been changed.
+    """
+
+
+def id_base(alias):
+    """
+    Returns the first primary key of shard `alias` (its index x SHARD_ID_STRIDE).
+    """
+    return shard_aliases().index(alias) * settings.SHARD_ID_STRIDE
+
+
+def raise_sequence(alias, model, minimum):
+    """
+    Makes `model`'s next primary key on `alias` greater than `minimum`.
+
+    Never lowers a sequence. Supports SQLite (AUTOINCREMENT tables) and
+    PostgreSQL; returns False for other backends.
+    """
+    connection = connections[alias]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute("UPDATE sqlite_sequence SET seq = %s WHERE name = %s AND seq < %s",
+                           [minimum, table, minimum])
+            cursor.execute("INSERT INTO sqlite_sequence (name, seq) SELECT %s, %s "
+                           "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)",
+                           [table, minimum, table])
+            return True
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT pg_get_serial_sequence(%s, %s)", [table, model._meta.pk.column])
+            sequence = cursor.fetchone()[0]
+            cursor.execute("SELECT setval(%s, GREATEST(%s, (SELECT last_value FROM " + sequence + ")))",
+                           [sequence, minimum])
+            return True
+    return False
+
+
+def seed_id_ranges(alias):
+    """
+    Starts the primary keys of every inventory table on `alias` at its id base.
+
+    Ids then never collide between shards, so a moved tenant keeps its ids
+    (and API clients their references). The directory ('default') starts at 1.
+    """
+    base = id_base(alias)
+    if not base:
+        return 0
+    seeded = 0
+    for model in apps.get_app_config('inventory').get_models():
+        if model._meta.label_lower not in DIRECTORY_MODELS:
+            seeded += raise_sequence(alias, model, base)
+    return seeded
+
+
+def mirror_user(user, alias):
+    """
+    Copies (or refreshes) a user row from the directory onto shard `alias`.
+    """
+    values = {field.attname: getattr(user, field.attname)
+              for field in User._meta.concrete_fields if not field.primary_key}
+    User._base_manager.using(alias).update_or_create(pk=user.pk, defaults=values)
+
+
+def place_tenant(user):
+    """
+    Records the shard of a new user per SHARD_NEW_TENANTS.
+
+    Returns:
+        str: the alias chosen
+    """
+    aliases = shard_aliases()
+    policy = getattr(settings, 'SHARD_NEW_TENANTS', DEFAULT_DB_ALIAS)
+    if policy == 'balanced':
+        shards = aliases[1:]
+        tenants = dict.fromkeys(shards, 0)
+        tenants.update(TenantShard.objects.using(DEFAULT_DB_ALIAS).filter(alias__in=shards)
+                       .values_list('alias').annotate(total=Count('user')).order_by())
+        #Users without an entry live on 'default'
+        tenants[DEFAULT_DB_ALIAS] = (User.objects.using(DEFAULT_DB_ALIAS).exclude(pk=user.pk)
+                                     .exclude(shard__alias__in=shards).count())
+        alias = min(aliases, key=lambda name: (tenants[name], aliases.index(name)))
+    elif policy in aliases:
+        alias = policy
+    else:
+        alias = DEFAULT_DB_ALIAS
+    if alias != DEFAULT_DB_ALIAS:
+        mirror_user(user, alias)
+        TenantShard.objects.using(DEFAULT_DB_ALIAS).create(user=user, alias=alias)
+    return alias
+
+
+@receiver(post_save, sender=User)
+def handle_user_save(sender, instance, created, raw=False, using=DEFAULT_DB_ALIAS, **kwargs):
+    #Only directory writes; saving a mirror must not place or mirror again
+    if raw or using != DEFAULT_DB_ALIAS or not sharding_enabled():
+        return
+    if created:
+        place_tenant(instance)
+        return
+    alias, _ = shard_of(instance.pk)
+    if alias != DEFAULT_DB_ALIAS:
+        mirror_user(instance, alias)
+
+
+def replicate_categories(ids, is_deleted=False):
+    """
+    Copies directory categories (and their subtrees) or their deletion to every shard.
+
+    Each shard's delta-sync log records the change too, except the current
+    shard's, which the model signals already wrote to.
+
+    Args:
+        ids: Category ids saved or deleted on the directory
+        is_deleted: True to remove the categories from the shards
+    """
+    if not sharding_enabled() or not ids:
+        return
+    ids = list(ids)
+    categories = []
+    if not is_deleted:
+        seen = set()
+        for category in Category.objects.using(DEFAULT_DB_ALIAS).filter(pk__in=ids).order_by('path'):
+            if category.pk in seen:
+                continue
+            #Moving a category changes the paths of its whole subtree; parents sort first
+            for row in Category.objects.using(DEFAULT_DB_ALIAS).filter(**Category.path_range(category.path)) \
+                    .order_by('path'):
+                if row.pk not in seen:
+                    seen.add(row.pk)
+                    categories.append(row)
+        ids = [category.pk for category in categories]
+
+    current = current_shard()
+    for alias in shard_aliases():
+        if alias != DEFAULT_DB_ALIAS:
+            with use_shard(alias), transaction.atomic(using=alias):
+                if is_deleted:
+                    #The directory's delete detaches only the directory's items
+                    items = InventoryItem.objects.using(alias).filter(category_id__in=ids)
+                    record_changes(InventoryItem, items.values_list('id', 'created_by_id'))
+                    items.update(category=None)
+                    Category._base_manager.using(alias).filter(pk__in=ids)._raw_delete(alias)
+                else:
+                    Category.objects.using(alias).bulk_create(
+                        categories, update_conflicts=True, unique_fields=['id'], update_fields=CATEGORY_FIELDS,
+                    )
+        if alias != current:
+            with use_shard(alias):
+                record_changes(Category, [(pk, None) for pk in ids], is_deleted=is_deleted)
+
+
+@receiver(post_save, sender=Category)
+def handle_category_save(sender, instance, raw=False, using=DEFAULT_DB_ALIAS, **kwargs):
+    #Category.save sets the paths after the row is saved: copy once the directory commits
+    if not raw and using == DEFAULT_DB_ALIAS and sharding_enabled():
+        transaction.on_commit(lambda: replicate_categories([instance.pk]), using=using)
+
+
+@receiver(post_delete, sender=Category)
+def handle_category_removed(sender, instance, using=DEFAULT_DB_ALIAS, **kwargs):
+    if using == DEFAULT_DB_ALIAS and sharding_enabled():
+        transaction.on_commit(lambda: replicate_categories([instance.pk], is_deleted=True), using=using)
+
+
+def _tenant_rows(model, user, alias):
+    return model._base_manager.using(alias).filter(**{OWNER_LOOKUPS[model]: user})
+
+
+def _tenant_fks(model):
+    #Foreign keys from `model` to other tenant models
+    return [field for field in model._meta.concrete_fields
+            if field.is_relation and field.related_model in OWNER_LOOKUPS]
+
+
+def check_move(user, source, target):
+    """
+    Lists what would make moving `user` from `source` to `target` unsafe.
+
+    That is rows of the tenant referencing another tenant's rows (or
+    referenced by them), which cannot be split across shards, and ids of
+    the tenant's rows already taken on the target.
+
+    Returns:
+        list: problem descriptions; empty when the move can proceed
+    """
+    problems = []
+    for model, lookup in TENANT_MODELS:
+        rows = _tenant_rows(model, user, source)
+        for field in _tenant_fks(model):
+            related_lookup = f"{field.name}__{OWNER_LOOKUPS[field.related_model]}"
+            if rows.filter(**{f"{field.name}__isnull": False}).exclude(**{related_lookup: user}).exists():
+                problems.append(f"{model.__name__}.{field.name} references another tenant's rows.")
+            referencing = model._base_manager.using(source).filter(**{related_lookup: user}).exclude(**{lookup: user})
+            if referencing.exists():
+                problems.append(f"Another tenant's {model.__name__}.{field.name} references this tenant's rows.")
+        for batch in chunked(rows.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=5000), 5000):
+            if model._base_manager.using(target).filter(pk__in=batch).exists():
+                problems.append(f"{model.__name__} ids are already taken on {target}.")
+                break
+    return problems
+
+
+def _copy(model, user, source, target, batch_size):
+    #Raw inserts keep every column as stored, including auto_now timestamps
+    fields = model._meta.concrete_fields
+    ops = connections[target].ops
+    copied = 0
+    rows = _tenant_rows(model, user, source).order_by('pk').iterator(chunk_size=batch_size)
+    for batch in chunked(rows, batch_size):
+        size = max(ops.bulk_batch_size(fields, batch), 1)
+        for part in chunked(batch, size):
+            model._base_manager._insert(part, fields=fields, using=target, raw=True)
+        copied += len(batch)
+    return copied
+
+
+def _fingerprint(model, user, alias):
+    return _tenant_rows(model, user, alias).order_by().aggregate(rows=Count('pk'), ids=Sum('pk'))
+
+
+def move_tenant(user, target, drain_seconds=5, batch_size=2000, log=None):
+    """
+    Moves every inventory row of `user` to shard `target`.
+
+    1. Marks the tenant as moving; its writes fail with 503 from then on,
+       and in-flight requests get `drain_seconds` to finish
+    2. Checks the move is safe (see check_move)
+    3. Copies the rows in bulk in one transaction on the target, keeping
+       their ids, and compares row counts and id sums with the source
+    4. Re-records the tenant's synced rows and the categories in the
+       target's delta-sync log, after every entry of the source's log, so
+       clients pick up from their last sequence without a full resync
+    5. Points the shard map at the target and deletes the source rows
+
+    Outbox events stay on the source, whose relay delivers them.
+
+    Args:
+        user: User to move
+        target: database alias from SHARD_DATABASES
+        drain_seconds: wait for requests that passed the moving check
+        batch_size: rows read and written per statement
+        log: optional callable receiving progress messages
+
+    Returns:
+        dict: rows moved per model name
+
+    Raises:
+        TenantMoveError: if the move is not possible
+    """
+    log = log or (lambda message: None)
+    aliases = shard_aliases()
+    if target not in aliases:
+        raise TenantMoveError(f"Unknown shard '{target}'. Shards: {', '.join(aliases)}.")
+    source, moving = shard_of(user.pk)
+    if moving:
+        raise TenantMoveError(f"{user} is already being moved.")
+    if source == target:
+        raise TenantMoveError(f"{user} is already on {target}.")
+
+    TenantShard.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+        user=user, defaults={'alias': source, 'is_moving': True})
+    try:
+        log(f"Draining writes of {user} on {source} for {drain_seconds}s.")
+        time.sleep(drain_seconds)
+        problems = check_move(user, source, target)
+        if problems:
+            raise TenantMoveError(" ".join(problems))
+
+        #Inventory rows reference their creators, changers and approvers
+        user_ids = {user.pk}
+        for model, _ in TENANT_MODELS:
+            for field in model._meta.concrete_fields:
+                if field.is_relation and field.related_model is User:
+                    user_ids.update(_tenant_rows(model, user, source).exclude(**{f"{field.name}__isnull": True})
+                                    .order_by().values_list(field.attname, flat=True).distinct())
+        for referenced in User.objects.using(DEFAULT_DB_ALIAS).filter(pk__in=user_ids):
+            mirror_user(referenced, target)
+
+        moved = {}
+        with transaction.atomic(using=target):
+            for model, _ in TENANT_MODELS:
+                moved[model.__name__] = _copy(model, user, source, target, batch_size)
+                if _fingerprint(model, user, source) != _fingerprint(model, user, target):
+                    raise TenantMoveError(f"{model.__name__} rows differ between {source} and {target} after the copy.")
+                log(f"Copied {moved[model.__name__]} {model.__name__} rows.")
+
+            if connections[target].vendor == 'postgresql':
+                with connections[target].cursor() as cursor:
+                    for sql in connections[target].ops.sequence_reset_sql(None, [model for model, _ in TENANT_MODELS]):
+                        cursor.execute(sql)
+            seed_id_ranges(target)
+
+            last_seen = SyncChange.objects.using(source).aggregate(last=Max('seq'))['last'] or 0
+            raise_sequence(target, SyncChange, last_seen)
+            with use_shard(target):
+                for model, (_, _, owner_field) in SYNCED_MODELS.items():
+                    if model is Category:
+                        rows = Category.objects.using(target).values_list('id', flat=True)
+                        record_changes(Category, [(pk, None) for pk in rows.iterator(chunk_size=5000)])
+                    else:
+                        rows = _tenant_rows(model, user, target).values_list('id', owner_field)
+                        record_changes(model, rows.iterator(chunk_size=5000))
+
+        TenantShard.objects.using(DEFAULT_DB_ALIAS).filter(user=user).update(alias=target, is_moving=False)
+    except BaseException:
+        TenantShard.objects.using(DEFAULT_DB_ALIAS).filter(user=user).update(is_moving=False)
+        raise
+
+    with transaction.atomic(using=source):
+        for model, _ in reversed(TENANT_MODELS):
+            _tenant_rows(model, user, source)._raw_delete(source)
+        SyncChange.objects.using(source).filter(owner=user)._raw_delete(source)
+    log(f"Moved {user} from {source} to {target}.")
+    return moved
@@ -1,3 +1,1261 @@
-from django.test import TestCase
+import io
+import json
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock
+
+import numpy as np
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connections, transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import TenantShard
+from inventory_management import admission
+from inventory_management.admission import AdmissionGate
+from inventory_management.db import set_sqlite_journal_mode
+from inventory_management.routers import PIN_COOKIE
+from inventory_management.sharding import ShardRoutingMiddleware, TenantMoving
+
+from .analytics import ItemAnalyticsManager
+from .archive import ChangeArchive, retention_cutoff
+from .availability import AvailabilityIndex, database_checksum
+from .coalescing import InsufficientStock, StockWriteCoalescer, _Adjustment, apply_adjustments
+from .counts import StockCountManager
+from .lots import LotManager
+from .management.commands.reconcile_stock import id_ranges
+from .pagination import bounded_count
+from .categories import bulk_create_categories
+from .models import (
+    Category, InventoryAlert, InventoryChange, InventoryItem, ItemAnalytics, OutboxCursor, OutboxEvent, StockCount, StockLot, StockReservation, Store,
+    StoreInventory, StoreInventoryChange, SyncChange, VersionConflict,
+)
+from .outbox import OutboxDispatcher
+from .reservations import ReservationError, ReservationManager
+from .sync import changes_since, record_changes
+from .tenants import move_tenant
+from .serializers import CategorySerializer
+from .singleflight import SingleFlight
+from .spatial import KDTree, to_unit_vector
+
+User = get_user_model()
+
+
+class StockFixtureMixin:
+    """
+    A user with one item stocked at one store.
+    """
+    def make_stock(self, quantity=10, username='owner'):
+        self.user = User.objects.create_user(username=username, email=f'{username}@example.com',
+                                             password='pass12345')
+        self.item = InventoryItem.objects.create(name='Milk', quantity=quantity, price='2.50', created_by=self.user)
+        self.store = Store.objects.create(name='North', address='1 Main St', contact_number='555',
+                                          email='store@example.com', created_by=self.user)
+        self.row = StoreInventory.objects.create(store=self.store, item=self.item, quantity=quantity)
+
+    def add_lots(self, *quantities):
+        #One lot per quantity, each expiring a day after the previous one
+        return [StockLot.objects.create(store=self.store, item=self.item, lot_code=f'L{day}', quantity=quantity,
+                                        expiry_date=f'2030-01-{day:02d}')
+                for day, quantity in enumerate(quantities, start=1)]
+
+    def lot_quantities(self):
+        return list(StockLot.objects.filter(store=self.store, item=self.item)
+                    .order_by('expiry_date').values_list('quantity', flat=True))
+
+
+class SQLiteTuningTests(SimpleTestCase):
+    """
+    A file database is switched to WAL when migrated, not when connections
+    open, and its transactions take the write lock as soon as they begin.
+    """
+    alias = 'sqlite_probe'
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.directory.name, 'probe.sqlite3')
+        connections.settings[cls.alias] = {**connections.settings['default'], 'NAME': cls.path}
+        #Declared here rather than on the class: the runner checks declared aliases before they exist
+        cls.databases = {cls.alias}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[cls.alias].close()
+        del connections[cls.alias]
+        del connections.settings[cls.alias]
+        cls.directory.cleanup()
+
+    def pragma(self, name):
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_journal_mode_is_set_at_migrate(self):
+        self.assertEqual(self.pragma('journal_mode'), 'delete')
+        self.assertEqual((self.pragma('synchronous'), self.pragma('busy_timeout')), (1, 20000))
+        set_sqlite_journal_mode(sender=None, using=self.alias)
+        connections[self.alias].close()
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+
+    def test_transactions_take_the_write_lock_when_they_begin(self):
+        other = sqlite3.connect(self.path, timeout=0, isolation_level=None)
+        self.addCleanup(other.close)
+        with transaction.atomic(using=self.alias):
+            #Nothing written yet, but a second writer is already locked out
+            self.pragma('user_version')
+            with self.assertRaisesMessage(sqlite3.OperationalError, 'locked'):
+                other.execute('BEGIN IMMEDIATE')
+        other.execute('BEGIN IMMEDIATE')
+        other.execute('ROLLBACK')
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    List reads go to the replica (mirrored onto the default test database)
+    until the client writes; the db_pin cookie then keeps its reads on default.
+
+    A TransactionTestCase: the replica is a second connection to the shared
+    in-memory test database and cannot read tables a TestCase transaction holds.
+    """
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', email='owner@example.com', password='pass12345')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def store_payload(self, name):
+        return {'name': name, 'address': '1 Main St', 'contact_number': '555', 'email': 'store@example.com'}
+
+    def list_stores(self):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.get('/api/inventory/stores/')
+        self.assertEqual(response.status_code, 200)
+        return primary, replica
+
+    def test_list_reads_from_replica(self):
+        primary, replica = self.list_stores()
+        self.assertTrue(any('inventory_store' in query['sql'] for query in replica))
+        self.assertFalse(any('inventory_store' in query['sql'] for query in primary))
+
+    def test_get_after_post_is_pinned_to_primary(self):
+        response = self.client.post('/api/inventory/stores/', self.store_payload('North'), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        primary, replica = self.list_stores()
+        self.assertFalse(any('inventory_store' in query['sql'] for query in replica))
+        self.assertTrue(any('inventory_store' in query['sql'] for query in primary))
+
+    def test_failed_write_does_not_pin(self):
+        response = self.client.post('/api/inventory/stores/', {'name': 'Incomplete'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+
+class BatchTests(TransactionTestCase):
+    """
+    Sub-requests run in order with one result each, and a failing one does not fail the batch.
+
+    A TransactionTestCase: concurrent GETs run on pool threads with their own connections.
+    """
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', email='owner@example.com', password='pass12345')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def batch(self, *requests):
+        return self.client.post('/api/batch/', {'requests': list(requests)}, format='json')
+
+    @override_settings(BATCH_API={'MAX_REQUESTS': 20, 'WORKERS': 2})
+    def test_results_follow_request_order(self):
+        store = {'name': 'North', 'address': '1 Main St', 'contact_number': '555', 'email': 'store@example.com'}
+        response = self.batch(
+            {'method': 'POST', 'path': '/api/inventory/stores/', 'body': store},
+            {'method': 'GET', 'path': '/api/inventory/stores/'},
+            {'method': 'GET', 'path': '/api/inventory/no-such-endpoint/'},
+            {'method': 'POST', 'path': '/api/inventory/stores/', 'body': {'name': 'Incomplete'}},
+        )
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual([result['status'] for result in results], [201, 200, 404, 400])
+        #The read after the write sees it
+        self.assertIn('North', json.dumps(results[1]['body']))
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+    def test_invalid_batches_are_rejected(self):
+        self.assertEqual(self.batch().status_code, 400)
+        self.assertEqual(self.batch({'method': 'GET', 'path': '/admin/'}).status_code, 400)
+        with override_settings(BATCH_API={'MAX_REQUESTS': 1, 'WORKERS': 0}):
+            response = self.batch(*[{'method': 'GET', 'path': '/api/inventory/stores/'}] * 2)
+        self.assertEqual(response.status_code, 400)
+
+
+class AdmissionGateTests(SimpleTestCase):
+    def test_full_gate_queues_then_sheds(self):
+        gate = AdmissionGate('heavy', concurrency=1, queue=1, queue_timeout_ms=10)
+        self.assertTrue(gate.acquire())
+        #Waits its queue timeout for the running request, then gives up
+        self.assertFalse(gate.acquire())
+        gate.release()
+        self.assertTrue(gate.acquire())
+        self.assertEqual({name: gate.stats()[name] for name in ('running', 'queued', 'peak_queued', 'admitted', 'shed')},
+                         {'running': 1, 'queued': 0, 'peak_queued': 1, 'admitted': 2, 'shed': 1})
+
+    def test_without_queue_sheds_at_once(self):
+        gate = AdmissionGate('heavy', concurrency=1)
+        self.assertTrue(gate.acquire())
+        self.assertFalse(gate.acquire())
+        self.assertEqual(gate.stats()['peak_queued'], 0)
+
+
+@override_settings(ADMISSION_CONTROL={'ENABLED': True, 'RETRY_AFTER': 3,
+                                      'CLASSES': {'heavy': {'CONCURRENCY': 1}, 'write': {'CONCURRENCY': 1}}})
+class AdmissionControlTests(TestCase):
+    """
+    A saturated class is shed with 503 and Retry-After, without holding back the other classes.
+    """
+    def setUp(self):
+        #get_gates keeps the process-wide gates of the settings it first saw
+        admission._gates = None
+        self.addCleanup(setattr, admission, '_gates', None)
+        self.user = User.objects.create_user(username='owner', email='owner@example.com', password='pass12345')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_saturated_class_is_shed(self):
+        heavy = admission.get_gates()['heavy']
+        self.assertTrue(heavy.acquire())
+        response = self.client.get('/api/inventory/reports/stock/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '3')
+        self.assertEqual(response.json()['status'], 'error')
+
+        response = self.client.post('/api/inventory/stores/', {
+            'name': 'North', 'address': '1 Main St', 'contact_number': '555', 'email': 'store@example.com',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        #The write released its slot
+        self.assertEqual(admission.get_gates()['write'].stats()['running'], 0)
+
+        heavy.release()
+        self.assertEqual(self.client.get('/api/inventory/reports/stock/').status_code, 200)
+        self.assertEqual(heavy.stats()['shed'], 1)
+
+
+class KDTreeTests(SimpleTestCase):
+    def test_matches_brute_force(self):
+        rng = np.random.default_rng(7)
+        points = [(key, to_unit_vector(lat, lon)) for key, (lat, lon) in
+                  enumerate(zip(rng.uniform(-90, 90, 500), rng.uniform(-180, 180, 500)))]
+        tree = KDTree(points)
+        for lat, lon in ((0, 179.9), (89.9, 0), (-45, -120), (12.5, 33)):
+            target = to_unit_vector(lat, lon)
+            expected = sorted((math.dist(coords, target), key) for key, coords in points)[:8]
+            self.assertEqual([key for _, key in tree.nearest(target, 8)], [key for _, key in expected])
+
+
+class NearestStoreTests(StockFixtureMixin, TransactionTestCase):
+    """
+    nearest/ lists the closest stores holding enough stock, across the antimeridian.
+
+    A TransactionTestCase: the lookup reads from the replica.
+    """
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.make_stock(quantity=0)
+        self.store.latitude, self.store.longitude = 0, 179
+        self.store.save()
+        self.stores = {'North': self.store}
+        for name, longitude, quantity in (('East', -179.5, 6), ('West', 170, 9), ('Far', 0, 50)):
+            store = Store.objects.create(name=name, address='1 Main St', contact_number='555', email='store@example.com',
+                                         latitude=0, longitude=longitude, created_by=self.user)
+            StoreInventory.objects.create(store=store, item=self.item, quantity=quantity)
+            self.stores[name] = store
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def nearest(self, **params):
+        response = self.client.get('/api/inventory/stores/nearest/', {'item': self.item.pk, **params})
+        self.assertEqual(response.status_code, 200)
+        return [(result['store']['name'], result['quantity']) for result in response.data['results']]
+
+    def test_nearest_stores_with_stock(self):
+        #North is nearest but holds none; East is across the antimeridian
+        self.assertEqual(self.nearest(lat=0, lon=179.9, k=2), [('East', 6), ('West', 9)])
+        self.assertEqual(self.nearest(lat=0, lon=179.9, min_qty=7), [('West', 9), ('Far', 50)])
+
+    def test_invalid_coordinates_are_rejected(self):
+        response = self.client.get('/api/inventory/stores/nearest/', {'item': self.item.pk, 'lat': 91, 'lon': 0})
+        self.assertEqual(response.status_code, 400)
+
+
+class ArchivedChangePaginationTests(StockFixtureMixin, TransactionTestCase):
+    """
+    Archived and live changes are paged as one list: every change shows up
+    on exactly one page and the count matches the pages.
+    """
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(CHANGE_ARCHIVE={'DIR': directory.name})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.make_stock()
+        old = retention_cutoff() - timedelta(days=3)
+        for number in range(5):
+            change = InventoryChange.objects.create(item=self.item, change_type='ADD', quantity_change=1,
+                                                    previous_quantity=number, new_quantity=number + 1,
+                                                    changed_by=self.user)
+            if number < 3:
+                InventoryChange.objects.filter(pk=change.pk).update(timestamp=old)
+        self.assertEqual(ChangeArchive().archive(), 3)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.start = (old - timedelta(days=1)).strftime('%Y-%m-%d')
+
+    def read_pages(self, ordering=''):
+        url = f'/api/inventory/inventory-changes/?start_date={self.start}&page_size=2&ordering={ordering}'
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.data)
+            url = response.data['next']
+        return pages
+
+    def test_pages_split_archived_and_live_rows_by_page_size(self):
+        pages = self.read_pages()
+        self.assertEqual([len(page['results']) for page in pages], [2, 2, 1])
+        self.assertEqual({page['count'] for page in pages}, {5})
+        quantities = [row['new_quantity'] for page in pages for row in page['results']]
+        self.assertEqual(quantities, [1, 2, 3, 4, 5])
+        self.assertEqual(pages[1]['results'][0]['item_name'], 'Milk')
+
+    def test_descending_pages_end_with_the_archive(self):
+        pages = self.read_pages('-timestamp')
+        self.assertEqual([len(page['results']) for page in pages], [2, 2, 1])
+        quantities = [row['new_quantity'] for page in pages for row in page['results']]
+        self.assertEqual(quantities, [5, 4, 3, 2, 1])
+
+
+class EstimatedCountTests(StockFixtureMixin, TestCase):
+    """
+    Past the threshold, per-owner counts on SQLite come from sqlite_stat1.
+    """
+    def setUp(self):
+        self.make_stock()
+        other = User.objects.create_user(username='other', email='other@example.com', password='pass12345')
+        other_item = InventoryItem.objects.create(name='Bread', quantity=0, price='1.00', created_by=other)
+        InventoryChange.objects.bulk_create(
+            [InventoryChange(item=self.item, owner=self.user, change_type='ADD', quantity_change=1,
+                             previous_quantity=0, new_quantity=1) for _ in range(30)]
+            + [InventoryChange(item=other_item, owner=other, change_type='ADD', quantity_change=1,
+                               previous_quantity=0, new_quantity=1) for _ in range(10)]
+        )
+        with connections['default'].cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def test_owner_filter_is_estimated_from_index_statistics(self):
+        count, is_estimate = bounded_count(InventoryChange.objects.filter(owner=self.user), threshold=5)
+        #ANALYZE keeps the average per owner of (owner, id): 40 rows over 2 owners
+        self.assertEqual((count, is_estimate), (20, True))
+
+    def test_filter_without_estimate_counts_once_without_probing(self):
+        with CaptureQueriesContext(connections['default']) as queries:
+            count, is_estimate = bounded_count(InventoryChange.objects.filter(notes=''), threshold=5)
+        self.assertEqual((count, is_estimate), (40, False))
+        self.assertEqual([query['sql'] for query in queries if 'LIMIT' in query['sql']], [])
+
+
+class AnalyticsKeyTests(TestCase):
+    """
+    Sales are matched to their own (store, item) even with shard-range ids.
+    """
+    def test_stores_sharing_low_id_bits_are_kept_apart(self):
+        user = User.objects.create_user(username='owner', email='owner@example.com', password='pass12345')
+        item = InventoryItem.objects.create(id=10**12 + 5, name='Milk', quantity=20, price='2.50', created_by=user)
+        stores = [Store.objects.create(id=store_id, name=f'Store {store_id}', address='1 Main St',
+                                       contact_number='555', email='store@example.com', created_by=user)
+                  for store_id in (10**12 + 1, 10**12 + 9)]
+        for store in stores:
+            StoreInventory.objects.create(store=store, item=item, quantity=10)
+        #Bit-packed keys of these two stores collide, and matched the sale to the first one
+        StoreInventoryChange.objects.create(store=stores[1], item=item, change_type='REMOVE', quantity_change=-4,
+                                            previous_quantity=10, new_quantity=6)
+
+        units = {row.store_id: row.units_sold for row in ItemAnalyticsManager.compute([store.id for store in stores])}
+        self.assertEqual(units, {stores[0].id: 0, stores[1].id: 4})
+
+
+class AnalyticsRefreshTests(StockFixtureMixin, TestCase):
+    """
+    Incremental refreshes pick up repriced items, and keep unsettled movements past the watermark.
+    """
+    def setUp(self):
+        self.make_stock(quantity=10)
+        StoreInventoryChange.objects.create(store=self.store, item=self.item, change_type='REMOVE',
+                                            quantity_change=-4, previous_quantity=10, new_quantity=6)
+
+    def test_price_change_refreshes_the_store(self):
+        ItemAnalyticsManager.refresh()
+        self.assertEqual(ItemAnalytics.objects.get(item=self.item).consumption_value, 10.0)
+        self.item.price = '5.00'
+        self.item.save()
+        run = ItemAnalyticsManager.refresh()
+        self.assertEqual(run.stores_refreshed, 1)
+        self.assertEqual(ItemAnalytics.objects.get(item=self.item).consumption_value, 20.0)
+
+    @override_settings(ANALYTICS={'SETTLE_SECONDS': 60})
+    def test_watermark_stays_behind_unsettled_movements(self):
+        run = ItemAnalyticsManager.refresh()
+        self.assertEqual(run.last_change_id, 0)
+        self.assertIn(self.store.pk, ItemAnalyticsManager.dirty_stores(run, timezone.now()))
+
+
+class ReconcileRangeTests(TestCase):
+    def test_ranges_cover_existing_ids_only(self):
+        user = User.objects.create_user(username='owner', email='owner@example.com', password='pass12345')
+        for item_id in (1, 2, 3, 4, 10**12 + 1, 2 * 10**12 + 7):
+            InventoryItem.objects.create(id=item_id, name=f'Item {item_id}', quantity=0, price='1.00',
+                                         created_by=user)
+        self.assertEqual(id_ranges(2), [(1, 3), (3, 10**12 + 1), (10**12 + 1, 2 * 10**12 + 8)])
+
+
+class AvailabilityIndexTests(TestCase):
+    """
+    The index keeps one block per owner, and its checksum matches the database's.
+    """
+    def make_owner(self, username, store_ids, item_ids, quantity):
+        user = User.objects.create_user(username=username, email=f'{username}@example.com', password='pass12345')
+        for item_id in item_ids:
+            InventoryItem.objects.create(id=item_id, name=f'Item {item_id}', quantity=0, price='1.00', created_by=user)
+        for store_id in store_ids:
+            store = Store.objects.create(id=store_id, name=f'Store {store_id}', address='1 Main St',
+                                         contact_number='555', email='store@example.com', created_by=user)
+            for item_id in item_ids:
+                StoreInventory.objects.create(store=store, item_id=item_id, quantity=quantity)
+        return user
+
+    def test_blocks_are_per_owner(self):
+        first = self.make_owner('first', [1, 2], [1, 2, 3], 4)
+        second = self.make_owner('second', [3], [4], 6)
+        index = AvailabilityIndex()
+        index.load()
+
+        self.assertEqual({owner: block.matrix[:len(block.store_offsets), :len(block.item_offsets)].shape
+                          for owner, block in index.owners.items()}, {first.pk: (2, 3), second.pk: (1, 1)})
+        self.assertEqual(index.quantities(first.pk, [1, 4]), {1: {1: 4, 2: 4}, 4: {1: 0, 2: 0}})
+        self.assertEqual(index.quantities(second.pk, [4], store_id=3), {4: 6})
+        self.assertEqual(index.quantities(second.pk, [1], store_id=1), {1: 0})
+
+    def test_checksum_matches_the_database_past_64_bits(self):
+        #quantity x store_id x 1000003 would overflow int64 here
+        self.make_owner('large', [10**12 + 1, 10**12 + 2], [10**12 + 5], 2**31 - 1)
+        index = AvailabilityIndex()
+        index.load()
+        self.assertEqual(index.checksum(), database_checksum())
+
+        index.set_quantity(10**12 + 1, User.objects.get(username='large').pk, 10**12 + 5, 1)
+        self.assertNotEqual(index.checksum(), database_checksum())
+
+
+class ChangeArchiveTests(StockFixtureMixin, TestCase):
+    """
+    Archive parts are split by owner, and reading one owner's history opens only theirs.
+    """
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(CHANGE_ARCHIVE={'DIR': directory.name})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.root = os.path.join(directory.name, 'inventory_changes')
+
+        self.make_stock()
+        self.other = User.objects.create_user(username='other', email='other@example.com', password='pass12345')
+        other_item = InventoryItem.objects.create(name='Bread', quantity=0, price='1.00', created_by=self.other)
+        for item in (self.item, other_item):
+            InventoryChange.objects.create(item=item, change_type='ADD', quantity_change=1, previous_quantity=0,
+                                           new_quantity=1)
+        self.yesterday = timezone.now() - timedelta(days=1)
+        InventoryChange.objects.update(timestamp=self.yesterday)
+
+    def test_retention_days_zero_is_honoured(self):
+        call_command('archive_inventory_changes', retention_days=365, stdout=io.StringIO())
+        self.assertEqual(InventoryChange.objects.count(), 2)
+        call_command('archive_inventory_changes', retention_days=0, stdout=io.StringIO())
+        self.assertEqual(InventoryChange.objects.count(), 0)
+
+    def test_read_opens_only_the_owners_parts(self):
+        call_command('archive_inventory_changes', retention_days=0, stdout=io.StringIO())
+        month = f"{self.yesterday:%Y-%m}"
+        self.assertEqual(sorted(os.listdir(os.path.join(self.root, month))), sorted([str(self.user.pk),
+                                                                                      str(self.other.pk)]))
+        with mock.patch('inventory.archive.np.load', wraps=np.load) as load:
+            rows = ChangeArchive().read(self.user.pk)
+        self.assertEqual([row['item'] for row in rows], [self.item.pk])
+        self.assertEqual([os.path.basename(os.path.dirname(call.args[0])) for call in load.call_args_list],
+                         [str(self.user.pk)])
+
+
+class DeltaSyncTests(TestCase):
+    """
+    The change log keeps one row per object and only hands out settled cursors.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', email='owner@example.com', password='pass12345')
+        self.category = Category.objects.create(name='Produce')
+
+    def test_repeated_changes_upsert_one_row_with_a_new_sequence(self):
+        first = SyncChange.objects.get(model='category', object_id=self.category.pk)
+        record_changes(Category, [(self.category.pk, None), (self.category.pk, None)])
+        second = SyncChange.objects.get(model='category', object_id=self.category.pk)
+        self.assertEqual(first.pk, second.pk)
+        self.assertGreater(second.seq, first.seq)
+
+    @override_settings(SYNC={'SETTLE_SECONDS': 0})
+    def test_cursor_moves_past_settled_changes(self):
+        entries, cursor, has_more = changes_since(self.user, 0, 10)
+        self.assertEqual([entry.object_id for entry in entries], [self.category.pk])
+        self.assertEqual(cursor, entries[0].seq)
+        self.assertFalse(has_more)
+
+    @override_settings(SYNC={'SETTLE_SECONDS': 30})
+    def test_cursor_waits_for_unsettled_changes(self):
+        entries, cursor, has_more = changes_since(self.user, 0, 10)
+        #The fresh change is returned, but a lower sequence may still commit after it
+        self.assertEqual([entry.object_id for entry in entries], [self.category.pk])
+        self.assertEqual(cursor, 0)
+        self.assertFalse(has_more)
+
+
+class LotDepletionTests(StockFixtureMixin, TestCase):
+    """
+    Every path lowering a store's quantity takes the units from its lots, earliest expiry first.
+    """
+    def setUp(self):
+        self.make_stock(quantity=10)
+        self.add_lots(4, 6)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_update_depletes_earliest_lots(self):
+        response = self.client.patch(f'/api/inventory/store-inventory/{self.row.pk}/', {'quantity': 5},
+                                     format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.lot_quantities(), [0, 5])
+
+    def test_count_shortfall_depletes_lots(self):
+        count = StockCount.objects.create(store=self.store, created_by=self.user)
+        StockCountManager.record_lines(count, {self.item.pk: 3})
+        self.assertEqual(StockCountManager.approve(count, self.user), 1)
+        self.assertEqual(self.lot_quantities(), [0, 3])
+
+    def test_count_surplus_leaves_lots(self):
+        count = StockCount.objects.create(store=self.store, created_by=self.user)
+        StockCountManager.record_lines(count, {self.item.pk: 12})
+        StockCountManager.approve(count, self.user)
+        self.assertEqual(self.lot_quantities(), [4, 6])
+
+    def test_delete_empties_lots(self):
+        response = self.client.delete(f'/api/inventory/store-inventory/{self.row.pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.lot_quantities(), [0, 0])
+
+
+class ExpirySweepTests(StockFixtureMixin, TestCase):
+    """
+    Sweeps rely on the unique_open_alert constraint instead of reading the open alerts first.
+    """
+    def setUp(self):
+        self.make_stock(quantity=10)
+        self.add_lots(4, 6)
+        InventoryAlert.objects.filter(alert_type='EXPIRY').delete()
+
+    def test_repeated_sweeps_keep_one_open_alert(self):
+        self.assertEqual(LotManager.sweep_expiring(days=100000), 1)
+        first = InventoryAlert.objects.get(alert_type='EXPIRY', is_resolved=False)
+        self.assertEqual(LotManager.sweep_expiring(days=100000), 1)
+        self.assertEqual(list(InventoryAlert.objects.filter(alert_type='EXPIRY').values_list('pk', flat=True)),
+                         [first.pk])
+
+    def test_resolved_alert_is_raised_again(self):
+        LotManager.sweep_expiring(days=100000)
+        InventoryAlert.objects.filter(alert_type='EXPIRY').update(is_resolved=True, resolved_at=timezone.now())
+        LotManager.sweep_expiring(days=100000)
+        self.assertEqual(InventoryAlert.objects.filter(alert_type='EXPIRY', is_resolved=False).count(), 1)
+
+
+class VersionedUpdateTests(StockFixtureMixin, TestCase):
+    """
+    Versioned rows only take updates made against the version last read.
+    """
+    def setUp(self):
+        self.make_stock(quantity=10)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/inventory/store-inventory/{self.row.pk}/'
+
+    def patch(self, data, **headers):
+        return self.client.patch(self.url, data, format='json', headers=headers)
+
+    def test_if_match_guards_updates(self):
+        response = self.patch({'reorder_point': 5}, **{'If-Match': f'"{self.row.version}"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], f'"{self.row.version + 1}"')
+
+        response = self.patch({'reorder_point': 7}, **{'If-Match': f'"{self.row.version}"'})
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(response.data['status'], 'error')
+        self.row.refresh_from_db()
+        self.assertEqual(self.row.reorder_point, 5)
+
+    def test_updates_write_changed_fields_only(self):
+        with CaptureQueriesContext(connections['default']) as queries:
+            self.assertEqual(self.patch({'reorder_point': 5, 'quantity': 10}).status_code, 200)
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "inventory_storeinventory"')]
+        self.assertTrue(updates)
+        self.assertFalse(any('"quantity"' in sql for sql in updates))
+
+    def test_stale_instance_save_conflicts(self):
+        stale = InventoryItem.objects.get(pk=self.item.pk)
+        self.item.name = 'Whole milk'
+        self.item.save()
+        stale.name = 'Skimmed milk'
+        with self.assertRaises(VersionConflict):
+            stale.save()
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.name, 'Whole milk')
+
+
+class WriteCoalescingTests(StockFixtureMixin, TransactionTestCase):
+    """
+    Concurrent adjustments of one item commit as one group, checked in arrival order.
+
+    A TransactionTestCase: grouped requests run on their own threads and connections.
+    """
+    def setUp(self):
+        self.make_stock(quantity=10)
+
+    def test_group_checks_each_adjustment_against_the_running_quantity(self):
+        adjustments = [_Adjustment(change, self.user, '') for change in (5, -20, -12, 1)]
+        with CaptureQueriesContext(connections['default']) as queries:
+            apply_adjustments(self.item.pk, adjustments)
+
+        self.assertEqual([adjustment.result and adjustment.result[:2] for adjustment in adjustments],
+                         [(10, 15), None, (15, 3), (3, 4)])
+        self.assertIsInstance(adjustments[1].error, InsufficientStock)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.quantity, 4)
+        self.assertEqual(list(InventoryChange.objects.filter(item=self.item).order_by('id')
+                              .values_list('previous_quantity', 'new_quantity')), [(10, 15), (15, 3), (3, 4)])
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE "inventory_inventoryitem"')]), 1)
+
+    def test_concurrent_requests_share_one_commit(self):
+        coalescer = StockWriteCoalescer(window_ms=5000, max_batch=3)
+        version = self.item.version
+        results = {}
+
+        def adjust(change):
+            try:
+                results[change] = coalescer.adjust(self.item.pk, change, self.user)[:2]
+            except InsufficientStock as exc:
+                results[change] = exc
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=adjust, args=(change,)) for change in (-4, -8, 3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+
+        self.item.refresh_from_db()
+        #A full group is applied at once, as one UPDATE of the item
+        self.assertEqual(self.item.version, version + 1)
+        self.assertEqual(self.item.quantity, 10 + sum(change for change, result in results.items()
+                                                      if not isinstance(result, Exception)))
+        self.assertEqual(len(results), 3)
+        self.assertEqual(InventoryChange.objects.filter(item=self.item).count(),
+                         sum(not isinstance(result, Exception) for result in results.values()))
+
+
+class UrgentRestockTests(StockFixtureMixin, TransactionTestCase):
+    """
+    urgent/ serves the k rows most in need of restocking, kept scored through repricing.
+
+    A TransactionTestCase: the list is read from the replica.
+    """
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.make_stock(quantity=30)
+        self.rows = {self.row.item.name: self.row}
+        for name, quantity, price in (('Bread', 5, '2.00'), ('Eggs', 15, '2.00'), ('Salt', 0, '1.00')):
+            item = InventoryItem.objects.create(name=name, quantity=quantity, price=price, created_by=self.user)
+            self.rows[name] = StoreInventory.objects.create(store=self.store, item=item, quantity=quantity)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def urgent(self, **params):
+        response = self.client.get('/api/inventory/store-inventory/urgent/', params)
+        self.assertEqual(response.status_code, 200)
+        return [self.rows_by_id[row['id']] for row in response.data['results']]
+
+    @property
+    def rows_by_id(self):
+        return {row.pk: name for name, row in self.rows.items()}
+
+    def test_most_urgent_first(self):
+        #Milk is above its reorder point and never listed
+        self.assertEqual(self.urgent(), ['Bread', 'Salt', 'Eggs'])
+        self.assertEqual(self.urgent(k=2, store=self.store.pk), ['Bread', 'Salt'])
+
+    def test_price_change_rescores_rows(self):
+        salt = self.rows['Salt'].item
+        salt.price = '10.00'
+        salt.save()
+        self.assertEqual(self.urgent(k=1), ['Salt'])
+
+    def test_invalid_parameters_are_rejected(self):
+        for params in ({'k': '0'}, {'k': 'ten'}, {'store': 'north'}):
+            response = self.client.get('/api/inventory/store-inventory/urgent/', params)
+            self.assertEqual(response.status_code, 400, params)
+
+
+class CheckOwnersTests(StockFixtureMixin, TestCase):
+    def setUp(self):
+        self.make_stock(quantity=10)
+        self.other = User.objects.create_user(username='other', email='other@example.com', password='pass12345')
+        StoreInventory.objects.filter(pk=self.row.pk).update(owner=self.other)
+
+    def check(self, *args):
+        stdout = io.StringIO()
+        call_command('check_owners', *args, '--batch-size', '1', stdout=stdout, stderr=io.StringIO())
+        return stdout.getvalue()
+
+    def test_saved_rows_copy_their_owner(self):
+        #self.row is the instance as saved, before setUp corrupted its copy
+        self.assertEqual(self.row.owner_id, self.user.pk)
+        change = InventoryChange.objects.create(item=self.item, change_type='ADD', quantity_change=1,
+                                                previous_quantity=10, new_quantity=11, changed_by=self.other)
+        self.assertEqual(change.owner_id, self.user.pk)
+
+    def test_reports_mismatches(self):
+        with self.assertRaises(CommandError) as raised:
+            self.check()
+        self.assertEqual(raised.exception.returncode, 1)
+        self.row.refresh_from_db()
+        self.assertEqual(self.row.owner_id, self.other.pk)
+
+    def test_fix_rewrites_mismatches(self):
+        self.assertIn('StoreInventory: 1 mismatched (fixed)', self.check('--fix'))
+        self.row.refresh_from_db()
+        self.assertEqual(self.row.owner_id, self.user.pk)
+        self.assertIn('StoreInventory: 0 mismatched', self.check())
+
+
+class StoreLedgerTests(StockFixtureMixin, TransactionTestCase):
+    """
+    Every store quantity change is recorded, and history/ pages through it newest first.
+
+    A TransactionTestCase: history is read from the replica.
+    """
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.make_stock(quantity=10)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_writes_are_recorded_and_paged(self):
+        response = self.client.patch(f'/api/inventory/store-inventory/{self.row.pk}/', {'quantity': 4}, format='json')
+        self.assertEqual(response.status_code, 200)
+        count = StockCount.objects.create(store=self.store, created_by=self.user)
+        StockCountManager.record_lines(count, {self.item.pk: 7})
+        StockCountManager.approve(count, self.user)
+
+        url = f'/api/inventory/store-inventory/{self.row.pk}/history/'
+        movements = []
+        while url:
+            response = self.client.get(url, {'page_size': 1} if not movements else None)
+            self.assertEqual(response.status_code, 200)
+            movements += [(row['change_type'], row['previous_quantity'], row['new_quantity'])
+                          for row in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(movements, [('ADJUST', 4, 7), ('REMOVE', 10, 4)])
+
+
+class StockCountTests(StockFixtureMixin, TestCase):
+    def setUp(self):
+        self.make_stock(quantity=10)
+        self.count = StockCount.objects.create(store=self.store, created_by=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_malformed_lines_are_rejected(self):
+        url = f'/api/inventory/stock-counts/{self.count.pk}/lines/'
+        for body in ([{'item': self.item.pk, 'counted_quantity': 3}],
+                     {'lines': [self.item.pk]},
+                     {'lines': [{'item': self.item.pk, 'counted_quantity': -1}]}):
+            response = self.client.post(url, body, format='json')
+            self.assertEqual(response.status_code, 400, body)
+            self.assertEqual(response.data['status'], 'error')
+        self.assertFalse(self.count.lines.exists())
+
+    def test_approval_never_takes_the_item_below_zero(self):
+        #The item total has drifted below what the store holds
+        InventoryItem.objects.filter(pk=self.item.pk).update(quantity=4)
+        StockCountManager.record_lines(self.count, {self.item.pk: 0})
+        self.assertEqual(StockCountManager.approve(self.count, self.user), 1)
+        self.item.refresh_from_db()
+        self.row.refresh_from_db()
+        self.assertEqual((self.item.quantity, self.row.quantity), (0, 0))
+        change = InventoryChange.objects.get(item=self.item, change_type='ADJUST')
+        self.assertEqual((change.quantity_change, change.new_quantity), (-4, 0))
+
+
+class ReservationTests(StockFixtureMixin, TestCase):
+    def setUp(self):
+        self.make_stock(quantity=10)
+        self.add_lots(4, 6)
+
+    def api(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        return client
+
+    def test_commit_removes_stock_from_earliest_lots(self):
+        reservation = ReservationManager.reserve(self.user, self.store.pk, self.item.pk, 5)
+        ReservationManager.commit(reservation, self.user)
+        self.row.refresh_from_db()
+        self.assertEqual((self.row.quantity, self.row.reserved_quantity), (5, 0))
+        self.assertEqual(self.lot_quantities(), [0, 5])
+
+    def test_commit_refuses_when_quantity_was_lowered_below_the_hold(self):
+        reservation = ReservationManager.reserve(self.user, self.store.pk, self.item.pk, 5)
+        StoreInventory.objects.filter(pk=self.row.pk).update(quantity=3)
+        with self.assertRaises(ReservationError):
+            ReservationManager.commit(reservation, self.user)
+        reservation.refresh_from_db()
+        self.row.refresh_from_db()
+        self.assertEqual(reservation.status, 'ACTIVE')
+        self.assertEqual((self.row.quantity, self.row.reserved_quantity), (3, 5))
+        self.assertEqual(self.lot_quantities(), [4, 6])
+
+    def test_commit_refuses_when_the_store_row_is_gone(self):
+        reservation = ReservationManager.reserve(self.user, self.store.pk, self.item.pk, 5)
+        StoreInventory.objects.filter(pk=self.row.pk).delete()
+        response = self.api().post(f'/api/inventory/reservations/{reservation.pk}/commit/')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(StockReservation.objects.get(pk=reservation.pk).status, 'ACTIVE')
+
+    def test_commit_refuses_when_item_total_is_below_the_hold(self):
+        reservation = ReservationManager.reserve(self.user, self.store.pk, self.item.pk, 5)
+        InventoryItem.objects.filter(pk=self.item.pk).update(quantity=2)
+        with self.assertRaises(ReservationError):
+            ReservationManager.commit(reservation, self.user)
+        self.assertEqual(InventoryItem.objects.get(pk=self.item.pk).quantity, 2)
+
+    def test_store_quantity_cannot_drop_below_reserved(self):
+        ReservationManager.reserve(self.user, self.store.pk, self.item.pk, 5)
+        client = self.api()
+        response = client.patch(f'/api/inventory/store-inventory/{self.row.pk}/', {'quantity': 4}, format='json')
+        self.assertEqual(response.status_code, 409)
+        response = client.delete(f'/api/inventory/store-inventory/{self.row.pk}/')
+        self.assertEqual(response.status_code, 409)
+        self.row.refresh_from_db()
+        self.assertEqual((self.row.quantity, self.row.reserved_quantity), (10, 5))
+        response = client.patch(f'/api/inventory/store-inventory/{self.row.pk}/', {'quantity': 5}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_release_expired_returns_exactly_the_swept_holds(self):
+        lapsed = ReservationManager.reserve(self.user, self.store.pk, self.item.pk, 3, ttl_seconds=60)
+        ReservationManager.reserve(self.user, self.store.pk, self.item.pk, 2)
+        StockReservation.objects.filter(pk=lapsed.pk).update(expires_at=lapsed.created_at)
+        self.assertEqual(ReservationManager.release_expired(), 1)
+        self.row.refresh_from_db()
+        self.assertEqual(self.row.reserved_quantity, 2)
+        self.assertEqual(StockReservation.objects.get(pk=lapsed.pk).status, 'EXPIRED')
+
+
+class AlertAdminTests(StockFixtureMixin, TestCase):
+    """
+    The bulk resolve action works through the selection in bounded batches of ids.
+    """
+    def setUp(self):
+        self.make_stock()
+        self.model_admin = admin.site._registry[InventoryAlert]
+        for alert_type, _ in InventoryAlert.ALERT_TYPES:
+            #Stocking the row may already have raised some of them
+            InventoryAlert.objects.get_or_create(store=self.store, item=self.item, alert_type=alert_type,
+                                                 is_resolved=False)
+        self.earlier = timezone.now() - timedelta(days=1)
+        self.resolved_elsewhere = InventoryAlert.objects.get(alert_type='EXPIRY')
+        InventoryAlert.objects.filter(pk=self.resolved_elsewhere.pk).update(is_resolved=True,
+                                                                            resolved_at=self.earlier)
+        OutboxEvent.objects.all().delete()
+        SyncChange.objects.all().delete()
+
+    def test_resolve_alerts_batches_the_open_selection(self):
+        with mock.patch.object(self.model_admin, 'resolve_batch_size', 1), \
+                mock.patch.object(self.model_admin, 'message_user') as message_user:
+            self.model_admin.resolve_alerts(None, InventoryAlert.objects.all())
+
+        self.assertEqual(message_user.call_args.args[1], "Resolved 2 alerts.")
+        self.assertFalse(InventoryAlert.objects.filter(is_resolved=False).exists())
+        opened = InventoryAlert.objects.exclude(pk=self.resolved_elsewhere.pk).values_list('pk', flat=True)
+        self.assertEqual(set(OutboxEvent.objects.values_list('object_id', flat=True)), set(opened))
+        self.assertEqual(set(SyncChange.objects.values_list('object_id', flat=True)), set(opened))
+        #An alert resolved earlier keeps its own resolution time
+        self.assertEqual(InventoryAlert.objects.get(pk=self.resolved_elsewhere.pk).resolved_at, self.earlier)
+
+    def test_store_inventory_quantity_is_read_only(self):
+        self.assertIn('quantity', admin.site._registry[StoreInventory].get_readonly_fields(None))
+
+
+class CategoryNameTests(TransactionTestCase):
+    """
+    Case-insensitive duplicate category names are rejected by the unique
+    index on LOWER(name), not by a pre-check query.
+
+    A TransactionTestCase, so the interleaved rival request commits.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', email='owner@example.com', password='pass12345')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create(self, name):
+        return self.client.post('/api/inventory/categories/', {'name': name}, format='json')
+
+    def test_concurrent_duplicate_create_is_rejected(self):
+        #The rival request commits between this request's validation and its INSERT,
+        #the window a pre-check SELECT could not close
+        validate = CategorySerializer.validate
+        rival = {}
+
+        def interleaved(serializer, attrs):
+            if attrs['name'] == 'produce':
+                rival['response'] = self.create('PRODUCE')
+            return validate(serializer, attrs)
+
+        with mock.patch.object(CategorySerializer, 'validate', interleaved):
+            response = self.create('produce')
+        self.assertEqual(rival['response'].status_code, 201)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(Category.objects.values_list('name', flat=True)), ['PRODUCE'])
+
+    def test_duplicate_create_runs_no_pre_check_query(self):
+        self.create('Produce')
+        #BEGIN, Category.save's savepoint, the failing INSERT, its rollback and release, ROLLBACK
+        with self.assertNumQueries(6) as queries:
+            response = self.create('pRoDuCe')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse([query for query in queries.captured_queries if query['sql'].startswith('SELECT')])
+
+    def test_duplicate_in_bulk_create_rejects_the_batch(self):
+        with self.assertRaises(IntegrityError):
+            bulk_create_categories([{'name': 'Dairy'}, {'name': 'DAIRY'}])
+        self.assertFalse(Category.objects.filter(name__iexact='dairy').exists())
+
+
+class WebhookStub(BaseHTTPRequestHandler):
+    """
+    Local stand-in for a webhook: records each POSTed batch and answers with
+    the next status queued in `statuses` (200 once they run out).
+    """
+    received = []
+    statuses = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        status = self.statuses.pop(0) if self.statuses else 200
+        if status < 300:
+            self.received.append(body)
+        self.send_response(status)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class OutboxDeliveryTests(StockFixtureMixin, TestCase):
+    """
+    dispatch_outbox delivery to a webhook served by a local http.server stub.
+    """
+    def setUp(self):
+        WebhookStub.received, WebhookStub.statuses = [], []
+        self.server = HTTPServer(('127.0.0.1', 0), WebhookStub)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        outbox = override_settings(OUTBOX={
+            'DESTINATIONS': {'erp': {'URL': f'http://127.0.0.1:{self.server.server_port}/events', 'TIMEOUT': 5}},
+            'BATCH_SIZE': 100, 'LEASE_SECONDS': 60, 'MAX_BACKOFF_SECONDS': 300, 'SETTLE_SECONDS': 0,
+        })
+        outbox.enable()
+        self.addCleanup(outbox.disable)
+        #Saving the store row publishes a store_inventory.saved event
+        self.make_stock(quantity=10)
+        self.event_ids = list(OutboxEvent.objects.order_by('id').values_list('id', flat=True))
+
+    def delivered_ids(self):
+        return [event['id'] for batch in WebhookStub.received for event in batch['events']]
+
+    def test_delivers_pending_events_and_advances_the_cursor(self):
+        self.assertTrue(self.event_ids)
+        self.assertEqual(OutboxDispatcher().deliver('erp'), len(self.event_ids))
+        self.assertEqual(self.delivered_ids(), self.event_ids)
+        self.assertEqual(WebhookStub.received[0]['destination'], 'erp')
+        self.assertEqual(OutboxCursor.objects.get(destination='erp').last_event_id, self.event_ids[-1])
+        #Nothing new: nothing is sent again
+        self.assertEqual(OutboxDispatcher().deliver('erp'), 0)
+        self.assertEqual(len(WebhookStub.received), 1)
+
+    def test_failed_batch_backs_off_and_is_retried(self):
+        WebhookStub.statuses = [500]
+        dispatcher = OutboxDispatcher()
+        self.assertEqual(dispatcher.deliver('erp'), 0)
+        cursor = OutboxCursor.objects.get(destination='erp')
+        self.assertEqual((cursor.last_event_id, cursor.attempts), (0, 1))
+        self.assertGreater(cursor.next_attempt_at, timezone.now())
+        self.assertIn('500', cursor.last_error)
+
+        #Still backing off
+        self.assertEqual(dispatcher.deliver('erp'), 0)
+        OutboxCursor.objects.filter(destination='erp').update(next_attempt_at=timezone.now())
+        self.assertEqual(dispatcher.deliver('erp'), len(self.event_ids))
+        self.assertEqual(self.delivered_ids(), self.event_ids)
+        cursor.refresh_from_db()
+        self.assertEqual((cursor.last_event_id, cursor.attempts, cursor.last_error), (self.event_ids[-1], 0, ''))
+
+    def test_expired_lease_is_taken_over(self):
+        crashed = OutboxDispatcher()
+        self.assertIsNotNone(crashed._claim('erp'))
+
+        #The lease keeps a second dispatcher out until it expires
+        other = OutboxDispatcher()
+        self.assertEqual(other.deliver('erp'), 0)
+        OutboxCursor.objects.filter(destination='erp').update(leased_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(other.deliver('erp'), len(self.event_ids))
+
+        #The dispatcher that lost its lease can no longer move the cursor
+        self.assertEqual(crashed._release('erp', last_event_id=0), 0)
+        self.assertEqual(OutboxCursor.objects.get(destination='erp').last_event_id, self.event_ids[-1])
+
+
+class TenantShardTests(TransactionTestCase):
+    """
+    Tenants on two SQLite shards next to 'default': requests follow the
+    shard map, and a moved tenant keeps its ids without colliding with the
+    rows already on (or later written to) its new shard.
+
+    The shard aliases are registered for this class only, as files in a
+    temporary directory, and prepared with `migrate_shards`.
+    """
+    shards = ('shard_1', 'shard_2')
+    databases = {'default', 'replica'}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.shard_directory = tempfile.TemporaryDirectory()
+        for alias in cls.shards:
+            connections.settings[alias] = {**connections.settings['default'],
+                                           'NAME': os.path.join(cls.shard_directory.name, f'{alias}.sqlite3')}
+        #Declared here rather than on the class: the runner checks declared aliases before they exist
+        cls.databases = {*cls.databases, *cls.shards}
+        cls.shard_settings = override_settings(SHARD_DATABASES=['default', *cls.shards])
+        cls.shard_settings.enable()
+        super().setUpClass()
+        call_command('migrate_shards', verbosity=0, stdout=io.StringIO())
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.shard_settings.disable()
+        cls.databases = cls.databases - set(cls.shards)
+        for alias in cls.shards:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+        cls.shard_directory.cleanup()
+
+    def make_tenant(self, username, alias):
+        with override_settings(SHARD_NEW_TENANTS=alias):
+            user = User.objects.create_user(username=username, email=f'{username}@example.com', password='pass12345')
+        client = APIClient()
+        client.force_authenticate(user)
+        return user, client
+
+    def create_item(self, client, name):
+        response = client.post('/api/inventory/inventory-item/', {'name': name, 'quantity': 5, 'price': '2.50'},
+                               format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['data']['id']
+
+    def item_names(self, client):
+        response = client.get('/api/inventory/inventory-item/')
+        self.assertEqual(response.status_code, 200)
+        return [row['name'] for row in response.data['results']]
+
+    def item_ids(self):
+        return {alias: set(InventoryItem.objects.using(alias).values_list('id', flat=True))
+                for alias in ('default', *self.shards)}
+
+    def test_requests_route_to_the_tenants_shard(self):
+        _, first = self.make_tenant('first', 'shard_1')
+        _, second = self.make_tenant('second', 'shard_2')
+        first_id = self.create_item(first, 'Milk')
+        second_id = self.create_item(second, 'Bread')
+
+        self.assertEqual(self.item_ids(), {'default': set(), 'shard_1': {first_id}, 'shard_2': {second_id}})
+        #Each shard allocates ids from its own SHARD_ID_STRIDE range
+        self.assertEqual((first_id // 10**12, second_id // 10**12), (1, 2))
+        self.assertEqual(self.item_names(first), ['Milk'])
+        self.assertEqual(self.item_names(second), ['Bread'])
+
+    def test_moved_tenant_keeps_its_ids_and_new_ids_stay_unique(self):
+        mover, moving_client = self.make_tenant('mover', 'shard_1')
+        _, resident = self.make_tenant('resident', 'shard_2')
+        moved_id = self.create_item(moving_client, 'Milk')
+        resident_id = self.create_item(resident, 'Bread')
+
+        move_tenant(mover, 'shard_2', drain_seconds=0)
+
+        self.assertEqual(TenantShard.objects.get(user=mover).alias, 'shard_2')
+        self.assertEqual(self.item_ids(), {'default': set(), 'shard_1': set(), 'shard_2': {moved_id, resident_id}})
+        self.assertEqual(self.item_names(moving_client), ['Milk'])
+
+        new_ids = [self.create_item(moving_client, 'Eggs'), self.create_item(resident, 'Butter')]
+        ids = [moved_id, resident_id, *new_ids]
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertEqual(self.item_ids()['shard_2'], set(ids))
+
+    def test_saving_a_loaded_instance_is_refused_while_the_tenant_moves(self):
+        mover, client = self.make_tenant('mover', 'shard_1')
+        item = InventoryItem.objects.using('shard_1').get(pk=self.create_item(client, 'Milk'))
+        TenantShard.objects.filter(user=mover).update(is_moving=True)
+
+        request = RequestFactory().patch('/api/inventory/inventory-item/')
+        request.user = mover
+        item.quantity = 9
+        #The instance names its shard; the router must still refuse the write
+        with self.assertRaises(TenantMoving):
+            ShardRoutingMiddleware(lambda request: item.save(update_fields=['quantity']))(request)
+        self.assertEqual(InventoryItem.objects.using('shard_1').get(pk=item.pk).quantity, 5)
+
+
+class ObservedEvent(threading.Event):
+    #Signals `waiting` once a follower blocks on the flight
+    def __init__(self):
+        super().__init__()
+        self.waiting = threading.Event()
+
+    def wait(self, timeout=None):
+        self.waiting.set()
+        return super().wait(timeout)
+
+
+class SingleFlightTests(SimpleTestCase):
+    """
+    Concurrent identical calls in one process share the leader's computation.
+    """
+    key = ('user', '/api/inventory/store-inventory/', ())
+
+    def setUp(self):
+        cache.clear()
+        self.flight = SingleFlight()
+        self.leader_started = threading.Event()
+        self.leader_release = threading.Event()
+        self.outcomes = {}
+
+    def leader_compute(self, fail=False):
+        def compute():
+            self.leader_started.set()
+            self.leader_release.wait(5)
+            if fail:
+                raise ValueError("leader failed")
+            return 'leader'
+        return compute
+
+    def run_in_thread(self, name, compute):
+        def run():
+            try:
+                self.outcomes[name] = self.flight.do(self.key, compute)
+            except Exception as exc:
+                self.outcomes[name] = exc
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread
+
+    def run_pair(self, leader_compute, follower_compute):
+        leader = self.run_in_thread('leader', leader_compute)
+        self.assertTrue(self.leader_started.wait(5))
+        done = self.flight._flights[self.key].done = ObservedEvent()
+        follower = self.run_in_thread('follower', follower_compute)
+        self.assertTrue(done.waiting.wait(5))
+        self.leader_release.set()
+        leader.join(5)
+        follower.join(5)
+
+    def test_follower_shares_the_leaders_result(self):
+        follower_compute = mock.Mock(return_value='follower')
+        self.run_pair(self.leader_compute(), follower_compute)
+
+        self.assertEqual(self.outcomes, {'leader': ('leader', False), 'follower': ('leader', True)})
+        follower_compute.assert_not_called()
+        self.assertEqual(self.flight.counters, {'leader': 1, 'coalesced_local': 1})
+        self.assertEqual(self.flight.totals(), {'leader': 1, 'coalesced_local': 1, 'coalesced_remote': 0,
+                                                'timeout': 0})
+        self.flight.reset_totals()
+        self.assertEqual(set(self.flight.totals().values()), {0})
+
+    def test_follower_computes_itself_when_the_leader_fails(self):
+        self.run_pair(self.leader_compute(fail=True), lambda: 'follower')
+
+        self.assertIsInstance(self.outcomes['leader'], ValueError)
+        self.assertEqual(self.outcomes['follower'], ('follower', False))
+        self.assertEqual(self.flight.counters['coalesced_local'], 0)
+        self.assertEqual(self.flight._flights, {})
+
+    def test_other_process_takes_the_result_from_the_cache(self):
+        leader = self.run_in_thread('leader', self.leader_compute())
+        self.assertTrue(self.leader_started.wait(5))
+        #A second registry on the same cache stands in for another worker process
+        other = SingleFlight(poll_ms=1)
+        follower_compute = mock.Mock(return_value='follower')
+
+        def finish_leader(seconds):
+            #The other process is polling the leader's lock: let the leader store its result
+            self.leader_release.set()
+            leader.join(5)
+
+        with mock.patch('inventory.singleflight.time.sleep', side_effect=finish_leader):
+            self.assertEqual(other.do(self.key, follower_compute), ('leader', True))
+
+        follower_compute.assert_not_called()
+        self.assertEqual(other.counters, {'coalesced_remote': 1})
+        self.assertEqual(self.flight.totals()['coalesced_remote'], 1)
 
-# Create your tests here.
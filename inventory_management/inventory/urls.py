@@ -1,7 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from  .models import Category, InventoryItem, InventoryChange
-from .views import CategoryViewSet, InventoryItemViewSet, InventoryChangeViewSet, SupplierViewSet, StoreViewSet, StoreInventoryViewSet, StockReportView, AlertViewSet
+from .views import CategoryViewSet, InventoryItemViewSet, InventoryChangeViewSet, SupplierViewSet, StoreViewSet, StoreInventoryViewSet, StockReportView, AlertViewSet, SyncView, StockCountViewSet, StockLotViewSet, AvailabilityView, StockReservationViewSet, ItemAnalyticsViewSet
 
 router = DefaultRouter()
 
@@ -12,10 +12,16 @@ router.register(r'suppliers', SupplierViewSet, basename='supplier')
 router.register(r'stores', StoreViewSet, basename='store')
 router.register(r'store-inventory', StoreInventoryViewSet, basename='store-inventory')
 router.register(r'alerts', AlertViewSet, basename='inventory-alert')
+router.register(r'stock-counts', StockCountViewSet, basename='stock-count')
+router.register(r'stock-lots', StockLotViewSet, basename='stock-lot')
+router.register(r'reservations', StockReservationViewSet, basename='reservation')
+router.register(r'analytics', ItemAnalyticsViewSet, basename='item-analytics')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('reports/stock/', StockReportView.as_view(), name='stock-report'),
+    path('sync/', SyncView.as_view(), name='inventory-sync'),
+    path('availability/', AvailabilityView.as_view(), name='availability'),
     path('alerts/<int:pk>/reslove',
          AlertViewSet.as_view({'post': 'resolve_alert'}),
          name='invetory-alert-resolve'),
@@ -0,0 +1,20 @@
+from itertools import islice
+
+
+def chunked(iterable, size):
+    """
+    Splits an iterable into lists of at most `size` elements.
+
+    Used to keep `__in` lookups and bulk writes under the database's
+    bound-parameter limit (SQLite allows 32766 per statement).
+
+    Args:
+        iterable: Any iterable
+        size: int - maximum chunk length
+
+    Yields:
+        list: consecutive chunks of the iterable
+    """
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
@@ -1,24 +1,89 @@
 from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.pagination import CursorPagination
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import Category, InventoryItem, InventoryChange, Supplier, Store, StoreInventory, InventoryAlert
-from .serializers import CategorySerializer, InventoryItemSerializer, InventoryChangeSerializer, SupplierSerializer, StoreSerializer, StoreInventorySerializer, InventoryAlertSerializer
-from django_filters import FilterSet, BooleanFilter
-from django.db import models
+from .models import VersionConflict, Category, InventoryItem, InventoryChange, Supplier, Store, StoreInventory, InventoryAlert, StockCount, StockLot, StockReservation, StoreInventoryChange, ItemAnalytics, AnalyticsRun
+from .serializers import CategorySerializer, InventoryItemSerializer, InventoryChangeSerializer, SupplierSerializer, StoreSerializer, StoreInventorySerializer, InventoryAlertSerializer, StockCountSerializer, StockCountLinesSerializer, StockCountVarianceSerializer, StockLotSerializer, StockReservationSerializer, StoreInventoryChangeSerializer, ItemAnalyticsSerializer, BatchSerializer
+from django_filters import FilterSet, BooleanFilter, NumberFilter
+from django.db import models, transaction, IntegrityError
+from inventory_management.sharding import current_shard
+from inventory_management.admission import get_gates
 from rest_framework.views import APIView
 from .reports import InventoryReport
-from datetime import datetime
+from .sync import SYNCED_MODELS, changes_since
+from .counts import StockCountManager, owned_item_ids
+from .lots import LotManager
+from .availability import get_index
+from .spatial import locator
+from .reservations import ReservationManager, ReservationError
+from .ledger import store_change, record_store_changes
+from .categories import bulk_create_categories
+from .archive import ChangeArchive, retention_cutoff
+from .pagination import ConcatenatedRows, EstimatedCountPagination
+from .coalescing import InsufficientStock, get_coalescer
+from .batch import run_batch
+from .singleflight import coalesce_request
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from datetime import datetime, timedelta
 # Create your views here.
 
-#Custom pagination class that sets default page size and limits
-class StandardResultsSetPagination(PageNumberPagination):
+#Custom pagination class that sets default page size and limits; totals past
+#ESTIMATED_COUNT_THRESHOLD are estimated unless the client asks for ?count=exact
+class StandardResultsSetPagination(EstimatedCountPagination):
     page_size = 100
     page_size_query_param = 'page_size' #Allow client to override page size
     max_page_size = 1000        
 
+#Optimistic concurrency for viewsets of VersionedModel rows: responses carry
+#ETag: "<version>", and updates sent with If-Match only apply to that version
+class VersionedUpdateMixin:
+    def get_object(self):
+        obj = super().get_object()
+        self.versioned_object = obj
+        return obj
+
+    def check_version(self, instance):
+        """
+        Raises VersionConflict unless the If-Match header (if any) names the
+        instance's current version. The save itself re-checks the version in
+        its WHERE clause, catching changes made after this point.
+        """
+        header = self.request.headers.get('If-Match')
+        if not header or header.strip() == '*':
+            return
+        tags = {tag.strip().removeprefix('W/').strip('"') for tag in header.split(',')}
+        if str(instance.version) not in tags:
+            raise VersionConflict(f"{instance._meta.object_name} {instance.pk} is at version {instance.version}.")
+
+    def perform_update(self, serializer):
+        self.check_version(serializer.instance)
+        serializer.save()
+
+    def handle_exception(self, exc):
+        if isinstance(exc, VersionConflict):
+            return Response({
+                "status": "error",
+                "message": f"{exc} Reload it and retry."
+            }, status=status.HTTP_412_PRECONDITION_FAILED)
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        instance = getattr(self, 'versioned_object', None)
+        if instance is not None and response.status_code == 200 and \
+                getattr(self, 'action', None) in ('retrieve', 'update', 'partial_update'):
+            response['ETag'] = f'"{instance.version}"'
+        return super().finalize_response(request, response, *args, **kwargs)
+
+#Keyset pagination for ledgers: seeks by timestamp instead of counting and offsetting
+class StoreHistoryPagination(CursorPagination):
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    ordering = '-timestamp'
+
 #ViewSet for managing Categeory model objects
 class CategoryViewSet(viewsets.ModelViewSet):
     queryset = Category.objects.all()           #Get all categories
@@ -33,37 +98,44 @@ class CategoryViewSet(viewsets.ModelViewSet):
     def list(self, request):
         """
         List all categories with optional filtering and search
-        Includes the count of items in each category
+        Includes the count of items in each category (a stored counter, not an aggregate)
         """
         queryset = self.filter_queryset(self.get_queryset())
-        serializer = self.get_serializer(queryset, many=True)
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
         return Response ({
             "status": "success",
-            "count": queryset.count(),
+            **self.paginator.get_count_data(),
             "result": serializer.data
         })
 
 
     def create(self, request):
         """
-        creates a new category with validation for duplicate names
+        creates a new category (or a list of categories in one bulk insert);
+        duplicate names, case-insensitively, are rejected by the unique_category_name
+        constraint rather than a pre-check query, so concurrent creates cannot both succeed
         """
-        name = request.data.get('name', '').strip()
-        #check for existing category with same name (case-insensitive)
-        if Category.objects.filter(name__iexact=name).exists():
+        many = isinstance(request.data, list)
+        serializer = self.get_serializer(data=request.data, many=many)
+        serializer.is_valid(raise_exception=True)
+        try:
+            with transaction.atomic():
+                if many:
+                    bulk_create_categories(serializer.validated_data)
+                else:
+                    self.perform_create(serializer)
+        except IntegrityError:
             return Response({
                 'status': 'error',
                 'message': 'A category with the name already exist.'
             }, status=status.HTTP_400_BAD_REQUEST)
-        serializer = self.get_serializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-        self.perform_create(serializer)
         return Response({
             'status': 'success',
-            'message': 'Category created successfully.'
+            'message': 'Categories created successfully.' if many else 'Category created successfully.'
         }, status=status.HTTP_201_CREATED)
     
-    def retrieve(self, request):
+    def retrieve(self, request, pk=None):
         """
         Retrieve a category with its related name
         """
@@ -82,38 +154,42 @@ class CategoryViewSet(viewsets.ModelViewSet):
         })
     def update(self, request, pk=None):
         """
-        Updatwe a category with duplicate name validation
+        Updatwe a category, rejecting duplicate names
         """
         instance = self.get_object()
-        name = request.data.get('name', '').strip()
-
-        #check for existing category with same name, excluding current instance
-        if Category.objects.filter(name__iexact=name).exclude(pk=pk).exists():
+        serializer = self.get_serializer(instance, data=request.data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        #Duplicate names (case-insensitive) are caught by the unique_category_name constraint
+        try:
+            with transaction.atomic():
+                self.perform_update(serializer)
+        except IntegrityError:
             return Response({
                 "status": "error",
                 "message": "A category with this name already exists."
             }, status=status.HTTP_400_BAD_REQUEST)
-        serializer = self.get_serializer(instance, data=request.data, partial=True)
-        serializer.is_valid(raise_exception=True)
-        self.perform_update(serializer)
 
         return Response({
             "status": "success",
             "message": "Category updated successfully",
             "data": serializer.data
         })
-    def destroy(self, request):
+    def destroy(self, request, pk=None):
         """
-        Delete a category only if it has no items
+        Delete a category only if it has no items or subcategories
         """
         instance =self.get_object()
-        item_count = instance.items.count()
 
-        #Prevent deletion if category has items
-        if item_count > 0:
+        #Prevent deletion if category has items (read from the denormalized counter)
+        if instance.item_count > 0:
             return Response({
                 'status': 'error',
-                'message': f'Cannot delete category . It has {items_count} items attached to it.'
+                'message': f'Cannot delete category . It has {instance.item_count} items attached to it.'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if instance.children.exists():
+            return Response({
+                'status': 'error',
+                'message': 'Cannot delete category . It has subcategories.'
             }, status=status.HTTP_400_BAD_REQUEST)
         self.perform_destroy(instance)
         return Response({
@@ -121,12 +197,32 @@ class CategoryViewSet(viewsets.ModelViewSet):
             "message": "Category deleted successfully."
         }, status=status.HTTP_200_OK)
 
+#Custom FilterSet for InventoryItem filtering
+#category=<id>&include_descendants=1 matches the whole category subtree
+class InventoryItemFilterSet(FilterSet):
+    category = NumberFilter(method='filter_category')
+
+    class Meta:
+        model = InventoryItem
+        fields = ['category']
+
+    def filter_category(self, queryset, name, value):
+        """
+        Filters by one category, or by its subtree through one range scan on the category path index
+        """
+        if self.data.get('include_descendants') not in ('1', 'true', 'True'):
+            return queryset.filter(category_id=value)
+        path = Category.objects.filter(pk=value).values_list('path', flat=True).first()
+        if path is None:
+            return queryset.none()
+        return queryset.filter(**{f'category__{lookup}': bound for lookup, bound in Category.path_range(path).items()})
+
 #Viewset for managing in ventoryItem model objects  
-class InventoryItemViewSet(viewsets.ModelViewSet):
+class InventoryItemViewSet(VersionedUpdateMixin, viewsets.ModelViewSet):
     serializer_class = InventoryItemSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['category']
+    filterset_class = InventoryItemFilterSet
     search_fields = ['name', 'quantity', 'price', 'date_added']
     pagination_class = StandardResultsSetPagination
 
@@ -157,10 +253,11 @@ class InventoryItemViewSet(viewsets.ModelViewSet):
         Lists inventory items with counts
         """
         queryset = self.filter_queryset(self.get_queryset())
-        serializer = self.get_serializer(queryset, many=True)
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
         return Response({
             "status": "success",
-            "count": queryset.count(),
+            **self.paginator.get_count_data(),
             "results": serializer.data,
         })
     def create(self, request):
@@ -192,9 +289,10 @@ class InventoryItemViewSet(viewsets.ModelViewSet):
             "status": "success",
             "data": serializer.data
         }) 
-    def update(self, request, pk=None):
+    def update(self, request, pk=None, **kwargs):
         """
-        Update an inventory
+        Update an inventory item (PUT and PATCH both apply the fields sent);
+        honours If-Match and answers 412 on a version conflict
         """
         instance = self.get_object()
         serializer = self.get_serializer(instance, data=request.data, partial=True)
@@ -229,32 +327,54 @@ class InventoryItemViewSet(viewsets.ModelViewSet):
 
         if quantity_change == 0:
             return Response({'error': 'Quantity change cannot be zero'}, status=status.HTTP_400_BAD_REQUEST)
-            
-        #Calculate new quantity and validate
-        previous_quantity = item.quantity
-        new_quantity = previous_quantity + quantity_change
 
-        if new_quantity < 0:
+        #Hot items: queue with concurrent adjustments and commit them as one group
+        coalescer = get_coalescer()
+        if coalescer is not None:
+            try:
+                _, new_quantity, change = coalescer.adjust(item.pk, quantity_change, request.user, notes)
+            except InsufficientStock:
+                return Response({
+                    "status": "error",
+                    "message": "Insufficient stock"
+                }, status=status.HTTP_400_BAD_REQUEST)
+            item.quantity, item.last_updated = new_quantity, change.timestamp
             return Response({
-                "status": "error",
-                "message": "Insufficient stock"
-            }, status=status.HTTP_400_BAD_REQUEST)
-        
-        #create inventory change record
-        change_type = 'ADD' if quantity_change > 0 else 'REMOVE'
-        InventoryChange.objects.create(
-            item=item,
-            change_type=change_type,
-            quantity_change=quantity_change,
-            previous_quantity=previous_quantity,
-            new_quantity=new_quantity,
-            changed_by=request.user,
-            notes=notes
-        )
-
-        #Update item quantity
-        item.quantity = new_quantity
-        item.save()
+                "status": "success",
+                "message": "Stock adjusted successfully",
+                "data": self.get_serializer(item).data
+            })
+
+        #Read, check and write inside one write transaction so concurrent
+        #adjustments queue on the row (or on BEGIN IMMEDIATE under SQLite)
+        with transaction.atomic(using=current_shard()):
+            item = InventoryItem.objects.select_for_update().get(pk=item.pk)
+
+            #Calculate new quantity and validate
+            previous_quantity = item.quantity
+            new_quantity = previous_quantity + quantity_change
+
+            if new_quantity < 0:
+                return Response({
+                    "status": "error",
+                    "message": "Insufficient stock"
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            #create inventory change record
+            change_type = 'ADD' if quantity_change > 0 else 'REMOVE'
+            InventoryChange.objects.create(
+                item=item,
+                change_type=change_type,
+                quantity_change=quantity_change,
+                previous_quantity=previous_quantity,
+                new_quantity=new_quantity,
+                changed_by=request.user,
+                notes=notes
+            )
+
+            #Update item quantity
+            item.quantity = new_quantity
+            item.save()
 
         return Response({
             "status": "success",
@@ -272,20 +392,79 @@ class InventoryChangeViewSet(viewsets.ReadOnlyModelViewSet):
 
     def get_queryset(self):
         #Gets chasnges for items created by current user with select_related for optimization
-        return InventoryChange.objects.filter(item__created_by=self.request.user).select_related('item', 'changed_by')
+        return InventoryChange.objects.filter(owner=self.request.user).select_related('item', 'changed_by')
     
     def list(self, request):
         """
         List inventory changes with pagination
+
+        Optional start_date/end_date (YYYY-MM-DD) bound the period. When
+        start_date reaches past the retention window, archived changes from
+        the month-partitioned archive are paged together with the live rows:
+        ahead of them, or after them with ?ordering=-timestamp.
         """
+        try:
+            start = self._date_param('start_date')
+            end = self._date_param('end_date')
+        except ValueError:
+            return Response({
+                "status": "error",
+                "message": "Invalid date format. Use YYYY-MM-DD."
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if end is not None:
+            end += timedelta(days=1)
+
         queryset = self.filter_queryset(self.get_queryset())
-        serializer = self.get_serializer(queryset, many=True)
+        if start is not None:
+            queryset = queryset.filter(timestamp__gte=start)
+        if end is not None:
+            queryset = queryset.filter(timestamp__lt=end)
+
+        rows = queryset
+        if start is not None and start < retention_cutoff():
+            archived = ChangeArchive().read(
+                request.user.id, start, min(end, retention_cutoff()) if end else retention_cutoff(),
+                item_id=request.query_params.get('item') or None,
+                change_type=request.query_params.get('change_type') or None,
+            )
+            if archived:
+                descending = request.query_params.get('ordering') == '-timestamp'
+                if not queryset.ordered:
+                    queryset = queryset.order_by('pk')
+                rows = ConcatenatedRows(archived[::-1] if descending else archived, queryset,
+                                        rows_first=not descending)
+        page = self.paginate_queryset(rows)
+
+        #Archived rows are already dicts; serialize the live ones of the page in one pass
+        archived_page = [row for row in page if isinstance(row, dict)]
+        if archived_page:
+            self._add_names(archived_page)
+        live = iter(self.get_serializer([row for row in page if not isinstance(row, dict)], many=True).data)
+        results = [row if isinstance(row, dict) else next(live) for row in page]
+
         return Response({
             "status": "success",
             "message": "Inventory changes retrieved successfully",
-            "count": queryset.count(),
-            "results": serializer.data
+            **self.paginator.get_count_data(),
+            "results": results
         })
+
+    def _date_param(self, name):
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+        return timezone.make_aware(datetime.strptime(value, '%Y-%m-%d'))
+
+    @staticmethod
+    def _add_names(rows):
+        #Archived rows carry ids only; look the display names up in two queries
+        items = dict(InventoryItem.objects.filter(id__in={row['item'] for row in rows}).values_list('id', 'name'))
+        users = dict(get_user_model().objects.filter(
+            id__in={row['changed_by'] for row in rows if row['changed_by']}
+        ).values_list('id', 'username'))
+        for row in rows:
+            row['item_name'] = items.get(row['item'])
+            row['changed_by_username'] = users.get(row['changed_by'])
     
     def retrieve(self, request, pk=None):
         """
@@ -302,7 +481,7 @@ class InventoryChangeViewSet(viewsets.ReadOnlyModelViewSet):
     
 #Viewset for mamnaging sup[plier model objects
 #provides CRUD operations for supplier with authentication and filtering
-class SupplierViewSet(viewsets.ModelViewSet):
+class SupplierViewSet(VersionedUpdateMixin, viewsets.ModelViewSet):
     serializer_class = SupplierSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
@@ -335,6 +514,69 @@ class StoreViewSet(viewsets.ModelViewSet):
         #Sets created_by fields to curreent user when creating a store 
         serializer.save(created_by=self.request.user)
 
+    @action(detail=False, methods=['get'])
+    def nearest(self, request):
+        """
+        Nearest stores holding at least min_qty of an item.
+
+        Query params: item, lat, lon, min_qty (default 1), k (default 5, max 50).
+        Candidates come from the in-memory k-d tree nearest first; their stock is
+        checked in one batched lookup, widening the candidate set only if fewer
+        than k of them have enough stock.
+        """
+        try:
+            item_id = int(request.query_params['item'])
+            latitude = float(request.query_params['lat'])
+            longitude = float(request.query_params['lon'])
+            min_qty = int(request.query_params.get('min_qty', 1))
+            k = min(int(request.query_params.get('k', 5)), 50)
+        except (KeyError, ValueError):
+            return Response(
+                {"error": "item, lat and lon are required; min_qty and k must be integers"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180) or k < 1:
+            return Response(
+                {"error": "lat must be within [-90, 90], lon within [-180, 180] and k >= 1"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        tree_size = locator.tree_for(request.user.pk).size
+        candidates = min(tree_size, max(k * 4, 32))
+        checked = 0
+        matches = []
+        while True:
+            nearest = locator.nearest(request.user.pk, latitude, longitude, candidates)[checked:]
+            stock = self._stock_at(request.user, item_id, [store_id for _, store_id in nearest])
+            for distance, store_id in nearest:
+                quantity = stock.get(store_id, 0)
+                if quantity >= min_qty:
+                    matches.append((distance, store_id, quantity))
+            checked = candidates
+            if len(matches) >= k or candidates >= tree_size:
+                break
+            candidates = min(tree_size, candidates * 4)
+
+        matches = matches[:k]
+        stores = Store.objects.in_bulk([store_id for _, store_id, _ in matches])
+        return Response({
+            "status": "success",
+            "results": [{
+                "store": self.get_serializer(stores[store_id]).data,
+                "distance_km": round(distance, 3),
+                "quantity": quantity,
+            } for distance, store_id, quantity in matches]
+        })
+
+    def _stock_at(self, user, item_id, store_ids):
+        #Quantities of one item at the candidate stores, from the availability index when enabled
+        index = get_index()
+        if index is not None:
+            stock = index.quantities(user.pk, [item_id])[item_id]
+            return {store_id: stock.get(store_id, 0) for store_id in store_ids}
+        return dict(StoreInventory.objects.filter(item_id=item_id, store_id__in=store_ids)
+                    .values_list('store_id', 'quantity'))
+
 #Custom FilterSet for StoreInventory filtering
 #Adds additional filtering capabilities for inventory items
 class StoreInventoryFilterSet(FilterSet):
@@ -355,21 +597,115 @@ class StoreInventoryFilterSet(FilterSet):
     
 
 #ViewSet for managing StoreInventory model objects
-class StoreInventoryViewSet(viewsets.ModelViewSet):
+class StoreInventoryViewSet(VersionedUpdateMixin, viewsets.ModelViewSet):
     serializer_class = StoreInventorySerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_class = StoreInventoryFilterSet       #Uses custom filter set defined above
     ordering_fields = ['quantity', 'store_name', 'item_name']
+    replica_actions = ('list', 'urgent')
 
     def get_queryset(self):
         #Returns inventory items for stores created by current user
         #Uses select_related to optimize database queries
-        return StoreInventory.objects.filter(store__created_by=self.request.user).select_related('store', 'item')
-    
+        return StoreInventory.objects.filter(owner=self.request.user).select_related('store', 'item')
+
+    def list(self, request, *args, **kwargs):
+        #Identical concurrent lists (e.g. ?is_low_stock=true at store opening) share one computed page
+        page = super().list
+        return Response(coalesce_request(request, lambda: page(request, *args, **kwargs).data))
+
+    def perform_create(self, serializer):
+        with transaction.atomic(using=current_shard()):
+            instance = serializer.save()
+            record_store_changes([store_change(instance.store_id, instance.item_id, 0, instance.quantity,
+                                               self.request.user)])
+
+    def perform_update(self, serializer):
+        #Stock removed from a store leaves its lots first-expired-first-out
+        self.check_version(serializer.instance)
+        with transaction.atomic(using=current_shard()):
+            previous_quantity = serializer.instance.quantity
+            reserved = self._locked_reserved_quantity(serializer.instance)
+            if serializer.validated_data.get('quantity', previous_quantity) < reserved:
+                raise ReservationError(f"{reserved} units are reserved; release or commit the reservations "
+                                       f"before lowering the quantity below that.")
+            instance = serializer.save()
+            if instance.quantity < previous_quantity:
+                LotManager.deplete(instance.store_id, instance.item_id, previous_quantity - instance.quantity)
+            record_store_changes([store_change(instance.store_id, instance.item_id, previous_quantity,
+                                               instance.quantity, self.request.user)])
+
+    def perform_destroy(self, instance):
+        with transaction.atomic(using=current_shard()):
+            if self._locked_reserved_quantity(instance):
+                raise ReservationError("Units of this store item are reserved; release or commit the "
+                                       "reservations before deleting it.")
+            LotManager.deplete(instance.store_id, instance.item_id, instance.quantity)
+            record_store_changes([store_change(instance.store_id, instance.item_id, instance.quantity, 0,
+                                               self.request.user, notes='Store inventory record deleted')])
+            instance.delete()
+
+    @staticmethod
+    def _locked_reserved_quantity(instance):
+        #Locks the row so no reservation is placed between the check and the write
+        return (StoreInventory.objects.select_for_update().filter(pk=instance.pk)
+                .values_list('reserved_quantity', flat=True).first() or 0)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, ReservationError):
+            return Response({
+                "status": "error",
+                "message": str(exc)
+            }, status=status.HTTP_409_CONFLICT)
+        return super().handle_exception(exc)
+
+    @action(detail=True, methods=['get'])
+    def history(self, request, pk=None):
+        """
+        Movement history of one store item, newest first, keyset-paginated by timestamp
+        """
+        instance = self.get_object()
+        queryset = StoreInventoryChange.objects.filter(
+            store_id=instance.store_id, item_id=instance.item_id
+        ).select_related('changed_by')
+        paginator = StoreHistoryPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = StoreInventoryChangeSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'])
+    def urgent(self, request):
+        """
+        The k most urgent rows to restock (?k=, default 50, at most 1000),
+        across the user's stores or for one ?store=
+
+        Reads the first k entries of the partial urgency indexes, so the cost
+        grows with k rather than with the number of low stock rows
+        """
+        k = request.query_params.get('k', '50')
+        store = request.query_params.get('store')
+        if not k.isdigit() or int(k) < 1 or (store and not store.isdigit()):
+            return Response({
+                "status": "error",
+                "message": "k must be a positive integer and store a store id."
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = self.get_queryset().filter(urgency__gt=0)
+        if store:
+            queryset = queryset.filter(store_id=store)
+        serializer = self.get_serializer(queryset.order_by('-urgency')[:min(int(k), 1000)], many=True)
+        return Response({
+            "status": "success",
+            "count": len(serializer.data),
+            "results": serializer.data
+        })
+
 #View for generating stock reports
 class StockReportView(APIView):
     permission_classes = [IsAuthenticated]
+    use_read_replica = True         #Heavy report scans are served from the read replica
+    admission_class = 'heavy'       #Limited separately so reports cannot take the threads writes need
 
     def get(self, request):
         try:
@@ -386,7 +722,8 @@ class StockReportView(APIView):
             #Generate  and return the stock report
             report = InventoryReport(user=request.user, start_date=start_date, end_date=end_date, store=store_id)
 
-            report_data = report.generate_stock_report()
+            #Terminals opening a store request the same report at once: compute it once for all of them
+            report_data = coalesce_request(request, report.generate_stock_report)
             return Response(report_data)
         
         except ValueError as e:
@@ -415,7 +752,7 @@ class AlertViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         #Returns alerts for stores created by cureent user
         #Uses select_related for optimisation
-        return InventoryAlert.objects.filter(store__created_by=self.request.user).select_related('store', 'item')
+        return InventoryAlert.objects.filter(owner=self.request.user).select_related('store', 'item')
     
     @action(detail=True, methods=['post'])
     def resolve_alert(self, request, pk=None):
@@ -428,3 +765,425 @@ class AlertViewSet(viewsets.ModelViewSet):
     
 
 
+
+
+#View for incremental sync of offline clients
+class SyncView(APIView):
+    """
+    Returns the rows changed since a client's last sync sequence.
+
+    Query params:
+        since: last sequence the client applied (0 or omitted for a full sync)
+        limit: maximum changes per batch (default 500, max 5000)
+
+    The response carries changed rows grouped by model, ids of deleted rows,
+    and `next`, the sequence to pass as `since` for the following batch.
+    `next` only moves past settled changes (see changes_since), so the most
+    recent ones may be sent again by the next poll.
+    """
+    permission_classes = [IsAuthenticated]
+    default_limit = 500
+    max_limit = 5000
+
+    #Serializers and related fields used to render each synced model
+    sync_serializers = {
+        Category: (CategorySerializer, ()),
+        InventoryItem: (InventoryItemSerializer, ('category',)),
+        StoreInventory: (StoreInventorySerializer, ('store', 'item')),
+        InventoryAlert: (InventoryAlertSerializer, ()),
+    }
+
+    def get(self, request):
+        try:
+            since = int(request.query_params.get('since', 0))
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+        except ValueError:
+            return Response(
+                {"error": "since and limit must be integers"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        if since < 0 or limit < 1:
+            return Response(
+                {"error": "since must be >= 0 and limit >= 1"}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        entries, cursor, has_more = changes_since(request.user, since, limit)
+
+        changed = {}
+        deleted = {}
+        for entry in entries:
+            target = deleted if entry.is_deleted else changed
+            target.setdefault(entry.model, []).append(entry.object_id)
+
+        changes = {}
+        tombstones = {}
+        for model, (label, key, _) in SYNCED_MODELS.items():
+            serializer_class, related = self.sync_serializers[model]
+            ids = changed.get(label)
+            rows = model.objects.filter(pk__in=ids).select_related(*related) if ids else []
+            changes[key] = serializer_class(rows, many=True).data
+            tombstones[key] = deleted.get(label, [])
+
+        return Response({
+            "status": "success",
+            "since": since,
+            "next": cursor,
+            "has_more": has_more,
+            "changes": changes,
+            "deleted": tombstones,
+        })
+
+
+#ViewSet for cycle-count (stocktake) sessions
+class StockCountViewSet(viewsets.ModelViewSet):
+    serializer_class = StockCountSerializer
+    permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ['store', 'status']
+    ordering_fields = ['created_at', 'approved_at']
+    pagination_class = StandardResultsSetPagination
+    http_method_names = ['get', 'post', 'delete', 'head', 'options']     #Counts are changed through their actions only
+    heavy_actions = ('variance',)
+
+    def get_queryset(self):
+        #Returns counts created by the current user with their line totals
+        return StockCount.objects.filter(created_by=self.request.user).annotate(line_count=models.Count('lines'))
+
+    def perform_create(self, serializer):
+        serializer.save(created_by=self.request.user)
+
+    def _closed_response(self, count):
+        return Response({
+            "status": "error",
+            "message": f"Stock count is {count.get_status_display().lower()}."
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=True, methods=['post'])
+    def lines(self, request, pk=None):
+        """
+        Upload counted quantities as {"lines": [{"item": id, "counted_quantity": n}, ...]}.
+        Re-uploading an item replaces its earlier count.
+        """
+        count = self.get_object()
+        if count.status != 'OPEN':
+            return self._closed_response(count)
+
+        serializer = StockCountLinesSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({
+                "status": "error",
+                "message": "Each line needs an item id and a non-negative counted_quantity.",
+                "errors": serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+        lines = {line['item']: line['counted_quantity'] for line in serializer.validated_data['lines']}
+
+        unknown = set(lines) - owned_item_ids(request.user, lines)
+        if unknown:
+            return Response({
+                "status": "error",
+                "message": "Unknown inventory items.",
+                "items": sorted(unknown)
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        written = StockCountManager.record_lines(count, lines)
+        return Response({
+            "status": "success",
+            "message": f"{written} count lines recorded."
+        })
+
+    @action(detail=True, methods=['get'])
+    def variance(self, request, pk=None):
+        """
+        Variance report: summary totals plus the paginated lines whose count
+        differs from system stock (all lines with ?all=true).
+        """
+        count = self.get_object()
+        queryset = StockCountManager.variance_queryset(count)
+        summary = StockCountManager.variance_summary(queryset)
+
+        if request.query_params.get('all') not in ('true', '1'):
+            queryset = queryset.exclude(current_variance=0)
+        queryset = queryset.select_related('item').order_by('current_variance', 'item_id')
+
+        page = self.paginate_queryset(queryset)
+        serializer = StockCountVarianceSerializer(page, many=True)
+        return Response({
+            "status": "success",
+            "summary": summary,
+            **self.paginator.get_count_data(),
+            "results": serializer.data
+        })
+
+    @action(detail=True, methods=['post'])
+    def approve(self, request, pk=None):
+        """
+        Approve the count and apply every variance as an ADJUST inventory change
+        """
+        count = self.get_object()
+        if count.status != 'OPEN':
+            return self._closed_response(count)
+
+        adjusted = StockCountManager.approve(count, request.user)
+        if adjusted is None:
+            return self._closed_response(self.get_object())
+        return Response({
+            "status": "success",
+            "message": f"Stock count approved. {adjusted} items adjusted.",
+            "data": self.get_serializer(self.get_object()).data
+        })
+
+
+#ViewSet for managing stock lots and their expiry dates
+class StockLotViewSet(viewsets.ModelViewSet):
+    serializer_class = StockLotSerializer
+    permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = {
+        'store': ['exact'],
+        'item': ['exact'],
+        'expiry_date': ['lte', 'gte'],
+    }
+    ordering_fields = ['expiry_date', 'quantity', 'received_at']
+    ordering = ['expiry_date']
+    pagination_class = StandardResultsSetPagination
+
+    def get_queryset(self):
+        #Returns lots at stores created by the current user
+        return StockLot.objects.filter(store__created_by=self.request.user)
+
+
+#ViewSet for cached demand analytics (velocity, days of cover, ABC class)
+class ItemAnalyticsViewSet(viewsets.ReadOnlyModelViewSet):
+    serializer_class = ItemAnalyticsSerializer
+    permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = {
+        'store': ['exact'],
+        'item': ['exact'],
+        'abc_class': ['exact'],
+        'is_dead_stock': ['exact'],
+        'days_of_cover': ['lte', 'gte'],
+        'velocity': ['lte', 'gte'],
+    }
+    ordering_fields = ['velocity', 'days_of_cover', 'turnover', 'consumption_value', 'units_sold', 'quantity']
+    ordering = ['-consumption_value']
+    pagination_class = StandardResultsSetPagination
+    heavy_actions = ('summary',)
+
+    def get_queryset(self):
+        #Returns analytics of stores created by the current user
+        return ItemAnalytics.objects.filter(store__created_by=self.request.user).select_related('store', 'item')
+
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        """
+        Per-store totals by ABC class, plus dead stock counts
+        """
+        rows = (self.filter_queryset(self.get_queryset()).order_by()
+                .values('store_id', 'store__name', 'abc_class')
+                .annotate(items=models.Count('id'), value=models.Sum('consumption_value'),
+                          dead_stock=models.Count('id', filter=models.Q(is_dead_stock=True))))
+        stores = {}
+        for row in rows:
+            store = stores.setdefault(row['store_id'], {'store': row['store_id'], 'store_name': row['store__name'],
+                                                        'classes': {}, 'dead_stock_items': 0})
+            store['classes'][row['abc_class']] = {'items': row['items'], 'consumption_value': row['value']}
+            store['dead_stock_items'] += row['dead_stock']
+        last_run = AnalyticsRun.objects.order_by('-id').first()
+        return Response({
+            "status": "success",
+            "refreshed_at": last_run.refreshed_at if last_run else None,
+            "results": list(stores.values()),
+        })
+
+
+#View for instant stock availability checks
+class AvailabilityView(APIView):
+    """
+    Answers "how many of item X are at store Y / at all my stores".
+
+    Query params:
+        item or items: one item id or a comma separated list of ids
+        store: optional store id; when omitted every store of the user is reported
+
+    Served from the in-process availability index when it is enabled,
+    otherwise from StoreInventory.
+    """
+    permission_classes = [IsAuthenticated]
+    max_items = 1000
+
+    def get(self, request):
+        try:
+            raw_items = request.query_params.get('items') or request.query_params.get('item', '')
+            item_ids = [int(value) for value in raw_items.split(',') if value.strip()]
+            store_id = request.query_params.get('store')
+            store_id = int(store_id) if store_id else None
+        except ValueError:
+            return Response(
+                {"error": "item, items and store must be integer ids"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        if not item_ids or len(item_ids) > self.max_items:
+            return Response(
+                {"error": f"Provide between 1 and {self.max_items} item ids"}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        index = get_index()
+        if index is not None:
+            source = 'index'
+            quantities = index.quantities(request.user.pk, item_ids, store_id)
+        else:
+            source = 'database'
+            quantities = self._database_quantities(request.user, item_ids, store_id)
+
+        if store_id is not None:
+            results = [{"item": item_id, "store": store_id, "quantity": quantities[item_id]} for item_id in item_ids]
+        else:
+            results = [{
+                "item": item_id,
+                "total": sum(quantities[item_id].values()),
+                "stores": quantities[item_id],
+            } for item_id in item_ids]
+        return Response({
+            "status": "success",
+            "source": source,
+            "results": results
+        })
+
+    def _database_quantities(self, user, item_ids, store_id):
+        #Same shape as AvailabilityIndex.quantities, read from StoreInventory
+        rows = StoreInventory.objects.filter(owner=user, item_id__in=item_ids)
+        if store_id is not None:
+            found = dict(rows.filter(store_id=store_id).values_list('item_id', 'quantity'))
+            return {item_id: found.get(item_id, 0) for item_id in item_ids}
+        store_ids = list(Store.objects.filter(created_by=user).values_list('id', flat=True))
+        quantities = {item_id: dict.fromkeys(store_ids, 0) for item_id in item_ids}
+        for row_store, row_item, quantity in rows.values_list('store_id', 'item_id', 'quantity'):
+            quantities[row_item][row_store] = quantity
+        return quantities
+
+
+#ViewSet for reserving stock ahead of an order being paid or cancelled
+class StockReservationViewSet(viewsets.ReadOnlyModelViewSet):
+    serializer_class = StockReservationSerializer
+    permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ['store', 'item', 'status', 'reference']
+    ordering_fields = ['created_at', 'expires_at']
+    pagination_class = StandardResultsSetPagination
+
+    def get_queryset(self):
+        #Returns reservations created by the current user
+        return StockReservation.objects.filter(created_by=self.request.user)
+
+    def _conflict(self, error):
+        return Response({
+            "status": "error",
+            "message": str(error)
+        }, status=status.HTTP_409_CONFLICT)
+
+    def create(self, request):
+        """
+        Reserve stock: holds units without decrementing the quantity on hand
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            reservation = ReservationManager.reserve(
+                request.user, data['store'].pk, data['item'].pk, data['quantity'],
+                ttl_seconds=data.get('ttl_seconds'), reference=data.get('reference', ''),
+            )
+        except ReservationError as error:
+            return self._conflict(error)
+        return Response({
+            "status": "success",
+            "message": "Stock reserved successfully.",
+            "data": self.get_serializer(reservation).data
+        }, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'])
+    def commit(self, request, pk=None):
+        """
+        Commit a reservation: the held units leave stock
+        """
+        reservation = self.get_object()
+        try:
+            ReservationManager.commit(reservation, request.user)
+        except ReservationError as error:
+            return self._conflict(error)
+        return Response({
+            "status": "success",
+            "message": "Reservation committed.",
+            "data": self.get_serializer(reservation).data
+        })
+
+    @action(detail=True, methods=['post'])
+    def release(self, request, pk=None):
+        """
+        Release a reservation: the held units become available again
+        """
+        reservation = self.get_object()
+        try:
+            ReservationManager.release(reservation)
+        except ReservationError as error:
+            return self._conflict(error)
+        return Response({
+            "status": "success",
+            "message": "Reservation released.",
+            "data": self.get_serializer(reservation).data
+        })
+
+
+class BatchView(APIView):
+    """
+    Runs several API requests in one round trip.
+
+    Body:
+        requests: list of {method, path, body?, headers?}, at most
+            BATCH_API['MAX_REQUESTS']; paths are full API paths
+            ("/api/inventory/stores/?page=2")
+
+    The batch is authenticated once and each sub-request is dispatched to
+    its view in-process. Consecutive GETs run concurrently; results come
+    back in request order as {status, headers, body}, so one failing
+    sub-request does not fail the batch.
+    """
+    permission_classes = [IsAuthenticated]
+    allow_batching = False
+    admission_class = 'heavy'       #One batch may run up to BATCH_API['MAX_REQUESTS'] calls
+
+    def post(self, request):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results, wrote = run_batch(request._request, request.user, request.auth,
+                                   serializer.validated_data['requests'])
+        #Only pin the client to the primary database if a sub-request wrote
+        request._request.db_write = wrote
+        return Response({
+            "status": "success",
+            "message": f"{len(results)} requests processed.",
+            "results": results
+        })
+
+
+class AdmissionStatsView(APIView):
+    """
+    Admission control counters of this process, per endpoint class (staff only).
+
+    For each class: concurrency and queue limits, requests running and
+    queued now, the peak queue depth, and requests admitted and shed since
+    the process started.
+    """
+    permission_classes = [IsAdminUser]
+    admission_class = 'metrics'     #Not a limited class: stays reachable when the others are saturated
+
+    def get(self, request):
+        gates = get_gates()
+        if gates is None:
+            return Response({
+                "status": "error",
+                "message": "Admission control is disabled."
+            }, status=status.HTTP_404_NOT_FOUND)
+        return Response({
+            "status": "success",
+            "results": {name: gate.stats() for name, gate in gates.items()}
+        })
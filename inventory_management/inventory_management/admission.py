@@ -0,0 +1,172 @@
+"""
+Admission control: per-class concurrency limits with short bounded queues.
+
+AdmissionControlMiddleware sorts every request into an endpoint class:
+
+    heavy   views declaring `admission_class = 'heavy'` (the stock report,
+            batches) and viewset actions listed in `heavy_actions`
+    read    other GET, HEAD and OPTIONS requests
+    write   everything else
+
+Each class configured in ADMISSION_CONTROL['CLASSES'] may run at most
+CONCURRENCY requests at once per process. Further requests wait in a queue
+of at most QUEUE entries for up to QUEUE_TIMEOUT_MS; when the queue is full
+or the wait times out the request is shed with 503 and Retry-After, before
+authentication or any query runs. A saturated class therefore never holds
+the threads the other classes need: slow reports cannot starve
+adjust_stock writes. Classes without limits are never held back.
+
+Counters per class (running, queued, peak queue depth, admitted, shed) are
+served to staff users by api/admission/.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.http import JsonResponse
+from rest_framework import permissions
+
+HEAVY = 'heavy'
+READ = 'read'
+WRITE = 'write'
+
+
+def admission_settings():
+    return {'ENABLED': False, 'CLASSES': {}, 'RETRY_AFTER': 1, **getattr(settings, 'ADMISSION_CONTROL', {})}
+
+
+def classify(request, view_func):
+    """
+    Returns the endpoint class of a request routed to `view_func`.
+    """
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is not None:
+        declared = getattr(view_class, 'admission_class', None)
+        if declared:
+            return declared
+        actions = getattr(view_func, 'actions', None) or {}
+        if actions.get(request.method.lower()) in getattr(view_class, 'heavy_actions', ()):
+            return HEAVY
+    return READ if request.method in permissions.SAFE_METHODS else WRITE
+
+
+class AdmissionGate:
+    """
+    Concurrency limit and bounded wait queue of one endpoint class.
+    """
+    def __init__(self, name, concurrency, queue=0, queue_timeout_ms=0):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue = queue
+        self.queue_timeout = queue_timeout_ms / 1000
+        self.running = 0
+        self.queued = 0
+        self.peak_queued = 0
+        self.admitted = 0
+        self.shed = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """
+        Takes a slot, waiting in the queue if need be.
+
+        Returns:
+            bool: False if the request must be shed
+        """
+        with self._condition:
+            if self.running < self.concurrency and not self.queued:
+                self.running += 1
+                self.admitted += 1
+                return True
+            if self.queued >= self.queue:
+                self.shed += 1
+                return False
+            self.queued += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+            deadline = time.monotonic() + self.queue_timeout
+            try:
+                while self.running >= self.concurrency:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.shed += 1
+                        return False
+                    self._condition.wait(remaining)
+            finally:
+                self.queued -= 1
+            self.running += 1
+            self.admitted += 1
+            return True
+
+    def release(self):
+        with self._condition:
+            self.running -= 1
+            self._condition.notify()
+
+    def stats(self):
+        with self._condition:
+            return {
+                'concurrency': self.concurrency,
+                'running': self.running,
+                'queue': self.queue,
+                'queued': self.queued,
+                'peak_queued': self.peak_queued,
+                'admitted': self.admitted,
+                'shed': self.shed,
+            }
+
+
+_gates = None
+_gates_lock = threading.Lock()
+
+
+def get_gates():
+    """
+    Returns the process-wide gates by class name, or None when admission control is disabled.
+    """
+    global _gates
+    config = admission_settings()
+    if not config['ENABLED']:
+        return None
+    if _gates is None:
+        with _gates_lock:
+            if _gates is None:
+                _gates = {
+                    name: AdmissionGate(name, limits['CONCURRENCY'], limits.get('QUEUE', 0),
+                                        limits.get('QUEUE_TIMEOUT_MS', 0))
+                    for name, limits in config['CLASSES'].items()
+                }
+    return _gates
+
+
+class AdmissionControlMiddleware:
+    """
+    Holds or sheds requests per endpoint class; see the module docstring.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request._admission_gate = None
+        try:
+            return self.get_response(request)
+        finally:
+            if request._admission_gate is not None:
+                request._admission_gate.release()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        gates = get_gates()
+        if gates is None:
+            return None
+        gate = gates.get(classify(request, view_func))
+        if gate is None:
+            return None
+        if not gate.acquire():
+            retry_after = admission_settings()['RETRY_AFTER']
+            response = JsonResponse({
+                "status": "error",
+                "message": f"Too many {gate.name} requests in progress. Retry in {retry_after}s."
+            }, status=503)
+            response['Retry-After'] = str(retry_after)
+            return response
+        request._admission_gate = gate
+        return None
@@ -0,0 +1,50 @@
+"""
+Per-connection database tuning for the inventory_management project.
+"""
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """
+    Applies settings.SQLITE_PRAGMAS to every new SQLite connection.
+
+    synchronous=NORMAL is safe under WAL and avoids an fsync per commit, and
+    busy_timeout makes writers wait for the lock instead of failing
+    immediately. None of these write to the database file.
+
+    Args:
+        sender: The database wrapper class
+        connection: The DatabaseWrapper whose connection was just opened
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
+
+
+@receiver(post_migrate)
+def set_sqlite_journal_mode(sender, using, **kwargs):
+    """
+    Switches a migrated SQLite database to settings.SQLITE_JOURNAL_MODE.
+
+    The journal mode is stored in the database file itself, so it is set
+    once here rather than per connection: opening a connection (for
+    `manage.py check`, say) then never rewrites the file. WAL lets readers
+    run alongside the single writer.
+
+    Args:
+        sender: The AppConfig that was migrated
+        using: Alias of the migrated database
+    """
+    connection = connections[using]
+    mode = getattr(settings, 'SQLITE_JOURNAL_MODE', None)
+    if connection.vendor != 'sqlite' or not mode or connection.is_in_memory_db():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'PRAGMA journal_mode = {mode}')
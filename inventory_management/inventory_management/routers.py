@@ -0,0 +1,128 @@
+"""
+Database routing for the inventory_management project.
+
+Writes always go to the ``default`` database. Reads are sent to the read
+replica only when the current request has been marked as replica-safe by
+ReplicaRoutingMiddleware (report views and GET list endpoints), and only
+when the client has not written anything in the last few seconds.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from rest_framework import permissions
+
+
+# Alias that reads should use for the current request, or None for default
+_read_alias = ContextVar('read_alias', default=None)
+
+#Cookie set after a write so the client keeps reading its own writes
+PIN_COOKIE = 'db_pin'
+
+#Viewset actions that are served from the replica unless a view overrides it
+DEFAULT_REPLICA_ACTIONS = ('list',)
+
+
+def replica_alias():
+    """
+    Returns the configured replica alias, or None if no replica is configured.
+    """
+    alias = getattr(settings, 'REPLICA_DATABASE_ALIAS', 'replica')
+    return alias if alias in settings.DATABASES else None
+
+
+@contextmanager
+def read_from(alias):
+    """
+    Context manager that routes reads made inside the block to `alias`.
+
+    Args:
+        alias: Database alias to read from, or None to fall back to default
+    """
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def wants_replica(request, view_func):
+    """
+    Decide whether a request may be served from the read replica.
+
+    Only safe methods qualify. APIViews opt in with `use_read_replica = True`,
+    viewsets qualify when the routed action is listed in `replica_actions`
+    (defaults to the list action).
+    """
+    if request.method not in permissions.SAFE_METHODS:
+        return False
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return False
+    if getattr(view_class, 'use_read_replica', False):
+        return True
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(request.method.lower())
+    return action in getattr(view_class, 'replica_actions', DEFAULT_REPLICA_ACTIONS)
+
+
+class ReplicaRouter:
+    """
+    Sends reads to the replica for requests routed there by the middleware
+    and everything else (writes, migrations) to the default database.
+    """
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        #The replica mirrors default, so objects from either may be related
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        #The replica is populated by replication, never migrated directly
+        if db == replica_alias():
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Marks replica-safe requests so ReplicaRouter reads from the replica.
+
+    After a successful write the response carries a short-lived `db_pin`
+    cookie; while it is present every read goes to default so the client
+    always sees its own writes despite replication lag. Views that decide
+    for themselves whether a POST wrote anything (the batch endpoint) set
+    `request.db_write`.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request._read_alias_token = None
+        try:
+            response = self.get_response(request)
+        finally:
+            if request._read_alias_token is not None:
+                _read_alias.reset(request._read_alias_token)
+
+        wrote = getattr(request, 'db_write', request.method not in permissions.SAFE_METHODS)
+        if wrote and response.status_code < 400:
+            response.set_cookie(
+                PIN_COOKIE, '1',
+                max_age=getattr(settings, 'REPLICA_STICKY_SECONDS', 5),
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        alias = replica_alias()
+        if alias is None or request.COOKIES.get(PIN_COOKIE):
+            return None
+        if wants_replica(request, view_func):
+            request._read_alias_token = _read_alias.set(alias)
+        return None
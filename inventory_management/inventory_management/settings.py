@@ -10,9 +10,13 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import json
+import os
 from pathlib import Path
 from datetime import timedelta
 
+import dj_database_url
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -54,6 +58,9 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'inventory_management.routers.ReplicaRoutingMiddleware',
+    'inventory_management.sharding.ShardRoutingMiddleware',
+    'inventory_management.admission.AdmissionControlMiddleware',
 ]
 
 ROOT_URLCONF = 'inventory_management.urls'
@@ -80,13 +87,126 @@ WSGI_APPLICATION = 'inventory_management.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DATABASE_PROFILE selects the backend: 'sqlite' (default) or 'postgres'.
+DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE', 'sqlite')
+
+if DATABASE_PROFILE == 'postgres':
+    # Persistent connections with health checks, or a psycopg 3 connection
+    # pool when DATABASE_POOL=1 (pooling and CONN_MAX_AGE are exclusive).
+    DATABASE_POOL = os.environ.get('DATABASE_POOL', '0') == '1'
+
+    def _postgres(url):
+        database = dj_database_url.parse(
+            url,
+            conn_max_age=0 if DATABASE_POOL else int(os.environ.get('DATABASE_CONN_MAX_AGE', 600)),
+            conn_health_checks=True,
+        )
+        if DATABASE_POOL:
+            database['OPTIONS'] = {
+                'pool': {
+                    'min_size': int(os.environ.get('DATABASE_POOL_MIN_SIZE', 2)),
+                    'max_size': int(os.environ.get('DATABASE_POOL_MAX_SIZE', 20)),
+                    'timeout': int(os.environ.get('DATABASE_POOL_TIMEOUT', 10)),
+                },
+            }
+        return database
+
+    DATABASES = {
+        'default': _postgres(os.environ['DATABASE_URL']),
+        'replica': {
+            **_postgres(os.environ.get('DATABASE_REPLICA_URL', os.environ['DATABASE_URL'])),
+            'TEST': {
+                'MIRROR': 'default',
+            },
+        },
     }
+else:
+    # Transactions start with BEGIN IMMEDIATE so concurrent writers queue on
+    # the busy timeout instead of failing with "database is locked" when a
+    # read lock is upgraded. The trade-off: every atomic() block takes the
+    # write lock when it opens, read-only ones included (the admin's change
+    # form wraps its GET in one), and waits for other writers. The project's
+    # own atomic() blocks all write; plain reads outside atomic() never take
+    # the lock and, under WAL, run alongside the writer. Pragmas are applied
+    # per connection by inventory_management.db.configure_sqlite_connection.
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DATABASE_NAME', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 20,
+            },
+        },
+        # Read replica used for reports and list endpoints. Defaults to the same
+        # SQLite file locally; the test runner mirrors it onto the default test DB.
+        'replica': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DATABASE_REPLICA_NAME',
+                                   os.environ.get('DATABASE_NAME', BASE_DIR / 'db.sqlite3')),
+            'OPTIONS': {
+                'timeout': 20,
+            },
+            'TEST': {
+                'MIRROR': 'default',
+            },
+        },
+    }
+
+# Journal mode set on SQLite databases by `manage.py migrate`; it is stored in
+# the database file, so it is not reapplied per connection
+SQLITE_JOURNAL_MODE = 'WAL'
+
+# Pragmas applied to every new SQLite connection (none of them write the file)
+SQLITE_PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,
+    'mmap_size': 268435456,      # 256 MiB
+    'cache_size': -64000,        # 64 MiB (negative values are KiB)
+    'temp_store': 'MEMORY',
 }
 
+# Tenant shards. Every user's inventory lives on one database alias, recorded
+# in the accounts.TenantShard map; users without an entry stay on 'default',
+# which also holds the directory (users, the shard map, categories).
+# DATABASE_SHARDS=N adds the aliases shard_1..shard_N: SQLite files named by
+# DATABASE_SHARD_NAME ('{n}' is the shard number), or the comma-separated
+# DATABASE_SHARD_URLS under the postgres profile.
+DATABASE_SHARDS = int(os.environ.get('DATABASE_SHARDS', 0))
+
+for _n in range(1, DATABASE_SHARDS + 1):
+    if DATABASE_PROFILE == 'postgres':
+        DATABASES[f'shard_{_n}'] = _postgres(os.environ['DATABASE_SHARD_URLS'].split(',')[_n - 1])
+    else:
+        DATABASES[f'shard_{_n}'] = {
+            **DATABASES['default'],
+            'NAME': os.environ.get('DATABASE_SHARD_NAME', str(BASE_DIR / 'db_shard_{n}.sqlite3')).format(n=_n),
+        }
+
+SHARD_DATABASES = ['default'] + [f'shard_{n}' for n in range(1, DATABASE_SHARDS + 1)]
+
+# Shard whose inventory requests without a user (management commands) use;
+# `manage.py run_on_shards` sets it per shard
+DATABASE_SHARD = os.environ.get('DATABASE_SHARD', 'default')
+
+# Where new users are placed: 'default', a shard alias, or 'balanced' for the
+# shard with the fewest tenants
+SHARD_NEW_TENANTS = os.environ.get('SHARD_NEW_TENANTS', 'default')
+
+# Shard n allocates inventory primary keys from n * SHARD_ID_STRIDE (set by
+# `manage.py migrate_shards`), so a tenant's rows keep their ids when moved
+SHARD_ID_STRIDE = 10 ** 12
+
+DATABASE_ROUTERS = [
+    'inventory_management.sharding.ShardRouter',
+    'inventory_management.routers.ReplicaRouter',
+]
+
+REPLICA_DATABASE_ALIAS = 'replica'
+
+# Seconds after a write during which a client keeps reading from default
+REPLICA_STICKY_SECONDS = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -138,7 +258,7 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'inventory.pagination.EstimatedCountPagination',
     'PAGE_SIZE': 10,
     'DEFAULT_FILTER_BACKENDS': (
         'django_filters.rest_framework.DjangoFilterBackend',
@@ -150,6 +270,114 @@ REST_FRAMEWORK = {
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     )
 }
+# In-process NumPy availability index behind availability/ (needs numpy).
+# When disabled the endpoint answers from the database instead.
+AVAILABILITY_INDEX = {
+    'ENABLED': os.environ.get('AVAILABILITY_INDEX_ENABLED', '0') == '1',
+    'RESYNC_SECONDS': 60,
+}
+
+# Group commit for adjust_stock: concurrent adjustments of one item are queued
+# for WINDOW_MS and applied as one UPDATE plus one bulk insert (per process)
+WRITE_COALESCING = {
+    'ENABLED': os.environ.get('WRITE_COALESCING_ENABLED', '0') == '1',
+    'WINDOW_MS': 2,
+    'MAX_BATCH': 500,
+}
+
+# Cache shared by the worker processes when CACHE_URL (redis://...) is set;
+# otherwise every process has its own in-memory cache
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['CACHE_URL'],
+    } if os.environ.get('CACHE_URL') else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+# Single-flight for stock reports and store inventory lists: identical
+# concurrent requests of a user wait for the first one and share its result.
+# Across processes the leader holds a lock in CACHE for up to LOCK_TIMEOUT
+# seconds; followers poll for its result every POLL_MS
+SINGLE_FLIGHT = {
+    'ENABLED': os.environ.get('SINGLE_FLIGHT_ENABLED', '0') == '1',
+    'CACHE': 'default',
+    'LOCK_TIMEOUT': 30,
+    'POLL_MS': 20,
+}
+
+# Admission control: per process, each endpoint class runs at most
+# CONCURRENCY requests at once; up to QUEUE more wait QUEUE_TIMEOUT_MS for a
+# slot, the rest get 503 with Retry-After. Keep the sum of the CONCURRENCY
+# values within the worker's threads so every class always has some
+ADMISSION_CONTROL = {
+    'ENABLED': os.environ.get('ADMISSION_CONTROL_ENABLED', '0') == '1',
+    'CLASSES': {
+        'read': {'CONCURRENCY': 8, 'QUEUE': 16, 'QUEUE_TIMEOUT_MS': 200},
+        'write': {'CONCURRENCY': 6, 'QUEUE': 16, 'QUEUE_TIMEOUT_MS': 500},
+        'heavy': {'CONCURRENCY': 2, 'QUEUE': 2, 'QUEUE_TIMEOUT_MS': 100},
+    },
+    'RETRY_AFTER': 2,
+}
+
+# api/batch/: sub-requests accepted per batch, and threads (per process)
+# running a batch's consecutive GETs concurrently (0 runs them in order)
+BATCH_API = {
+    'MAX_REQUESTS': 20,
+    'WORKERS': int(os.environ.get('BATCH_API_WORKERS', 4)),
+}
+
+# Delta sync (api/inventory/sync/): change sequence numbers are taken before
+# commit, so the cursor handed to clients only moves past changes older than
+# SETTLE_SECONDS, which should exceed the longest write transaction. SQLite
+# writers run one at a time (BEGIN IMMEDIATE), so numbers commit in order there
+SYNC = {
+    'SETTLE_SECONDS': 30 if DATABASE_PROFILE == 'postgres' else 0,
+}
+
+# Default lifetime of a stock reservation before the sweeper releases it
+RESERVATION_TTL_SECONDS = 900
+
+# Transactional outbox delivered by `manage.py dispatch_outbox`. DESTINATIONS
+# maps a name to a webhook ({'URL': ..., 'HEADERS': {...}, 'TIMEOUT': 10}) or a
+# local JSON-lines file ({'PATH': ...}); either may set 'TOPICS' to a list of
+# topic prefixes to receive. Delivered events are archived to ARCHIVE_DIR as
+# JSON lines before deletion when it is set. SETTLE_SECONDS should exceed the
+# longest write transaction: gaps in event ids younger than that are awaited.
+OUTBOX = {
+    'DESTINATIONS': json.loads(os.environ.get('OUTBOX_DESTINATIONS', '{}')),
+    'BATCH_SIZE': 100,
+    'LEASE_SECONDS': 60,
+    'MAX_BACKOFF_SECONDS': 300,
+    'SETTLE_SECONDS': 30,
+    'ARCHIVE_DIR': os.environ.get('OUTBOX_ARCHIVE_DIR') or None,
+}
+
+# InventoryChange rows older than RETENTION_DAYS are rolled up per item and day
+# and moved to compressed month-partitioned files under DIR by
+# `manage.py archive_inventory_changes`
+CHANGE_ARCHIVE = {
+    'DIR': os.environ.get('CHANGE_ARCHIVE_DIR', BASE_DIR / 'archive'),
+    'RETENTION_DAYS': 365,
+    'BATCH_SIZE': 10000,
+}
+
+# Demand analytics (`manage.py refresh_item_analytics`): trailing window for
+# velocity and turnover, days without a sale before stock counts as dead, and
+# the cumulative value shares closing the A and B classes. Incremental runs
+# look again at movements and item saves younger than SETTLE_SECONDS, which
+# should exceed the longest write transaction (see SYNC)
+ANALYTICS = {
+    'WINDOW_DAYS': 90,
+    'DEAD_STOCK_DAYS': 90,
+    'ABC_THRESHOLDS': (0.8, 0.95),
+    'SETTLE_SECONDS': 30 if DATABASE_PROFILE == 'postgres' else 0,
+}
+
+# Rows counted exactly before large lists report an estimated total
+ESTIMATED_COUNT_THRESHOLD = 10000
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=1),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
@@ -0,0 +1,182 @@
+"""
+Tenant sharding: each user's inventory lives on one database alias.
+
+With DATABASE_SHARDS > 0 the aliases in settings.SHARD_DATABASES
+('default', 'shard_1', ...) each hold a full copy of the schema. The
+accounts.TenantShard map (on 'default') records the alias of every tenant;
+users without an entry live on 'default'. 'default' is also the directory:
+users, sessions, the shard map and the category tree are always read and
+written there, and categories are mirrored onto every shard so inventory
+queries can still join them.
+
+ShardRouter sends the models of SHARDED_APPS to the shard of
+
+    1. the alias of an enclosing `use_shard()` block
+    2. the authenticated user of the current request (looked up once per
+       request, after DRF authentication has set request.user)
+    3. settings.DATABASE_SHARD (management commands, workers)
+
+Transactions over inventory rows must be opened on the same alias:
+
+    with transaction.atomic(using=current_shard()):
+        ...
+
+Writes of a tenant that is being moved between shards are refused with
+TenantMoving (503) until the move completes.
+
+Without shards every function here answers 'default' and the router defers
+to ReplicaRouter.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.exceptions import APIException
+
+#Apps whose rows are stored on the tenant's shard
+SHARDED_APPS = {'inventory'}
+
+#Models of SHARDED_APPS shared by every tenant: written to the directory, mirrored to every shard
+DIRECTORY_MODELS = {'inventory.category'}
+
+_shard = ContextVar('shard', default=None)
+_request = ContextVar('shard_request', default=None)
+
+
+class TenantMoving(APIException):
+    """
+    Raised for writes of a tenant whose rows are being copied to another shard.
+    """
+    status_code = 503
+    default_detail = "This account is being moved. Try again shortly."
+    default_code = 'tenant_moving'
+
+
+def shard_aliases():
+    return list(getattr(settings, 'SHARD_DATABASES', [DEFAULT_DB_ALIAS]))
+
+
+def sharding_enabled():
+    return len(shard_aliases()) > 1
+
+
+def shard_of(user_id):
+    """
+    Looks up a tenant in the shard map.
+
+    Returns:
+        tuple: (alias, is_moving); ('default', False) for unmapped users
+    """
+    from accounts.models import TenantShard
+    row = (TenantShard.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id)
+           .values_list('alias', 'is_moving').first())
+    return row or (DEFAULT_DB_ALIAS, False)
+
+
+def _request_tenant(request):
+    #Cached on the request; looked up again if authentication changed the user
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return None
+    cached = getattr(request, '_tenant_shard', None)
+    if cached is None or cached[0] != user.pk:
+        cached = request._tenant_shard = (user.pk, *shard_of(user.pk))
+    return cached[1:]
+
+
+def current_shard():
+    """
+    Returns the alias holding the current tenant's inventory.
+    """
+    if not sharding_enabled():
+        return DEFAULT_DB_ALIAS
+    alias = _shard.get()
+    if alias is not None:
+        return alias
+    request = _request.get()
+    tenant = _request_tenant(request) if request is not None else None
+    if tenant is not None:
+        return tenant[0]
+    return getattr(settings, 'DATABASE_SHARD', DEFAULT_DB_ALIAS)
+
+
+@contextmanager
+def use_shard(alias):
+    """
+    Routes inventory queries in the block to `alias`, whoever the request user is.
+    """
+    token = _shard.set(alias)
+    try:
+        yield alias
+    finally:
+        _shard.reset(token)
+
+
+def _check_not_moving():
+    if _shard.get() is not None:
+        return
+    request = _request.get()
+    tenant = _request_tenant(request) if request is not None else None
+    if tenant is not None and tenant[1]:
+        raise TenantMoving()
+
+
+def _instance_shard(hints):
+    #Objects read with .using() from a shard are saved back to that shard
+    instance = hints.get('instance')
+    alias = instance._state.db if instance is not None else None
+    return alias if alias != DEFAULT_DB_ALIAS and alias in shard_aliases() else None
+
+
+class ShardRouter:
+    """
+    Routes SHARDED_APPS to the current tenant's shard.
+
+    Returns None for everything else, and for reads of tenants on
+    'default', so ReplicaRouter can still send list reads to the replica.
+    """
+    @staticmethod
+    def _sharded(model):
+        return (sharding_enabled() and model._meta.app_label in SHARDED_APPS
+                and model._meta.label_lower not in DIRECTORY_MODELS)
+
+    def db_for_read(self, model, **hints):
+        if not self._sharded(model):
+            return None
+        alias = _instance_shard(hints) or current_shard()
+        return None if alias == DEFAULT_DB_ALIAS else alias
+
+    def db_for_write(self, model, **hints):
+        if sharding_enabled() and model._meta.label_lower in DIRECTORY_MODELS:
+            return DEFAULT_DB_ALIAS
+        if not self._sharded(model):
+            return None
+        #Checked before the instance's own shard too: a moved tenant's source rows are deleted afterwards
+        _check_not_moving()
+        return _instance_shard(hints) or current_shard()
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        #Every shard carries the full schema
+        return None
+
+
+class ShardRoutingMiddleware:
+    """
+    Makes the current request visible to ShardRouter.
+
+    The user is read from the request lazily, when the first inventory query
+    is routed, so JWT users authenticated by DRF in the view are seen too.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _request.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            _request.reset(token)